@@ -1,4 +1,5 @@
 from code_breaking_utils import *
+from code_breaking_prior import *
 from enigma import *
 
 #   This is the basic Enigma brute force code breaking that runs in a single process
@@ -11,7 +12,12 @@ from enigma import *
 #   Function decrypt_cipher finds Enigma configuration based on encrypted
 #   text, crib and a partially known configuration:
 #
-#       decrypt_cipher(encrypted_text, crib, config_string, sample_size = 500)
+#       decrypt_cipher(encrypted_text, crib, config_string, sample_size = 500, prior = None, stop_score = None, cache = None)
+#
+#   With a prior (see SettingsPrior) the most likely settings are searched
+#   first and with stop_score the search stops at the first plausible solution.
+#   With a cache (see code_breaking_cache.ResultCache) the settings searched
+#   by earlier jobs are skipped and their results reused.
 #
 #
 #   Function decrypt_cipher_reflector_scrambled (special case related to my uni project
@@ -21,7 +27,8 @@ from enigma import *
 #       decrypt_cipher_reflector_scrambled(encrypted_text, crib, enigma_config)
 #
 
-def decrypt_cipher(encrypted_text, crib, config_string, sample_size = 500):
+def decrypt_cipher(encrypted_text, crib, config_string, sample_size = 500, prior = None, stop_score = None,
+                   cache = None):
     """Attempt to break Enigma cypher with a known crib and partially known config
 
     Example input:
@@ -37,14 +44,18 @@ def decrypt_cipher(encrypted_text, crib, config_string, sample_size = 500):
     After all possible Enigma settings are constructed each setting is tried on a crib
     until such Enigma setting is found that the complete crib matches the encoded text.
     Such Enigma setting is put on a list of possible candidates along with the decrypted
-    text. A human must then go through this list to decide if any of the potential settings
-    are correct.
+    text, the most plausible text first (see plausibility()). A human must then go through
+    this list to decide if any of the potential settings are correct.
 
     :param encrypted_text:
     :param crib:
     :param config_string:
     :param sample_size: size of the sample to predict remaining time from
-    :return:
+    :param prior: SettingsPrior to search the most likely settings first
+    :param stop_score: stop once a solution is at least this plausible (see
+                       PLAUSIBLE_SCORE), None to search everything
+    :param cache: ResultCache of earlier jobs (see code_breaking_cache)
+    :return: RankedResults, time
     """
     time_start = time.time()
 
@@ -52,6 +63,9 @@ def decrypt_cipher(encrypted_text, crib, config_string, sample_size = 500):
         raise ValueError('Expected some code to break.')
     if not crib:
         raise ValueError('Expected a crib.')
+    if prior is not None or stop_score is not None or cache is not None:
+        return (decrypt_cipher_best_first(encrypted_text, crib, config_string, prior, stop_score, cache=cache),
+                time.time() - time_start)
 
     # Construct all possible Enigma settings based on unknown / partially known
     # Enigma configuration provided:
@@ -77,6 +91,43 @@ def decrypt_cipher(encrypted_text, crib, config_string, sample_size = 500):
 
     return result, time.time() - time_start
 
+def decrypt_cipher_best_first(encrypted_text, crib, config_string, prior = None, stop_score = None, chunk_size = 500,
+                              cache = None):
+    """Search ranges of the settings in the order of the prior (see
+    prior_work_units()) until a solution is at least stop_score plausible
+
+    :param encrypted_text:
+    :param crib:
+    :param config_string:
+    :param prior: SettingsPrior or None for the natural order
+    :param stop_score: plausibility() to stop at or None to search everything
+    :param chunk_size: number of settings searched between the checks
+    :param cache: ResultCache of earlier jobs, the ranges searched are added to it
+    :return: RankedResults
+    """
+
+    if prior is not None:
+        config_string = prior_config_string(config_string, prior)
+    crib_positions = possible_crib_positions(encrypted_text, crib)
+    total = count_settings(config_string) * len(crib_positions)
+    print("\nRunning a single process to find solutions, most likely settings first.")
+    print("{0} settings to search".format(total))
+
+    known = cache.lookup(encrypted_text, crib, config_string) if cache is not None else None
+    results = known.results if known is not None else RankedResults()
+    searched = []
+    for start, stop in prior_work_units(config_string, len(crib_positions), prior, chunk_size):
+        for part in (known.missing(start, stop) if known is not None else [(start, stop)]):
+            results.merge(check_enigma_config_range(encrypted_text, crib, config_string, *part))
+            searched.append(part)
+        if stop_score is not None and results and -results.scores[0] >= stop_score:
+            print("Plausible solution found after {0} of {1} settings.".format(
+                sum(stop - start for start, stop in searched), total))
+            break
+    if cache is not None:
+        cache.store(encrypted_text, crib, config_string, searched, results)
+    return results
+
 
 # ------------------------------------------------------------------------
 #           Scrambled Reflector Case
@@ -108,9 +159,10 @@ def decrypt_cipher_reflector_scrambled(encrypted_text, crib, enigma_config):
     permutations were constructed in docstring here:
         permutate_reflector_by_wire_swap()
 
-    Every Enigma setting with every possible reflector permutation will be tried
-    until the encoded crib matches the encoded text. Such Enigma setting is put
-    on a list of possible candidates along with the decrypted text. A human must
+    Every Enigma setting is tried with all the reflector permutations at once
+    (see check_reflector_variants()). Such Enigma settings that encode the crib
+    correctly are put on a list of possible candidates along with the decrypted
+    text and the reflector wiring, the most plausible text first. A human must
     then go through this list to decide if any of the potential settings are
     correct.
 
@@ -123,29 +175,54 @@ def decrypt_cipher_reflector_scrambled(encrypted_text, crib, enigma_config):
 
     crib_positions = possible_crib_positions(encrypted_text, crib)
     enigma_configs = all_possible_settings(enigma_config)
+    wirings = len(reflector_variants(Rotor.supported_rotors['B']))
 
     print("\nRunning a single process to find solutions")
     print("\nReflector has two wires swapped.")
-    print("{0} settings (4290 reflector wirings) to search".format(len(enigma_configs) * 4290 * len(crib_positions)))
-
-    potential_configs = []
-    for cnf in enigma_configs:
-        enigma_instance = Enigma(cnf)
-        l = permutate_reflector_by_wire_swap("".join(enigma_instance.rotors[-1].left_pins), 2)
-        #print("Checking enigma config={0} with {1} reflector wirings".format(enigma_instance.print_state(), len(l)))
-        for pos in crib_positions:
-            for reflector_option in l:
-                enigma_instance = Enigma(cnf)
-                # Replace standard reflector with a hacked one:
-                enigma_instance.rotors[-1].left_pins = reflector_option
-                enigma_instance.rotate_n_steps(pos)
-                potential_config = True
-                for inx in range(len(crib)):
-                    if enigma_instance.encode_character(crib[inx]) != encrypted_text[pos + inx]:
-                        potential_config = False
-                        break
-                if potential_config:
-                    e = Enigma(cnf)
-                    e.rotors[-1].left_pins = reflector_option
-                    potential_configs.append((str(cnf), e.encode_string(encrypted_text), reflector_option))
-    return potential_configs, time.time() - time_start
\ No newline at end of file
+    print("{0} settings ({1} reflector wirings) to search".format(len(enigma_configs) * wirings * len(crib_positions),
+                                                              wirings))
+
+    # all the wirings are tested at once for every rotor state:
+    potential_configs = check_reflector_variants(encrypted_text, crib, enigma_configs)
+    return potential_configs, time.time() - time_start
+
+def decrypt_cipher_reflector_rewired(encrypted_text, crib, enigma_config, num_swaps = None):
+    """Attempt to break Enigma cypher with a known crib and a rewired reflector,
+    either with any number of swapped wires or completely unknown (like the
+    field rewirable reflector UKW-D)
+
+    Example input:
+       encrypted_text:
+       HWREISXLGTTBYVXRCWWJAKZDTVZWKBDJPVQYNEQIOTIFX
+       cribs: INSTAGRAM
+       enigma_config
+       "? V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT"
+       num_swaps: 3
+
+    At every rotor state the crib tells which contacts the reflector must wire
+    (see reflector_constraints()), rotor states the crib contradicts are
+    skipped and only the reflector wirings with these wires are generated one
+    by one (see reflector_rewirings()). A completely unknown reflector
+    (num_swaps None) is only as known as the crib tells, the solutions have
+    question marks for the unknown contacts and the letters passing them.
+
+    :param encrypted_text:
+    :param crib:
+    :param enigma_config:
+    :param num_swaps: number of swapped wires of the reflector or None
+    :return:
+    """
+    time_start = time.time()
+
+    crib_positions = possible_crib_positions(encrypted_text, crib)
+    enigma_configs = all_possible_settings(enigma_config)
+
+    print("\nRunning a single process to find solutions")
+    if num_swaps is None:
+        print("\nReflector wiring is unknown.")
+    else:
+        print("\nReflector has {0} wires swapped.".format(num_swaps))
+    print("{0} rotor states to search".format(len(enigma_configs) * len(crib_positions)))
+
+    potential_configs = check_reflector_rewirings(encrypted_text, crib, enigma_configs, num_swaps)
+    return potential_configs, time.time() - time_start
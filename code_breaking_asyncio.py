@@ -0,0 +1,345 @@
+import asyncio                  # event loop serving all the client connections
+import hashlib                  # authentication of the clients
+import hmac
+import os
+from code_breaking_distributed import *
+
+#   Distributed Enigma code breaking over plain TCP with asyncio
+#
+#   This is an alternative transport to the multiprocessing manager used by
+#   code_breaking_distributed. A single event loop serves all the client
+#   connections and every client has its own stream of length prefixed
+#   frames (see code_breaking_protocol) instead of synchronous round-trips
+#   to shared queues. Clients ask for work in advance (WorkRequest) so the
+#   next work units are already on their way while the current ones are
+#   being checked. Work units, the Coordinator and the client's worker
+#   processes are the same as with the manager transport.
+#
+#   Quick start (same as the manager transport with --transport asyncio):
+#       python3 enigma-cli.py --module distributed --component client --transport asyncio --serverip 192.168.0.229
+#       python3 enigma-cli.py --module distributed --component server --transport asyncio
+#
+#   Server part
+#       run_async_server(encrypted_text, crib, config_string, chunk_size = 50, host = '', port = PORTNUM, authkey = AUTHKEY)
+#       AsyncCoordinatorServer(coordinator, authkey = AUTHKEY, repeat = False)
+#
+#   Client part
+#       run_async_client(srv_ip, port = PORTNUM, authkey = AUTHKEY, sample = 1000, cpus = 0)
+
+MAX_FRAME = 16 * 1024 * 1024    # largest frame accepted from the other side
+MAX_AUTH_FRAME = 1024           # largest frame accepted before authentication
+MAX_CREDITS = 10000             # most work units a client may ask for in advance
+SERVER_NODE = 'coordinator'     # sender name in frames of the server
+
+
+async def read_frame(reader, max_size = MAX_FRAME):
+    """Read a length prefixed frame, returns None at the end of the stream
+    and raises ValueError for a frame larger than max_size"""
+
+    try:
+        header = await reader.readexactly(FRAME_LENGTH.size)
+        length, = FRAME_LENGTH.unpack(header)
+        if length > max_size:
+            raise ValueError("Frame of {0} bytes is too large".format(length))
+        return await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+def write_frame(writer, node, messages):
+    """Write messages as a length prefixed frame (call drain() afterwards)"""
+
+    frame = encode_frame(node, messages)
+    writer.write(FRAME_LENGTH.pack(len(frame)) + frame)
+
+def authentication_digest(authkey, nonce):
+    return hmac.new(authkey, nonce.encode(), hashlib.sha256).hexdigest()
+
+class AsyncCoordinatorServer:
+    """Serves work units of a Coordinator to clients connected over TCP
+
+    Every connection has a number of credits, the work units its client has
+    asked for and not received yet. Work units are only sent against credits
+    and every connection waits for its own socket buffer to drain, so a slow
+    client never holds up the others or the server's memory. Connections
+    with credits left over when there is no work are served as soon as new
+    work is available. The work units sent to a connection that closes or
+    stays silent for CLIENT_TIMEOUT seconds are handed out again.
+    """
+
+    def __init__(self, coordinator, authkey = AUTHKEY, repeat = False):
+        """
+        :param coordinator: Coordinator with the jobs to share
+        :param authkey: shared secret of the server and the clients
+        :param repeat: submit every finished job again with the same settings
+        """
+
+        self.coordinator = coordinator
+        self.estimator = ProgressEstimator()
+        self.authkey = authkey
+        self.repeat = repeat
+        self.credits = {}       # StreamWriter => number of work units requested
+        self.last_seen = {}     # StreamWriter => time of the last frame received
+        self.reported = set()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            if await self.authenticate(reader, writer):
+                await self.serve_client(reader, writer)
+        except FRAME_ERRORS + (ConnectionError,):
+            # a malformed or too large frame, or the client went away
+            pass
+        finally:
+            writer.close()
+
+    async def authenticate(self, reader, writer):
+        """Challenge the client to prove it knows the authkey, only a tiny
+        frame is read from a client not authenticated yet"""
+
+        nonce = os.urandom(16).hex()
+        write_frame(writer, SERVER_NODE, [Challenge(nonce)])
+        await writer.drain()
+        frame = await read_frame(reader, MAX_AUTH_FRAME)
+        node, messages = decode_frame(frame) if frame else (None, [])
+        return (len(messages) == 1 and type(messages[0]) is Response
+                and hmac.compare_digest(messages[0].digest.encode(),
+                                        authentication_digest(self.authkey, nonce).encode()))
+
+    async def serve_client(self, reader, writer):
+        """Handle the frames of an authenticated client until it disconnects"""
+
+        self.credits[writer] = 0
+        self.last_seen[writer] = time.time()
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                self.last_seen[writer] = time.time()
+                node, messages = decode_frame(frame)
+                # work units are tracked per connection, a host may run many clients:
+                handle_client_messages(node, messages, self.coordinator, self.estimator, client=writer)
+                for message in messages:
+                    if type(message) is WorkRequest:
+                        self.credits[writer] = min(MAX_CREDITS, self.credits[writer] + message.count)
+                await self.dispatch(writer)
+        finally:
+            self.credits.pop(writer, None)
+            self.last_seen.pop(writer, None)
+            self.coordinator.client_lost(writer)
+
+    async def dispatch(self, writer):
+        """Send work units to a connection for all its credits"""
+
+        units = []
+        while self.credits.get(writer, 0) > len(units):
+            unit = self.coordinator.next_work_unit(writer)
+            if unit is None:
+                break
+            units.append(WorkUnit(*unit))
+        if units:
+            self.credits[writer] -= len(units)
+            write_frame(writer, SERVER_NODE, units)
+            # backpressure: wait until this client's socket buffer drains
+            await writer.drain()
+
+    async def dispatch_waiting(self):
+        """Serve connections left with credits when there was no work"""
+
+        for writer in [w for w, credits in self.credits.items() if credits]:
+            try:
+                await self.dispatch(writer)
+            except ConnectionError:
+                self.credits.pop(writer, None)
+
+    def close_silent_connections(self):
+        """Close connections not heard from for CLIENT_TIMEOUT seconds, their
+        work units are handed out again when handle_connection() returns"""
+
+        now = time.time()
+        for writer in [w for w, seen in self.last_seen.items() if now - seen >= CLIENT_TIMEOUT]:
+            self.last_seen.pop(writer)
+            writer.close()
+
+    def report_finished_jobs(self):
+        """Print results of jobs that finished since the last call"""
+
+        for job_id, job_status in self.coordinator.status().items():
+            if job_status["finished"] and job_id not in self.reported:
+                print("\nJob {0} finished in {1} seconds".format(job_id, round(job_status["time"])))
+                print_results(job_status["results"])
+                self.reported.add(job_id)
+                if self.repeat:
+                    job = self.coordinator.jobs[job_id]
+                    self.coordinator.submit(job.encrypted_text, job.crib, job.config_string, job.priority,
+                                            prior=job.prior, stop_score=job.stop_score)
+
+    def all_finished(self):
+        return all(job["finished"] for job in self.coordinator.status().values())
+
+    async def serve(self, host = '', port = PORTNUM, stop_when_finished = True, started = None):
+        """Accept clients and share the work until all jobs are finished
+        (or forever if stop_when_finished is False)
+
+        :param started: optional callback receiving the port the server listens on
+        """
+
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        port = server.sockets[0].getsockname()[1]
+        print('\nAsyncio server started at {0}:{1}'.format(host or socket.gethostbyname(socket.gethostname()), port))
+        if started:
+            started(port)
+        last_report = time.time()
+        async with server:
+            while not (stop_when_finished and self.all_finished()):
+                await asyncio.sleep(PRODUCER_POLL)
+                self.close_silent_connections()
+                await self.dispatch_waiting()
+                self.report_finished_jobs()
+                if time.time() - last_report >= REPORT_INTERVAL:
+                    last_report = time.time()
+                    print_progress(self.coordinator, self.estimator)
+            # tell the clients there is no more work:
+            for writer in list(self.credits):
+                try:
+                    write_frame(writer, SERVER_NODE, [Shutdown()])
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+                writer.close()
+
+def run_async_server(encrypted_text, crib, config_string, chunk_size = 50, host = '', port = PORTNUM,
+                     authkey = AUTHKEY, started = None):
+    """Share a code breaking job amongst clients connected over TCP (see
+    runserver() for the manager transport)
+
+    :return: results, time
+    """
+
+    coordinator = Coordinator(chunk_size)
+    job = coordinator.jobs[coordinator.submit(encrypted_text, crib, config_string)]
+    print("{0} settings in chunks of {1} to distribute amongst clients".format(job.total_count, chunk_size))
+    server = AsyncCoordinatorServer(coordinator, authkey)
+    server.reported.add(job.job_id)
+    asyncio.run(server.serve(host, port, started=started))
+    return job.results, job.elapsed_time()
+
+def run_async_coordinator(jobs, chunk_size = 50, host = '', port = PORTNUM, authkey = AUTHKEY, repeat = False):
+    """Share jobs (encrypted text, crib, settings[, priority]) amongst clients
+    connected over TCP until interrupted with Ctrl+C"""
+
+    coordinator = Coordinator(chunk_size)
+    for job in jobs:
+        coordinator.submit(*job)
+    try:
+        asyncio.run(AsyncCoordinatorServer(coordinator, authkey, repeat).serve(host, port, stop_when_finished=False))
+    except KeyboardInterrupt:
+        pass
+
+# ------------------------------------------------------------------------
+# -----------------------   client part
+# ------------------------------------------------------------------------
+
+async def _run_async_client(srv_ip, port, authkey, sample, cpu_cores):
+    reader, writer = await asyncio.open_connection(srv_ip, port)
+    frame = await read_frame(reader)
+    node, messages = decode_frame(frame) if frame else (None, [])
+    if not messages or type(messages[0]) is not Challenge:
+        raise ConnectionError("Unexpected greeting from the server")
+    write_frame(writer, client_name(), [Response(authentication_digest(authkey, messages[0].nonce))])
+    await writer.drain()
+    print("Connected. Using {0} cpu cores".format(cpu_cores))
+
+    local_job_q = mp.Queue()
+    local_result_q = mp.Queue()
+    # until the speed of this client is known buffer two chunks per core:
+    prefetch = {"buffered": 0, "target": 2 * cpu_cores, "condition": threading.Condition()}
+    procs = []
+    for i in range(cpu_cores):
+        p = mp.Process(target=mp_check_enigma_config, args=(local_job_q, local_result_q), daemon=True)
+        procs.append(p)
+        p.start()
+
+    # results of the workers are collected in a thread (as with the manager
+    # transport) and their frames handed over to the event loop:
+    loop = asyncio.get_running_loop()
+    outgoing = asyncio.Queue()
+    send = lambda frame: loop.call_soon_threadsafe(outgoing.put_nowait, frame)
+    collector = threading.Thread(target=send_worker_results,
+                                 args=(local_result_q, send, prefetch, cpu_cores, sample),
+                                 daemon=True)
+    collector.start()
+
+    async def send_frames():
+        while True:
+            frame = await outgoing.get()
+            if frame is None:
+                return
+            writer.write(FRAME_LENGTH.pack(len(frame)) + frame)
+            await writer.drain()
+
+    async def request_work(requested):
+        # keep asking for enough work units to fill the prefetch buffer
+        while True:
+            with prefetch["condition"]:
+                missing = prefetch["target"] - prefetch["buffered"] - requested[0]
+            if missing > 0:
+                requested[0] += missing
+                outgoing.put_nowait(encode_frame(client_name(), [WorkRequest(missing)]))
+            await asyncio.sleep(PRODUCER_POLL)
+
+    requested = [0]
+    sender = asyncio.create_task(send_frames())
+    requester = asyncio.create_task(request_work(requested))
+    try:
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                break
+            node, messages = decode_frame(frame)
+            units = [tuple(m) for m in messages if type(m) is WorkUnit]
+            for unit in units:
+                local_job_q.put(unit)
+            with prefetch["condition"]:
+                prefetch["buffered"] += len(units)
+            requested[0] -= len(units)
+            if any(type(m) is Shutdown for m in messages):
+                break
+    finally:
+        requester.cancel()
+        # no more work, let the workers finish and report their results
+        local_job_q.put(None)
+        await loop.run_in_executor(None, collector.join)
+        outgoing.put_nowait(None)
+        try:
+            await sender
+        except ConnectionError:
+            pass
+        writer.close()
+        for p in procs:
+            p.join()
+
+def run_async_client(srv_ip, port = PORTNUM, authkey = AUTHKEY, sample = 1000, cpus = 0):
+    """Waits for the asyncio server to come online. Then runs a number of
+    processes checking the work units the server sends
+
+    :param srv_ip:  string IP of the server e.g. "192.168.0.229"
+    :param port:    port of the server
+    :param authkey: shared secret of the server and the clients
+    :param sample:  sample: # number of Enigma settings to make time estimate on
+    :param cpus:    number of cores / processes to use. 0 = all
+    :return:
+    """
+
+    cpu_cores = mp.cpu_count()
+    if(cpus > 0):
+        # limit number of CPU cores to use
+        cpu_cores = cpus
+    print("Waiting for {0} to give me a job ...".format(srv_ip))
+    while True:
+        try:
+            asyncio.run(_run_async_client(srv_ip, port, authkey, sample, cpu_cores))
+            return
+        except (ConnectionRefusedError, OSError) as e:
+            if not isinstance(e, ConnectionRefusedError) and e.errno not in (None, 111):
+                raise
+            time.sleep(0.300)
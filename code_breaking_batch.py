@@ -0,0 +1,219 @@
+from code_breaking_utils import *
+from code_breaking_prior import SettingsPrior, PLAUSIBLE_SCORE
+from code_breaking import decrypt_cipher_best_first
+from code_breaking_multiproc import search_in_pool
+from code_breaking_cache import ResultCache
+import sys
+import json                     # job files and results
+import contextlib               # progress goes to stderr, results to stdout
+import multiprocessing as mp    # pools kept warm between the jobs
+from multiprocessing.pool import ThreadPool
+
+#   Unattended code breaking jobs
+#
+#   A job file (JSON or TOML) lists code breaking jobs run back to back
+#   without any prompt. Settings in "defaults" apply to every job, a job may
+#   override any of them:
+#
+#       {"defaults": {"backend": "multiproc", "processes": 0, "chunk_size": 50,
+#                     "stop_score": "plausible", "cache": false, "top": 3},
+#        "output": "results.jsonl",
+#        "jobs": [{"name": "demo", "encrypted_text": "ABSKJ...", "crib": "THOUSANDS",
+#                  "settings": "C II-Gamma-IV [8,20,24]-8-20 E-M-Y FH-TS-BE-UQ-KD-AL",
+#                  "prior": {"history": ["C II-Gamma-IV 24-8-20 A-A-A"]}}]}
+#
+#   or the same in TOML with a [defaults] table and [[jobs]] tables.
+#
+#   Backends:
+#       single      one process (see decrypt_cipher_best_first())
+#       multiproc   a pool of processes (see search_in_pool())
+#       threads     a pool of threads sharing the compiled tables
+#       cluster     submitted to a running coordinator at "server" (see
+#                   runcoordinator()), all the jobs are submitted at once
+#                   and reported as failed after "timeout" seconds
+#
+#   Pools are started once for all the jobs with the same backend and number
+#   of processes. A JSON line is written for every job and a summary line
+#   with the timing of all of them at the end:
+#
+#       jobs, output = load_jobs(path)
+#       summary = run_batch(jobs, output = sys.stdout)
+#
+#       {"name": "demo", "backend": "multiproc", "seconds": 1.2, "solutions": [[score, settings, text], ...], ...}
+#       {"summary": {"jobs": 1, "failed": 0, "seconds": 1.2, "backends": {"multiproc": 1.2}}}
+#
+
+BATCH_BACKENDS = ("single", "multiproc", "threads", "cluster")
+BATCH_DEFAULTS = {"backend": "multiproc",
+                  "processes": 0,           # 0 = one per CPU core
+                  "chunk_size": 50,
+                  "stop_score": None,       # a plausibility(), "plausible" or None to search everything
+                  "prior": None,            # arguments of SettingsPrior
+                  "cache": False,           # reuse earlier jobs (see code_breaking_cache)
+                  "priority": 1,            # share of the cluster
+                  "server": "127.0.0.1",    # coordinator of the cluster
+                  "timeout": 3600,          # seconds a cluster job may take, None to wait for it
+                  "top": TOP_RESULTS}       # number of solutions written
+
+
+def load_jobs(path):
+    """Read a job file
+
+    :param path: .json or .toml file
+    :return: (list of job dictionaries with the defaults applied, output file or None)
+    """
+
+    if path.endswith(".toml"):
+        import tomllib          # Python 3.11+
+        with open(path, "rb") as job_file:
+            batch = tomllib.load(job_file)
+    else:
+        with open(path) as job_file:
+            batch = json.load(job_file)
+    return expand_jobs(batch), batch.get("output")
+
+def expand_jobs(batch):
+    """Return the jobs of a batch with the defaults applied and checked
+
+    :param batch: dictionary with "jobs" and optionally "defaults"
+    :return: list of job dictionaries
+    """
+
+    defaults = dict(BATCH_DEFAULTS, **batch.get("defaults", {}))
+    jobs = []
+    for number, job in enumerate(batch.get("jobs", ())):
+        job = dict(defaults, **job)
+        job.setdefault("name", str(number + 1))
+        unknown = set(job) - set(BATCH_DEFAULTS) - {"name", "encrypted_text", "crib", "settings"}
+        if unknown:
+            raise ValueError("Job {0}: unknown settings {1}".format(job["name"], ", ".join(sorted(unknown))))
+        if not all(job.get(key) for key in ("encrypted_text", "crib", "settings")):
+            raise ValueError("Job {0}: expected encrypted_text, crib and settings".format(job["name"]))
+        if job["backend"] not in BATCH_BACKENDS:
+            raise ValueError("Job {0}: backend should be one of {1}".format(job["name"], ", ".join(BATCH_BACKENDS)))
+        if job["stop_score"] == "plausible":
+            job["stop_score"] = PLAUSIBLE_SCORE
+        jobs.append(job)
+    if not jobs:
+        raise ValueError("Expected some jobs.")
+    return jobs
+
+def _ranked(results, first = 0):
+    """Return (score, settings, text) of the RankedResults of any code breaker
+
+    :param first: index of the settings in a result, results of a coordinator
+                  start with the hostname of the client that found them
+    """
+
+    return ([(score,) + tuple(result[first:first + 2]) for score, result in results.ranked()],
+            results.discarded)
+
+class BatchRunner:
+    """Runs jobs in pools kept warm between them"""
+
+    def __init__(self):
+        self.pools = {}
+        self.cores = {}         # tables of the wheels shared by the threads
+        self.cache = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.terminate()
+        self.pools.clear()
+
+    def pool(self, backend, processes):
+        """Return a pool of processes or threads, started on first use"""
+
+        processes = processes or mp.cpu_count()
+        if (backend, processes) not in self.pools:
+            self.pools[(backend, processes)] = mp.Pool(processes) if backend == "multiproc" else ThreadPool(processes)
+        return self.pools[(backend, processes)]
+
+    def run(self, job):
+        """Run a job in one process or a pool
+
+        :param job: job dictionary (see expand_jobs())
+        :return: RankedResults
+        """
+
+        prior = SettingsPrior(**job["prior"]) if job["prior"] else None
+        cache = None
+        if job["cache"]:
+            self.cache = self.cache or ResultCache()
+            cache = self.cache
+        args = (job["encrypted_text"], job["crib"], job["settings"])
+        if job["backend"] == "single":
+            return decrypt_cipher_best_first(*args, prior, job["stop_score"], job["chunk_size"], cache)
+        return search_in_pool(self.pool(job["backend"], job["processes"]), *args, job["chunk_size"], prior,
+                              job["stop_score"], cores=self.cores if job["backend"] == "threads" else None,
+                              cache=cache)
+
+def run_batch(jobs, output = None):
+    """Run code breaking jobs back to back and write their results
+
+    :param jobs: list of job dictionaries (see expand_jobs())
+    :param output: file object for the JSON lines, None for stdout
+    :return: summary dictionary
+    """
+
+    output = output or sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return _run_batch(jobs, output)
+
+def _run_batch(jobs, output):
+    time_start = time.time()
+    summary = {"jobs": len(jobs), "failed": 0, "seconds": 0, "backends": {}}
+
+    # a cluster searches while the other jobs run:
+    submitted = {}
+    for number, job in enumerate(jobs):
+        if job["backend"] == "cluster":
+            # the manager and socket code is only loaded for a cluster:
+            from code_breaking_distributed import submit_job
+            try:
+                prior = SettingsPrior(**job["prior"]) if job["prior"] else None
+                submitted[number] = (submit_job(job["server"], job["encrypted_text"], job["crib"], job["settings"],
+                                                job["priority"], prior, job["stop_score"]), time.time())
+            except Exception as e:
+                # e.g. the coordinator is down, reported with the job below
+                submitted[number] = e
+
+    with BatchRunner() as runner:
+        for number, job in enumerate(jobs):
+            line = {"name": job["name"], "backend": job["backend"], "settings": job["settings"]}
+            job_start = time.time()
+            try:
+                if job["backend"] == "cluster":
+                    from code_breaking_distributed import wait_for_job
+                    if isinstance(submitted[number], Exception):
+                        raise submitted[number]
+                    job_id, job_start = submitted[number]
+                    timeout = job["timeout"]
+                    if timeout is not None:
+                        # the job has been searching since it was submitted:
+                        timeout = max(0, timeout - (time.time() - job_start))
+                    solutions, discarded = _ranked(wait_for_job(job["server"], job_id, timeout=timeout)[0], 1)
+                else:
+                    solutions, discarded = _ranked(runner.run(job))
+                line["solutions"] = [list(solution) for solution in solutions[:job["top"]]]
+                line["discarded"] = discarded + max(0, len(solutions) - job["top"])
+            except Exception as e:
+                # an unattended run reports a broken job and goes on with the next one
+                line["error"] = "{0}: {1}".format(type(e).__name__, e)
+                summary["failed"] += 1
+            line["seconds"] = round(time.time() - job_start, 3)
+            backends = summary["backends"]
+            backends[job["backend"]] = round(backends.get(job["backend"], 0) + line["seconds"], 3)
+            output.write(json.dumps(line) + "\n")
+            output.flush()
+
+    summary["seconds"] = round(time.time() - time_start, 3)
+    output.write(json.dumps({"summary": summary}) + "\n")
+    output.flush()
+    return summary
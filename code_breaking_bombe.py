@@ -0,0 +1,279 @@
+from code_breaking_utils import *
+
+#   Turing-Welchman Bombe: Enigma code breaking without trying plugboards
+#
+#   The brute force code breakers try every plugboard a partially known
+#   config allows, each unknown lead (e.g. ?S) multiplies the search by 25
+#   and a completely unknown plugboard is out of reach. A Bombe only tries
+#   the rotor settings. The crib and the encrypted text under it make a menu,
+#   a graph of letters connected by the rotor permutation of every position
+#   of the crib. For every rotor setting a guess of the plug of one letter
+#   (A is plugged to X) is followed through the menu: if A is plugged to X
+#   and A is encrypted to E at step i then E must be plugged to the letter
+#   the rotors encrypt X to at step i. A guess leading to a letter plugged to
+#   two letters (or to one not allowed by the config) is wrong, as is every
+#   other guess that turned up on the way. Rotor settings without a
+#   consistent guess are rejected, the others (stops) come with the plugs of
+#   all the letters of the menu.
+#
+#   Use the CLI to try the Bombe:
+#       python3 enigma-cli.py --module interactive
+#   Select 2 for code breaking, then 1 for predefined demo job,
+#   then 4 for the Bombe
+#
+#   The plugboard of the config string can be given as for the brute force
+#   code breakers (see all_enigma_settings_candidates()) and additionally
+#   a lead of a single question mark means any number of unknown leads,
+#   e.g. a completely unknown plugboard:
+#       'B Beta-I-III 23-2-10 ?-M-G ?'
+#   or a few known and other unknown leads:
+#       'B Beta-I-III 23-2-10 ?-M-G VH-PT-?'
+#
+#       decrypt_cipher_bombe(encrypted_text, crib, config_string)
+#       check_bombe_range(encrypted_text, crib, config_string, start, stop)
+#
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+ALL_LETTERS = (1 << 26) - 1     # bitset of all the letters
+
+
+def bombe_rotor_settings(config_string):
+    """Return the config string without the plugboard"""
+
+    return " ".join(config_string.split()[:4])
+
+def bombe_plugboard_constraints(config_string):
+    """Split the plugboard of a config string into a flag whether unknown
+    leads are allowed (a "?" lead) and the options of every other lead
+    (see all_enigma_settings_candidates())
+
+    :param config_string: An Enigma config string with marked unknown settings
+    :return: unknown leads allowed, list of lists of leads
+    """
+
+    config_parts = config_string.split()
+    leads = config_parts[4].split('-') if len(config_parts) > 4 else []
+    unknown = "?" in leads
+    leads = [lead for lead in leads if lead != "?"]
+    if not leads:
+        return unknown, []
+    return unknown, all_enigma_settings_candidates(" ".join(config_parts[:4] + ["-".join(leads)]))["plugboard"]
+
+def allowed_steckers(unknown, lead_options):
+    """Return a bitset for every letter of the letters it may be plugged to
+
+    Unplugged letters are plugged to themselves. If unknown leads are allowed
+    any letter may be plugged to any letter not taken by a known lead,
+    otherwise only to the letters of the leads of the config.
+    """
+
+    if unknown:
+        allowed = [ALL_LETTERS] * 26
+    else:
+        allowed = [1 << letter for letter in range(26)]
+    for options in lead_options:
+        plugged = ALL_LETTERS   # letters plugged by every option of the lead
+        for option in options:
+            a, b = ALPHABET.index(option[0]), ALPHABET.index(option[1])
+            allowed[a] |= 1 << b
+            allowed[b] |= 1 << a
+            plugged &= (1 << a) | (1 << b)
+        for letter in range(26):
+            if plugged >> letter & 1:
+                allowed[letter] &= ~(1 << letter)
+    # letters of known leads cannot be plugged to anything else:
+    for options in lead_options:
+        if len(options) == 1:
+            a, b = ALPHABET.index(options[0][0]), ALPHABET.index(options[0][1])
+            for letter in range(26):
+                allowed[letter] &= ~((1 << a) | (1 << b))
+            allowed[a] = 1 << b
+            allowed[b] = 1 << a
+    return allowed
+
+def crib_menu(crib, encrypted_crib, perms):
+    """Build the menu of a crib
+
+    :param crib:
+    :param encrypted_crib: the encrypted text under the crib
+    :param perms: rotor permutations of every position of the crib
+                  (see Enigma.scrambler_permutations())
+    :return: for every letter a list of (letter, permutation) it connects to
+    """
+
+    menu = [[] for letter in range(26)]
+    for plain, cipher, perm in zip(crib, encrypted_crib, perms):
+        p, c = ALPHABET.index(plain), ALPHABET.index(cipher)
+        menu[p].append((c, perm))
+        menu[c].append((p, perm))
+    return menu
+
+def menu_order(crib, encrypted_crib):
+    """Return letters of the menu, the most connected first"""
+
+    connections = {}
+    for letter in crib + encrypted_crib:
+        connections[ALPHABET.index(letter)] = connections.get(ALPHABET.index(letter), 0) + 1
+    return sorted(connections, key=lambda letter: -connections[letter])
+
+def bombe_closure(menu, allowed, steckers, test, guess):
+    """Follow the guess that test letter is plugged to guess through the menu
+
+    :param menu: see crib_menu()
+    :param allowed: see allowed_steckers()
+    :param steckers: letter each letter is plugged to so far (-1 unknown)
+    :param test: letter
+    :param guess: letter
+    :return: steckers with the deductions or None if the guess is wrong,
+             bitset of letters the test letter was found to be plugged to
+    """
+
+    steckers = list(steckers)
+    tested = 0
+    stack = [(test, guess)]
+    while stack:
+        letter, plug = stack.pop()
+        if letter == test:
+            tested |= 1 << plug
+        if steckers[letter] == plug:
+            continue
+        if steckers[letter] >= 0 or not allowed[letter] >> plug & 1:
+            # plugged twice or not allowed by the config
+            return None, tested
+        steckers[letter] = plug
+        stack.append((plug, letter))
+        for connected, perm in menu[letter]:
+            stack.append((connected, perm[plug]))
+    return steckers, tested
+
+def bombe_stops(menu, allowed, order, steckers=None):
+    """Yield every consistent plugging of all the letters of the menu
+
+    :param menu: see crib_menu()
+    :param allowed: see allowed_steckers()
+    :param order: letters of the menu to test (see menu_order())
+    :param steckers: letter each letter is plugged to so far (-1 unknown)
+    :return: generator of lists of the letter each letter is plugged to (-1 unknown)
+    """
+
+    if steckers is None:
+        steckers = [-1] * 26
+    test = next((letter for letter in order if steckers[letter] < 0), None)
+    if test is None:
+        yield steckers
+        return
+    # every guess turning up in the closure of a wrong guess is also wrong:
+    wrong = ~allowed[test]
+    for guess in range(26):
+        if wrong >> guess & 1:
+            continue
+        deduced, tested = bombe_closure(menu, allowed, steckers, test, guess)
+        if deduced is None:
+            wrong |= tested
+        else:
+            yield from bombe_stops(menu, allowed, order, deduced)
+
+def complete_plugboard(steckers, unknown, lead_options):
+    """Yield plugboards matching a stop and the leads of the config
+
+    Leads of the config not deduced by the Bombe are tried with all their
+    options (like the brute force code breakers do). Deduced leads that are
+    not part of the config are only kept if unknown leads are allowed.
+
+    :param steckers: letter each letter is plugged to (-1 unknown)
+    :param unknown: unknown leads allowed
+    :param lead_options: see bombe_plugboard_constraints()
+    :return: generator of lists of leads
+    """
+
+    deduced = set(frozenset((letter, plug)) for letter, plug in enumerate(steckers) if plug > letter)
+
+    def assign(inx, used, leads):
+        if inx == len(lead_options):
+            extra = deduced - set(frozenset(ALPHABET.index(c) for c in lead) for lead in leads)
+            if not extra or unknown:
+                yield leads + sorted("".join(sorted(ALPHABET[letter] for letter in lead)) for lead in extra)
+            return
+        for option in lead_options[inx]:
+            a, b = ALPHABET.index(option[0]), ALPHABET.index(option[1])
+            if a in used or b in used or steckers[a] not in (-1, b) or steckers[b] not in (-1, a):
+                continue
+            yield from assign(inx + 1, used | {a, b}, leads + [option])
+
+    yield from assign(0, frozenset(), [])
+
+def count_bombe_settings(encrypted_text, crib, config_string):
+    """Return the number of rotor settings a Bombe tries (see check_bombe_range())"""
+
+    return (count_settings(bombe_rotor_settings(config_string))
+            * len(possible_crib_positions(encrypted_text, crib)))
+
+def check_bombe_range(encrypted_text, crib, config_string, start, stop):
+    """Run the Bombe on the slice [start, stop) of the rotor settings
+
+    The search space is every rotor setting (config without the plugboard)
+    at every possible crib position, see configs_in_range().
+
+    :param encrypted_text:
+    :param crib:
+    :param config_string: partially known Enigma settings
+    :param start: index of the first rotor setting
+    :param stop: index after the last rotor setting
+    :return: RankedResults of (Enigma settings, decrypted text)
+    """
+
+    unknown, lead_options = bombe_plugboard_constraints(config_string)
+    allowed = allowed_steckers(unknown, lead_options)
+    crib_positions = possible_crib_positions(encrypted_text, crib)
+    orders = {}
+    cores = {}
+    results = RankedResults()
+    for cnf, pos in configs_in_range(bombe_rotor_settings(config_string), crib_positions, start, stop):
+        encrypted_crib = encrypted_text[pos:pos + len(crib)]
+        if pos not in orders:
+            orders[pos] = menu_order(crib, encrypted_crib)
+        machine = Enigma(cnf)
+        machine.rotate_n_steps(pos)
+        # rotor permutations are shared by all settings with the same wheels:
+        perms = machine.scrambler_permutations(len(crib), cores.setdefault((cnf.reflector, tuple(cnf.rotors)), {}))
+        menu = crib_menu(crib, encrypted_crib, perms)
+        for steckers in bombe_stops(menu, allowed, orders[pos]):
+            for leads in complete_plugboard(steckers, unknown, lead_options):
+                solution = EnigmaConfig(cnf.reflector, cnf.rotors, cnf.rotors_pos, cnf.ring_settings, leads)
+                text = CompiledEnigma(solution, cores[cnf.reflector, tuple(cnf.rotors)]).encode_string(encrypted_text)
+                results.add(plausibility(text), (str(solution), text))
+    return results
+
+def decrypt_cipher_bombe(encrypted_text, crib, config_string):
+    """Attempt to break Enigma cypher with a known crib and partially known
+    config, deducing the plugboard instead of trying every plugboard
+
+    Example input:
+       encrypted_text:
+       CMFSUPKNCBMUYEQVVDYKLRQZTPUFHSWWAKTUGXMPAMYAFITXIJKMH
+       cribs: UNIVERSITY
+       enigma_config
+       B Beta-I-III 23-2-10 ?-M-G ?
+
+    Letters that are not part of the menu and are not given by the config are
+    left unplugged so the decrypted text of a solution with a completely
+    unknown plugboard may still need some guess work. Solutions are ranked
+    by the plausibility of their text (see plausibility()).
+
+    :param encrypted_text:
+    :param crib:
+    :param config_string:
+    :return: RankedResults of (Enigma settings, decrypted text), time
+    """
+    time_start = time.time()
+
+    if encrypted_text is None or len(encrypted_text) < len(crib):
+        raise ValueError('Expected some code to break.')
+    if not crib:
+        raise ValueError('Expected a crib.')
+
+    count = count_bombe_settings(encrypted_text, crib, config_string)
+    print("\nRunning a Bombe to find solutions.")
+    print("{0} rotor settings to search".format(count))
+
+    return check_bombe_range(encrypted_text, crib, config_string, 0, count), time.time() - time_start
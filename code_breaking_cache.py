@@ -0,0 +1,256 @@
+from code_breaking_utils import *
+import json                     # cached jobs are kept as JSON files
+import hashlib                  # fingerprints of the jobs
+
+#   Cache of code breaking jobs
+#
+#   Operators resubmit the same encrypted text, crib and settings, or settings
+#   narrowing an earlier job. The cache keeps, for every job fingerprint (see
+#   job_fingerprint()), the ranges of the search space already searched (see
+#   configs_in_range()) and the results found in them. A later job only
+#   searches the ranges it does not know yet:
+#
+#   - the same search space (see settings_search_space()): the searched
+#     ranges are skipped and their results merged
+#   - an overlapping search space (e.g. narrowing or widening an earlier
+#     job): the settings searched before are skipped and the results in the
+#     new space reused, unless the earlier results were cut to the most
+#     plausible ones (see RankedResults) and may miss some of them
+#
+#   Jobs are kept in a JSON file per fingerprint in cache_dir()/results, the
+#   least recently used files are removed once all of them take more than
+#   max_bytes.
+#
+#       cache = ResultCache(max_bytes = MAX_CACHE_BYTES)
+#       solutions, seconds = code_breaking.decrypt_cipher(cipher, crib, settings, cache=cache)
+#
+#       known = cache.lookup(encrypted_text, crib, config_string)
+#       known.missing(start, stop)              # ranges still to search
+#       cache.store(encrypted_text, crib, config_string, ranges, results)
+#
+
+MAX_CACHE_BYTES = 64 << 20      # size of all the cached jobs
+CACHE_VERSION = 1
+
+
+def job_fingerprint(encrypted_text, crib):
+    """Return the fingerprint of the encrypted text and crib of a job, the
+    settings of the jobs are told apart in the cached file"""
+
+    canonical = "{0}\n{1}\n{2}".format(CACHE_VERSION, encrypted_text.strip().upper(), crib.strip().upper())
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+def merge_ranges(ranges):
+    """Return sorted, non overlapping [start, stop] ranges covering the ranges"""
+
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        elif start < stop:
+            merged.append([start, stop])
+    return merged
+
+def subtract_ranges(start, stop, ranges):
+    """Yield the parts of [start, stop) not covered by merged ranges"""
+
+    inx = max(0, bisect.bisect_right([r[0] for r in ranges], start) - 1)
+    for covered_start, covered_stop in ranges[inx:]:
+        if covered_start >= stop:
+            break
+        if covered_stop <= start:
+            continue
+        if covered_start > start:
+            yield start, covered_start
+        start = max(start, covered_stop)
+    if start < stop:
+        yield start, stop
+
+class CachedSearch:
+    """What the cache knows about a job: the ranges of its search space
+    already searched and the results found in them"""
+
+    def __init__(self, config_string, records):
+        """
+        :param config_string: settings of the job
+        :param records: cached records of the same encrypted text and crib
+        """
+
+        self.dimensions = settings_search_space(config_string)[1]
+        self.count = count_settings(config_string)
+        # number of settings in a block of the digits from a dimension on:
+        self.block_sizes = [1]
+        for options in reversed(self.dimensions):
+            self.block_sizes.insert(0, self.block_sizes[0] * len(options))
+        self.results = RankedResults()
+        self.ranges = []
+        # earlier overlapping search spaces (see _digit_map())
+        self.overlapping = []
+        for record in records:
+            dimensions = tuple(tuple(options) for options in json.loads(record["space"]))
+            if dimensions == self.dimensions:
+                self.ranges = merge_ranges(self.ranges + record["ranges"])
+                self._merge(record, lambda result: True)
+            elif record["discarded"] == 0 and self._overlaps(dimensions):
+                self.overlapping.append(self._digit_map(dimensions, record["ranges"]))
+                self._merge(record, self._contains)
+
+    def _merge(self, record, keep):
+        for score, result in record["results"]:
+            if keep(result[0]):
+                self.results.add(score, tuple(result))
+        self.results.discarded += record["discarded"]
+
+    def _overlaps(self, dimensions):
+        return (len(dimensions) == len(self.dimensions)
+                and all(set(new) & set(old) for new, old in zip(self.dimensions, dimensions)))
+
+    def _contains(self, config_string):
+        """Return True if the settings of a result are in this search space"""
+
+        cnf = EnigmaConfig.from_config_string(config_string)
+        setting = [cnf.reflector] + list(cnf.rotors) + list(cnf.rotors_pos) + list(cnf.ring_settings) + list(cnf.plugs)
+        return (len(setting) == len(self.dimensions)
+                and all(value in options for value, options in zip(setting, self.dimensions)))
+
+    def _digit_map(self, dimensions, ranges):
+        """Return the index in another search space of every digit of this
+        one (None for the options missing there), the size of the other
+        space, the starts of the ranges searched there and the ranges, and
+        for the digits from every dimension on the smallest and largest
+        offsets there and whether all of their options are there"""
+
+        weights = []
+        weight = 1
+        for options in reversed(dimensions):
+            weights.append(weight)
+            weight *= len(options)
+        weights.reverse()
+        digits = [[old.index(value) * w if value in old else None for value in new]
+                  for new, old, w in zip(self.dimensions, dimensions, weights)]
+        ranges = merge_ranges(ranges)
+        lowest, highest, complete = [0], [0], [True]
+        for table in reversed(digits):
+            offsets = [offset for offset in table if offset is not None]
+            lowest.insert(0, lowest[0] + min(offsets))
+            highest.insert(0, highest[0] + max(offsets))
+            complete.insert(0, complete[0] and len(offsets) == len(table))
+        return digits, weight, [r[0] for r in ranges], ranges, lowest, highest, complete
+
+    def _covered_elsewhere(self, overlapping, level, old_base, new_base, start, stop):
+        """Yield the ranges of [start, stop) searched in another space, in the
+        block of settings from new_base where the digits before level are
+        fixed (at old_base in the other space)
+
+        A block is answered at once when none of its settings or all of them
+        are in a single range searched there, only the other blocks are split
+        by the options of their next digit.
+        """
+
+        digit_map, old_count, starts, ranges, lowest, highest, complete = overlapping
+        first = old_base + lowest[level]
+        last = old_base + highest[level]
+        inx = bisect.bisect_right(starts, last) - 1
+        if inx < 0 or ranges[inx][1] <= first:
+            return
+        if complete[level] and ranges[inx][0] <= first and ranges[inx][1] > last:
+            yield max(start, new_base), min(stop, new_base + self.block_sizes[level])
+            return
+        size = self.block_sizes[level + 1]
+        first_digit = max(0, (start - new_base) // size)
+        stop_digit = min(len(digit_map[level]), -((new_base - stop) // size))
+        for digit in range(first_digit, stop_digit):
+            offset = digit_map[level][digit]
+            if offset is not None:
+                yield from self._covered_elsewhere(overlapping, level + 1, old_base + offset,
+                                                   new_base + digit * size, start, stop)
+
+    def missing(self, start, stop):
+        """Yield the parts of the range [start, stop) not searched yet"""
+
+        for part_start, part_stop in subtract_ranges(start, stop, self.ranges):
+            covered = []
+            for overlapping in self.overlapping:
+                count = overlapping[1]
+                # the settings at every crib position are a block:
+                for pos_inx in range(part_start // self.count, -(-part_stop // self.count)):
+                    covered += self._covered_elsewhere(overlapping, 0, pos_inx * count, pos_inx * self.count,
+                                                       part_start, part_stop)
+            yield from subtract_ranges(part_start, part_stop, merge_ranges(covered))
+
+class ResultCache:
+    """Searched ranges and results of code breaking jobs kept on disk"""
+
+    def __init__(self, path = None, max_bytes = MAX_CACHE_BYTES):
+        """
+        :param path: directory of the cached jobs, cache_dir()/results if not given
+        :param max_bytes: size of all the cached jobs before the least
+                          recently used ones are removed
+        """
+
+        self.path = path or os.path.join(cache_dir(), "results")
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, encrypted_text, crib):
+        return os.path.join(self.path, "{0}.json".format(job_fingerprint(encrypted_text, crib)))
+
+    def _records(self, path):
+        try:
+            with open(path) as job_file:
+                records = json.load(job_file)
+        except (OSError, ValueError):
+            return []
+        # recently used jobs are evicted last:
+        os.utime(path)
+        return records if isinstance(records, list) else []
+
+    def lookup(self, encrypted_text, crib, config_string):
+        """Return what is known about a job
+
+        :return: CachedSearch
+        """
+
+        return CachedSearch(config_string, self._records(self._file(encrypted_text, crib)))
+
+    def store(self, encrypted_text, crib, config_string, ranges, results):
+        """Add searched ranges of a job and the results found in them
+
+        :param ranges: list of (start, stop) searched (see configs_in_range())
+        :param results: RankedResults of the job, starting from the results
+                        of lookup()
+        """
+
+        path = self._file(encrypted_text, crib)
+        space = json.dumps(settings_search_space(config_string)[1])
+        records = self._records(path)
+        searched = [list(r) for r in ranges]
+        for record in records:
+            if record["space"] == space:
+                searched += record["ranges"]
+        records = [record for record in records if record["space"] != space]
+        records.append({"space": space,
+                        "ranges": merge_ranges(searched),
+                        "results": [[score, list(result)] for score, result in results.ranked()],
+                        "discarded": results.discarded})
+        # write to a temporary file first so no process reads a half written job
+        temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temp_path, "w") as job_file:
+            json.dump(records, job_file)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used jobs until they fit in max_bytes"""
+
+        jobs = []
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.path, name))
+                jobs.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in jobs)
+        for mtime, size, name in sorted(jobs):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.path, name))
+            total -= size
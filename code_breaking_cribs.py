@@ -0,0 +1,143 @@
+from code_breaking_utils import *
+import multiprocessing as mp    # search in a pool of processes
+
+#   Enigma code breaking with many cribs in one pass
+#
+#   The brute force code breakers try one crib at every possible position,
+#   so trying ten probable words means ten complete searches. Enigma is
+#   reciprocal: a crib is at a position of the message exactly when the
+#   message decrypted with the same settings has the crib at that position.
+#   So every Enigma setting decrypts the whole message once (see
+#   decrypt_codes()) and all the cribs are looked for in the decrypted text
+#   at the positions allowed for them. The crib position is not part of the
+#   search space any more, settings are searched in ranges in a pool of
+#   processes.
+#
+#   Cribs are given as a list of words or as a single string with the words
+#   separated by commas. A crib may be limited to some positions of the
+#   message, e.g. a greeting at the beginning and a signature at the end:
+#       "HEILHITLER@0,WETTERBERICHT,KOMMANDANT@40-60"
+#
+#       decrypt_cipher_cribs(encrypted_text, cribs, config_string, chunk_size = 2000, processes = 0)
+#       check_cribs_range(encrypted_text, cribs, config_string, start, stop)
+#       parse_cribs(cribs)
+#
+
+
+def parse_cribs(cribs):
+    """Return a list of (crib, allowed positions) from a list or a comma
+    separated string of cribs with optional position hints
+
+    A hint is a position or a range of positions (both included) after an @,
+    e.g. "THOUSANDS,TREES@20-40,SQUIRRELS@0". Allowed positions are None if
+    the crib may be anywhere. A crib may also be given as a tuple of the crib
+    and a list of its positions.
+
+    :param cribs: string or list of strings / (crib, positions) tuples
+    :return: list of (crib, list of positions or None)
+    """
+
+    if isinstance(cribs, str):
+        cribs = [crib.strip() for crib in cribs.split(',') if crib.strip()]
+    parsed = []
+    for crib in cribs:
+        if not isinstance(crib, str):
+            parsed.append((crib[0].upper(), None if crib[1] is None else list(crib[1])))
+            continue
+        crib, _, hint = crib.partition('@')
+        positions = None
+        if hint:
+            first, _, last = hint.partition('-')
+            positions = list(range(int(first), int(last or first) + 1))
+        parsed.append((crib.strip().upper(), positions))
+    if not parsed or not all(crib.isalpha() for crib, positions in parsed):
+        raise ValueError('Expected cribs of letters, e.g. THOUSANDS,TREES@20-40')
+    return parsed
+
+def find_cribs(text, cribs, masks):
+    """Return the cribs found in a decrypted text at their allowed positions
+
+    :param text: decrypted text
+    :param cribs: see parse_cribs()
+    :param masks: see crib_position_masks()
+    :return: list of "CRIB@position"
+    """
+
+    found = []
+    for (crib, positions), mask in zip(cribs, masks):
+        pos = text.find(crib)
+        while pos >= 0:
+            if mask >> pos & 1:
+                found.append("{0}@{1}".format(crib, pos))
+            pos = text.find(crib, pos + 1)
+    return found
+
+def check_cribs_range(encrypted_text, cribs, config_string, start, stop):
+    """Look for all the cribs in the message decrypted by the slice
+    [start, stop) of the settings of a config (see settings_in_range())
+
+    :param encrypted_text:
+    :param cribs: see parse_cribs()
+    :param config_string: partially known Enigma settings
+    :param start: index of the first setting
+    :param stop: index after the last setting
+    :return: RankedResults of (Enigma settings, decrypted text, cribs found)
+    """
+
+    cribs = parse_cribs(cribs)
+    masks = crib_position_masks(encrypted_text, cribs)
+    results = RankedResults()
+    if not any(masks):
+        return results
+    codes = text_to_codes(encrypted_text)
+    cores = {}
+    for cnf in settings_in_range(config_string, start, stop):
+        text = codes_to_text(decrypt_codes(cnf, codes, cores.setdefault((cnf.reflector, tuple(cnf.rotors)), {})))
+        found = find_cribs(text, cribs, masks)
+        if found:
+            results.add(plausibility(text), (str(cnf), text, ", ".join(found)))
+    return results
+
+def decrypt_cipher_cribs(encrypted_text, cribs, config_string, chunk_size = 2000, processes = 0):
+    """Attempt to break Enigma cypher with any of many cribs and partially
+    known config
+
+    Example input:
+       encrypted_text:
+       ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY
+       cribs: SQUIRRELS@0,THOUSANDS,ACORNS
+       enigma_config
+       C II-Gamma-IV 24-8-20 ?-?-? FH-TS-BE-UQ-KD-AL
+
+    Every setting decrypts the message once and all the cribs are looked for
+    in the decrypted text. Solutions are ranked by the plausibility of their
+    text and name the cribs found in it.
+
+    :param encrypted_text:
+    :param cribs: see parse_cribs()
+    :param config_string:
+    :param chunk_size: number of settings searched at once by a process
+    :param processes: number of processes to use. 0 = all, 1 = no pool
+    :return: RankedResults of (Enigma settings, decrypted text, cribs found), time
+    """
+    time_start = time.time()
+
+    if not encrypted_text:
+        raise ValueError('Expected some code to break.')
+    cribs = parse_cribs(cribs)
+
+    count = count_settings(config_string)
+    processes = processes or mp.cpu_count()
+    print("\nSearching {0} settings for {1} cribs in {2} processes.".format(count, len(cribs), processes))
+
+    chunks = [(encrypted_text, cribs, config_string, start, min(start + chunk_size, count))
+              for start in range(0, count, chunk_size)]
+    results = RankedResults()
+    if processes == 1:
+        for chunk in chunks:
+            results.merge(check_cribs_range(*chunk))
+    else:
+        with mp.Pool(processes) as pool:
+            for found in pool.starmap(check_cribs_range, chunks):
+                results.merge(found)
+    return results, time.time() - time_start
@@ -0,0 +1,265 @@
+from code_breaking_utils import *
+from code_breaking_cribs import parse_cribs, find_cribs
+from code_breaking_tables import rotor_state_table
+import multiprocessing as mp    # search in a pool of processes
+
+#   Depth cribbing: break many messages of the same day at once
+#
+#   Messages of a day share the daily key (reflector, wheel order, ring
+#   settings and plugboard) but every message starts at its own rotor
+#   positions. Instead of breaking every message on its own, the daily keys
+#   are searched once and every message is tested against each of them. A
+#   daily key is dropped as soon as a message has no crib anywhere, so the
+#   messages together prune the daily keys much faster than one message.
+#
+#   The permutations of the rotors and the reflector at every rotor position
+#   (see Enigma.position_permutations()) do not depend on the ring settings,
+#   they are generated once per reflector and wheel order, kept on disk (see
+#   rotor_state_table()) and shared by all the ring settings, messages,
+#   processes and later jobs. A crib is looked for at every rotor position
+#   at once: only the positions where its first letter encodes correctly are
+#   stepped through the rest of the crib and then back to the start of the
+#   message.
+#
+#   Messages are given as a list of (encrypted text, cribs) with the cribs as
+#   in code_breaking_cribs.parse_cribs(). The rotor positions of the config
+#   string limit the start positions of the messages:
+#
+#       decrypt_cipher_depth(messages, config_string, chunk_size = 50, processes = 0)
+#       check_depth_range(messages, config_string, start, stop)
+#       daily_config_string(config_string)
+#
+
+
+def parse_messages(messages):
+    """Return a list of (encrypted text, cribs (see parse_cribs())) of messages
+
+    :param messages: list of (encrypted text, cribs)
+    :return: list of (encrypted text, list of (crib, allowed positions))
+    """
+
+    parsed = [(encrypted_text.strip().upper(), parse_cribs(cribs)) for encrypted_text, cribs in messages]
+    if not parsed or not all(encrypted_text.isalpha() for encrypted_text, cribs in parsed):
+        raise ValueError('Expected messages of letters with their cribs.')
+    return parsed
+
+def daily_config_string(config_string):
+    """Return the config string of the daily keys (rotor positions left out)
+    and the allowed start positions of the messages
+
+    :param config_string: An Enigma config string with marked unknown settings
+    :return: (config string, list of allowed letters of every rotor, right-most first)
+    """
+
+    rotors_count, dimensions = settings_search_space(config_string)
+    parts = config_string.split()
+    parts[3] = "-".join(["A"] * rotors_count)
+    return " ".join(parts), [set(options) for options in dimensions[1 + rotors_count:1 + 2 * rotors_count]]
+
+def _step(positions, notches):
+    """Return the rotor positions after a step (see Enigma._stepped_positions())"""
+
+    positions = list(positions)
+    if positions[0] == notches[0] or positions[1] == notches[1]:
+        if positions[1] == notches[1]:
+            positions[2] = (positions[2] + 1) % 26
+        positions[1] = (positions[1] + 1) % 26
+    positions[0] = (positions[0] + 1) % 26
+    return tuple(positions)
+
+def _unstep(positions, notches):
+    """Return all the rotor positions that step to the positions"""
+
+    found = set()
+    for middle, left in ((0, 0), (1, 0), (1, 1)):
+        previous = list(positions)
+        previous[0] = (previous[0] - 1) % 26
+        previous[1] = (previous[1] - middle) % 26
+        previous[2] = (previous[2] - left) % 26
+        if _step(previous, notches) == positions:
+            found.add(tuple(previous))
+    return found
+
+def _column(cores, plain):
+    """Return the letter codes the letter code plain is encoded to at every
+    rotor position (see Enigma.position_permutations())"""
+
+    column = cores.get(("column", plain))
+    if column is None:
+        column = cores[("column", plain)] = cores["positions"].column(plain)
+    return column
+
+def _pair_states(cores, plain, cipher):
+    """Return indexes of the rotor positions (see Enigma.position_permutations())
+    that encode the letter code plain to cipher"""
+
+    key = ("pair", plain, cipher)
+    if key not in cores:
+        column = _column(cores, plain)
+        states = []
+        inx = column.find(cipher)
+        while inx >= 0:
+            states.append(inx)
+            inx = column.find(cipher, inx + 1)
+        cores[key] = states
+    return cores[key]
+
+def _next_states(cores, notches):
+    """Return the index of the rotor positions after a step for the index of
+    every rotor position (see Enigma.position_permutations())"""
+
+    key = ("next",) + tuple(notches)
+    if key not in cores:
+        size = 26 ** len(notches)
+        # mostly only the right-most rotor steps:
+        steps = list(range(1, size + 1))
+        irregular = set(range(25, size, 26))
+        if notches[0] >= 0:
+            irregular.update(range(notches[0], size, 26))
+        if notches[1] >= 0:
+            irregular.update(inx for start in range(26 * notches[1], size, 676) for inx in range(start, start + 26))
+        for inx in irregular:
+            positions = [inx // 26 ** k % 26 for k in range(len(notches))]
+            steps[inx] = sum(p * 26 ** k for k, p in enumerate(_step(positions, notches)))
+        cores[key] = steps
+    return cores[key]
+
+def message_start_positions(machine, cores, cribs, masks, plain_cribs, cipher):
+    """Return the rotor positions (adjusted for the ring settings, see
+    Rotor.position) before a message at which a crib encodes correctly
+
+    :param machine: Enigma with the daily key
+    :param cores: dict shared by the machines with the same reflector and rotors
+    :param cribs: see parse_cribs()
+    :param masks: allowed positions of the cribs (see crib_position_masks())
+    :param plain_cribs: the cribs as letter codes after the plugboard
+    :param cipher: the message as letter codes after the plugboard
+    :return: set of positions, right-most rotor first
+    """
+
+    if "positions" not in cores:
+        # mapped from disk, generated on first use
+        cores["positions"] = rotor_state_table(machine)
+    notches = [r.right_pins.index(r.notch) if r.notch else -1 for r in machine.rotors[:-1]]
+    steps = _next_states(cores, notches)
+    starts = set()
+    for (crib, positions), mask, plain in zip(cribs, masks, plain_cribs):
+        columns = [_column(cores, code) for code in plain]
+        while mask:
+            pos = (mask & -mask).bit_length() - 1
+            mask &= mask - 1
+            for inx in _pair_states(cores, plain[0], cipher[pos]):
+                state = inx
+                for offset in range(1, len(plain)):
+                    state = steps[state]
+                    if columns[offset][state] != cipher[pos + offset]:
+                        break
+                else:
+                    # the rotors step before every letter, back to the start:
+                    found = {tuple(inx // 26 ** k % 26 for k in range(len(notches)))}
+                    for _ in range(pos + 1):
+                        found = set().union(*(_unstep(state, notches) for state in found))
+                    starts |= found
+    return starts
+
+def check_depth_range(messages, config_string, start, stop):
+    """Test every message against the slice [start, stop) of the daily keys
+    (see daily_config_string() and settings_in_range())
+
+    :param messages: list of (encrypted text, cribs), see parse_messages()
+    :param config_string: partially known Enigma settings
+    :param start: index of the first daily key
+    :param stop: index after the last daily key
+    :return: RankedResults of (daily key, message keys, decrypted texts)
+    """
+
+    alphabet = Rotor.supported_rotors['Alphabet']
+    messages = parse_messages(messages)
+    daily_string, allowed = daily_config_string(config_string)
+    prepared = []
+    for encrypted_text, cribs in messages:
+        masks = crib_position_masks(encrypted_text, cribs)
+        if not any(masks):
+            # a crib fits nowhere in this message
+            return RankedResults()
+        prepared.append((encrypted_text, cribs, masks, text_to_codes(encrypted_text)))
+    # the message with the longest crib prunes the most daily keys:
+    order = sorted(range(len(prepared)), key=lambda m: -max(len(crib) for crib, positions in prepared[m][1]))
+
+    results = RankedResults()
+    cores = {}
+    for cnf in settings_in_range(daily_string, start, stop):
+        machine = Enigma(cnf)
+        machine_cores = cores.setdefault((cnf.reflector, tuple(cnf.rotors)), {})
+        plugs = plugboard_table(cnf.plugs)
+        found = {}
+        for m in order:
+            encrypted_text, cribs, masks, codes = prepared[m]
+            plain_cribs = [text_to_codes(crib).translate(plugs) for crib, positions in cribs]
+            best = None
+            for state in message_start_positions(machine, machine_cores, cribs, masks, plain_cribs,
+                                                 codes.translate(plugs)):
+                window = [alphabet[(p + r.ring_setting) % 26] for p, r in zip(state, machine.rotors)]
+                if not all(letter in letters for letter, letters in zip(window, allowed)):
+                    continue
+                key = EnigmaConfig(cnf.reflector, cnf.rotors, window, cnf.ring_settings, cnf.plugs)
+                text = codes_to_text(decrypt_codes(key, codes, machine_cores))
+                if find_cribs(text, cribs, masks):
+                    score = plausibility(text)
+                    if best is None or score > best[0]:
+                        best = (score, str(key), text)
+            if best is None:
+                # this daily key does not fit a message, the other ones are not tested
+                break
+            found[m] = best
+        else:
+            daily = str(cnf).split()
+            daily[3] = "-".join(["?"] * len(cnf.rotors))
+            results.add(sum(best[0] for best in found.values()) / len(found),
+                        (" ".join(daily),
+                         tuple(found[m][1] for m in range(len(prepared))),
+                         tuple(found[m][2] for m in range(len(prepared)))))
+    return results
+
+def decrypt_cipher_depth(messages, config_string, chunk_size = 50, processes = 0):
+    """Attempt to break many Enigma messages sharing the daily key
+
+    Example input:
+       messages:
+       [("ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJ", "SQUIRRELS@0"),
+        ("LBOJVHHFRWXOSFMJLSBYZGHDNXQWSTCDKQWZDMY", "TREES,ACORNS")]
+       enigma_config
+       C II-Gamma-IV [8,20,24]-8-20 ?-?-? FH-TS-BE-UQ-KD-AL
+
+    Every daily key (every setting but the rotor positions) is searched once
+    and all the messages are tested against it at all their possible start
+    positions. A daily key is a solution when every message has a crib at
+    some start position. Solutions are ranked by the average plausibility of
+    the decrypted messages.
+
+    :param messages: list of (encrypted text, cribs), see parse_messages()
+    :param config_string: partially known Enigma settings, the rotor positions
+                          limit the start positions of the messages
+    :param chunk_size: number of daily keys searched at once by a process
+    :param processes: number of processes to use. 0 = all, 1 = no pool
+    :return: RankedResults of (daily key, message keys, decrypted texts), time
+    """
+    time_start = time.time()
+
+    messages = parse_messages(messages)
+    daily_string = daily_config_string(config_string)[0]
+    count = count_settings(daily_string)
+    processes = processes or mp.cpu_count()
+    print("\nSearching {0} daily keys for {1} messages in {2} processes.".format(count, len(messages), processes))
+
+    chunks = [(messages, config_string, start, min(start + chunk_size, count))
+              for start in range(0, count, chunk_size)]
+    results = RankedResults()
+    if processes == 1:
+        for chunk in chunks:
+            results.merge(check_depth_range(*chunk))
+    else:
+        with mp.Pool(processes) as pool:
+            for found in pool.starmap(check_depth_range, chunks):
+                results.merge(found)
+    return results, time.time() - time_start
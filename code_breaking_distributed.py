@@ -1,9 +1,15 @@
 import platform                                     # to get the hostname of the client machine
 import socket                                       # to get the ip address of the server
 import multiprocessing as mp                        # multiprocessing on the client
-from multiprocessing.managers import SyncManager    # For the job and result queue
+import threading                                    # work producer on the server
+import uuid                                         # to identify submitted jobs
+from collections import deque                       # work units handed out again
+from fractions import Fraction                      # exact shares of the jobs
+from multiprocessing.managers import SyncManager, DictProxy # For the job and result queue
 from queue import Queue, Empty                      # For the job and result queue
 from code_breaking_utils import *
+from code_breaking_prior import *
+from code_breaking_protocol import *
 
 #   This is the improved Enigma brute force code breaking that runs distributed
 #   The work load is defined by the server and shared by 1 or more client machines.
@@ -18,52 +24,115 @@ from code_breaking_utils import *
 #   After all the clients are up start the server as well:
 #       python3 enigma-cli.py --module distributed --component server
 #
+#   To run many jobs start a coordinator instead of a server and submit the
+#   jobs to it, clients stay connected between the jobs:
+#       python3 enigma-cli.py --module distributed --component coordinator
+#       python3 enigma-cli.py --module distributed --component submit --serverip 192.168.0.229 --priority 2
+#
 #   A short demo can be seen in this video: https://youtu.be/kgZlp_Cw6Kw
 #
 #   Client part
 #       runclient(srv_ip, sample = 1000, cpus = 0)
+#
+#   Server part
+#       runserver(encrypted_text, crib, config_string, chunk_size = 50, prior = None, stop_score = None)
+#       runcoordinator(chunk_size = 50, jobs = (), repeat = False)
+#       submit_job(srv_ip, encrypted_text, crib, config_string, priority = 1)
+#       wait_for_job(srv_ip, job_id, timeout = None)
 
 PORTNUM = 22222         # port used to connect to the server
 AUTHKEY = b'authkey'    # basic authentication between client / server
 SAMPLE = 1000           # number of Enigma settings to make time estimate on
-
-
-def mp_check_enigma_config(shared_job_q, shared_result_q, sample, cpus):
-    '''Pulls a chunk of Enigma work load from the job queue and
-    verifies the Enigma settings. Sends the results back to the results queue
-
-    After "sample" of Enigma settings have been checked sends speed to the
-    queue so server can make time predictions for the complete calculation
-
-    :param shared_job_q:
-    :param shared_result_q: Result queue for potential solutions
-    :param sample: # number of Enigma settings to make time estimate on
-    :param cpus: number of cores (processes) used.
+QUEUE_DEPTH = 4         # work units kept in the job queue per client core
+PRODUCER_POLL = 0.05    # seconds the producer waits while the job queue is full
+PREFETCH_SECONDS = 2    # seconds of work buffered on each client
+RESULT_BATCH_TIME = 0.5 # seconds a client collects results before sending them
+SPEED_INTERVAL = 5      # seconds between speed samples sent by a client
+HEARTBEAT_INTERVAL = 5  # seconds between heartbeats of an idle client
+CLIENT_TIMEOUT = 30     # seconds without a message before a client is considered gone
+ETA_WINDOW = 2          # seconds of progress in one sample of the server's throughput
+ETA_SMOOTHING = 0.3     # weight of the latest throughput sample
+STATUS_INTERVAL = 1     # seconds between status updates of the coordinator
+REPORT_INTERVAL = 10    # seconds between progress reports printed by the server
+
+
+def client_name():
+    """Return the name of this client in its frames, the hostname and the
+    process id so that clients running on the same host are told apart"""
+
+    return "{0}:{1}".format(platform.node(), os.getpid())
+
+def mp_check_enigma_config(local_job_q, local_result_q):
+    '''Pulls a chunk of Enigma work load from the client's local job queue
+    and verifies the Enigma settings. Sends the results back to the client's
+    local result queue
+
+    A chunk is a range of a job's search space (see configs_in_range()).
+    The worker exits once it pulls the None sentinel from the job queue.
+
+    :param local_job_q: work units prefetched from the server
+    :param local_result_q: Result queue for potential solutions
     :return:
     '''
 
+    while True:
+        job = local_job_q.get()
+        if job is None:
+            # no more work, leave the sentinel for the other workers
+            local_job_q.put(None)
+            local_result_q.put(("EXIT",))
+            return
+        job_id, encrypted_text, crib, config_string, start, stop = job
+        result = check_enigma_config_range(encrypted_text, crib, config_string, start, stop)
+        local_result_q.put(("DONE", job_id, start, stop, result))
+
+def prefetch_work_units(shared_job_q, local_job_q, prefetch, send):
+    '''Keeps a buffer of work units on the client so that worker processes
+    do not wait for a round-trip to the server between two chunks
+
+    The buffer holds enough work units for about PREFETCH_SECONDS seconds
+    of work at the speed measured on this client (see runclient()). Every
+    work unit taken is reported to the server so it can hand the unit out
+    again if this client goes away.
+
+    :param shared_job_q: job queue on the server
+    :param local_job_q: job queue shared by the worker processes on the client
+    :param prefetch: dict with "buffered" and "target" number of units and
+                     the "condition" guarding them
+    :param send: function sending a frame to the server
+    :return:
+    '''
 
-    total_searched = 0
-    speed_sent = False
-    time_start = time.time()
+    condition = prefetch["condition"]
     while True:
+        with condition:
+            condition.wait_for(lambda: prefetch["buffered"] < prefetch["target"])
         try:
-            job = shared_job_q.get_nowait()
-            result = check_enigma_config(job[0], job[1], job[2])
-            if (result):
-                shared_result_q.put((platform.node(), result))
-            total_searched += len(job[0])
-            if(sample > 0 and total_searched > sample and not speed_sent):
-                speed = total_searched / (time.time() - time_start)
-                shared_result_q.put("SPEED,{0},{1},{2}".format(speed, platform.node(), cpus))
-                speed_sent = True
-        except Empty:
+            job = shared_job_q.get()
+        except (EOFError, ConnectionError):
+            # server went away
+            job = None
+        else:
+            if job is None:
+                # leave the sentinel for the other clients
+                shared_job_q.put(None)
+            else:
+                send(encode_frame(client_name(), [Taken(job[0], job[4], job[5])]))
+        local_job_q.put(job)
+        if job is None:
             return
+        with condition:
+            prefetch["buffered"] += 1
 
 def runclient(srv_ip, sample = 1000, cpus = 0):
     '''Waits for the server to come online. Then runs a number of processes
     and pulls chunks of Enigma settings to check for solutions
 
+    A single thread prefetches chunks from the server into a local buffer and
+    the results of all the processes are sent back to the server in batches.
+    The client keeps working until the server shuts down so it can take part
+    in any number of jobs of a coordinator (see runcoordinator()).
+
     :param srv_ip:  string IP of the server e.g. "192.168.0.229"
     :param sample:  sample: # number of Enigma settings to make time estimate on
     :param cpus:    number of cores / processes to use. 0 = all
@@ -89,20 +158,105 @@ def runclient(srv_ip, sample = 1000, cpus = 0):
         cpu_cores = cpus
     print("Connected. Using {0} cpu cores".format(cpu_cores))
 
+    local_job_q = mp.Queue()
+    local_result_q = mp.Queue()
+    # until the speed of this client is known buffer two chunks per core:
+    prefetch = {"buffered": 0, "target": 2 * cpu_cores, "condition": threading.Condition()}
+    fetcher = threading.Thread(target=prefetch_work_units, args=(job_q, local_job_q, prefetch, result_q.put),
+                               daemon=True)
+    fetcher.start()
+
     procs = []
     for i in range(cpu_cores):
         p = mp.Process(
             target=mp_check_enigma_config,
-            args=(job_q, result_q, sample, cpu_cores))
+            args=(local_job_q, local_result_q),
+            # do not outlive the client if it is stopped:
+            daemon=True)
         procs.append(p)
         p.start()
 
+    send_worker_results(local_result_q, result_q.put, prefetch, cpu_cores, sample)
     for p in procs:
         p.join()
-    # all jobs finished, send a final sentinel to the server
-    result_q.put("FINAL,{0}".format(platform.node()))
     return
 
+def send_worker_results(local_result_q, send, prefetch, cpu_cores, sample):
+    '''Collect results of the worker processes and send them to the server
+    in batches until all the workers exit
+
+    Every RESULT_BATCH_TIME seconds the candidates found and the number of
+    settings checked are sent in a single frame (see code_breaking_protocol).
+    The speed of the client is sent every SPEED_INTERVAL seconds once "sample"
+    settings have been checked and a heartbeat when there is nothing else to
+    send. The speed also determines the size of the prefetch buffer.
+
+    :param local_result_q: results of the worker processes
+    :param send: function sending a frame to the server
+    :param prefetch: prefetch buffer (see prefetch_work_units())
+    :param cpu_cores: number of worker processes
+    :param sample: # number of Enigma settings to make time estimate on
+    :return:
+    '''
+
+    node = client_name()
+    # tell the server how many cores are about to work:
+    send(encode_frame(node, [Heartbeat(cpu_cores)]))
+
+    found = {}          # job id => RankedResults of the results since the last frame
+    progress = {}
+    checked = []        # work units (job id, start, stop) checked since the last frame
+    units_done = 0
+    speed_checked = 0
+    workers_running = cpu_cores
+    time_start = time.time()
+    last_batch = last_sent = last_speed = time_start
+    while workers_running:
+        try:
+            message = local_result_q.get(timeout=RESULT_BATCH_TIME)
+        except Empty:
+            message = ("WAIT",)
+        if message[0] == "DONE":
+            job_id, start, stop = message[1:4]
+            # only the most plausible candidates are sent:
+            found.setdefault(job_id, RankedResults()).merge(message[4])
+            progress[job_id] = progress.get(job_id, 0) + stop - start
+            checked.append(Checked(job_id, start, stop))
+            speed_checked += stop - start
+            units_done += 1
+            # size the prefetch buffer from the measured speed:
+            units_per_second = units_done / (time.time() - time_start)
+            with prefetch["condition"]:
+                prefetch["buffered"] -= 1
+                prefetch["target"] = max(cpu_cores + 1, round(units_per_second * PREFETCH_SECONDS))
+                prefetch["condition"].notify()
+        elif message[0] == "EXIT":
+            workers_running -= 1
+
+        now = time.time()
+        if now - last_batch < RESULT_BATCH_TIME and workers_running:
+            continue
+        last_batch = now
+        frame = [candidate for job_id, results in found.items()
+                 for candidate in candidates_from_results(job_id, results)]
+        frame += [Progress(job_id, count, found[job_id].discarded) for job_id, count in progress.items()]
+        frame += checked
+        if speed_checked > sample and now - last_speed >= SPEED_INTERVAL:
+            frame.append(Speed(cpu_cores, speed_checked / (now - last_speed)))
+            speed_checked = 0
+            last_speed = now
+        if not frame and now - last_sent >= HEARTBEAT_INTERVAL:
+            frame.append(Heartbeat(cpu_cores))
+        if frame:
+            send(encode_frame(node, frame))
+            found = {}
+            progress = {}
+            checked = []
+            last_sent = now
+
+    # all jobs finished, tell the server
+    send(encode_frame(node, [Final()]))
+
 def make_client_manager(ip, port, authkey):
     """ Create a manager for a client. This manager connects to a server on the
         given address and exposes the get_job_q and get_result_q methods for
@@ -116,6 +270,8 @@ def make_client_manager(ip, port, authkey):
 
     ServerQueueManager.register('get_job_q')
     ServerQueueManager.register('get_result_q')
+    ServerQueueManager.register('get_submit_q')
+    ServerQueueManager.register('get_status', proxytype=DictProxy)
 
     manager = ServerQueueManager(address=(ip, port), authkey=authkey)
     manager.connect()
@@ -135,20 +291,25 @@ def make_client_manager(ip, port, authkey):
 
 def make_server_manager(port, authkey):
     """ Creates a manager for the server, listening on the given port.
-        Returns a manager object with get_job_q and get_result_q methods.
+        Returns a manager object with get_job_q, get_result_q, get_submit_q
+        and get_status methods.
     """
 
     job_q = Queue()
     result_q = Queue()
+    submit_q = Queue()
+    status = {}
 
     # This is based on the examples in the official docs of multiprocessing.
-    # get_{job|result}_q return synchronized proxies for the actual Queue
+    # get_{job|result|submit}_q return synchronized proxies for the actual Queue
     # objects.
     class JobQueueManager(SyncManager):
         pass
 
     JobQueueManager.register('get_job_q', callable=lambda: job_q)
     JobQueueManager.register('get_result_q', callable=lambda: result_q)
+    JobQueueManager.register('get_submit_q', callable=lambda: submit_q)
+    JobQueueManager.register('get_status', callable=lambda: status, proxytype=DictProxy)
 
     manager = JobQueueManager(address=('', port), authkey=authkey)
     manager.start()
@@ -157,102 +318,562 @@ def make_server_manager(port, authkey):
     print("Run one or multiple clients to share the work (-m client -ip {0} [-cpus N])".format(ip))
     return manager
 
-def display_speed_pred(clients, total_enigma_configs, elapsed_time):
-    total_speed = 0
-    for name in clients:
-        total_speed += sum(clients[name])
-    # adding 20% to the estimated time is a desperate way to estimate
-    # the queue overhead. It doesn't work well and TODO here
-    estimated_time = (total_enigma_configs/(total_speed))*1.2
-    remaining_time = estimated_time - elapsed_time
-    #print("Elapsed:", elapsed_time)
-    return estimated_time, remaining_time, total_speed
-
-def runserver(encrypted_text, crib, config_string, chunk_size = 50):
-    """Start a shared manager server and access its queues. Add batches of
-    Enigma settings to the job queue to be picked up by workers.
+class ProgressEstimator:
+    """Estimates the time left from the telemetry sent by the clients
+
+    The speed the clients measure themselves does not include the queue and
+    network overhead, so the estimate is based on the rate at which checked
+    settings actually arrive at the server, smoothed over samples of
+    ETA_WINDOW seconds. Until the first sample is complete the sum of the
+    speeds reported by the clients is used instead.
+    """
+
+    def __init__(self):
+        self.clients = {}       # hostname => [cores, speed, time last seen]
+        self.rate = None        # smoothed settings per second seen by the server
+        self.window_start = None
+        self.window_count = 0
+
+    def client_seen(self, node, cpus, speed=None):
+        """Register a message from a client, returns True for a new client"""
+
+        new_client = node not in self.clients
+        client = self.clients.setdefault(node, [cpus, None, 0])
+        client[0] = cpus
+        if speed is not None:
+            client[1] = speed
+        client[2] = time.time()
+        return new_client
+
+    def client_left(self, node):
+        self.clients.pop(node, None)
+
+    def active_clients(self):
+        """Return [cores, speed, last seen] of clients heard from recently"""
+
+        now = time.time()
+        return {node: client for node, client in self.clients.items() if now - client[2] < CLIENT_TIMEOUT}
+
+    def cpus(self):
+        return sum(client[0] for client in self.active_clients().values())
+
+    def add_progress(self, count):
+        """Add a number of settings reported as checked"""
+
+        now = time.time()
+        if self.window_start is None:
+            self.window_start = now
+        self.window_count += count
+        elapsed = now - self.window_start
+        if elapsed >= ETA_WINDOW:
+            sample = self.window_count / elapsed
+            self.rate = sample if self.rate is None else ETA_SMOOTHING * sample + (1 - ETA_SMOOTHING) * self.rate
+            self.window_start = now
+            self.window_count = 0
+
+    def speed(self):
+        """Return the estimated number of settings checked per second"""
+
+        if self.rate is not None:
+            return self.rate
+        return sum(client[1] or 0 for client in self.active_clients().values())
+
+    def remaining_time(self, remaining_count, share = 1):
+        """Return the estimated time to check remaining_count settings with a
+        share of all the clients or None if there is no speed known yet"""
+
+        speed = self.speed() * share
+        if not speed:
+            return None
+        return remaining_count / speed
+
+class BreakingJob:
+    """A code breaking job scheduled by the Coordinator"""
+
+    def __init__(self, job_id, encrypted_text, crib, config_string, priority=1, chunk_size=50,
+                 prior=None, stop_score=None):
+        """Define a code breaking job
+
+        :param job_id: unique name of the job
+        :param encrypted_text:
+        :param crib:
+        :param config_string: partially known Enigma settings
+        :param priority: share of the clients' time relative to other jobs
+        :param chunk_size: number of Enigma settings in a work unit
+        :param prior: SettingsPrior to hand out the most likely settings first
+        :param stop_score: finish once a solution is at least this plausible
+        """
+
+        if priority <= 0:
+            raise ValueError("Job priority must be positive.")
+        self.job_id = job_id
+        self.encrypted_text = encrypted_text
+        self.crib = crib
+        if prior is not None:
+            # clients search ranges of the same space ordered by the prior:
+            config_string = prior_config_string(config_string, prior)
+        self.config_string = config_string
+        self.priority = priority
+        self.prior = prior
+        self.stop_score = stop_score
+        # size of the search space (see configs_in_range()):
+        positions_count = len(possible_crib_positions(encrypted_text, crib))
+        self.total_count = count_settings(config_string) * positions_count
+        self.work_units = prior_work_units(config_string, positions_count, prior, chunk_size)
+        self.requeued = deque()     # (start, stop) of clients that left, handed out first
+        self.dispatched_count = 0   # number of settings handed out to the clients
+        self.done_count = 0         # number of settings checked by the clients
+        self.stopped = False        # a plausible enough solution was found
+        self.results = RankedResults()
+        self.pass_value = 0     # virtual time for the fair sharing
+        self.time_start = time.time()
+        self.time_end = None
+
+    def is_dispatched(self):
+        return self.stopped or self.dispatched_count >= self.total_count
+
+    def is_finished(self):
+        return self.stopped or self.done_count >= self.total_count
+
+    def elapsed_time(self):
+        return (self.time_end or time.time()) - self.time_start
+
+    def status(self):
+        """Return progress and results of the job as a dictionary"""
+
+        return {"job_id": self.job_id,
+                "priority": self.priority,
+                "total": self.total_count,
+                "done": self.done_count,
+                "finished": self.is_finished(),
+                "stopped": self.stopped,
+                "time": self.elapsed_time(),
+                "results": list(self.results),
+                "scores": [score for score, result in self.results.ranked()],
+                "discarded": self.results.discarded}
+
+class Coordinator:
+    """Schedules work units of multiple code breaking jobs
+
+    Work units of all unfinished jobs are handed out in proportion to the
+    job priorities (stride scheduling): every job has a virtual time that
+    advances by 1/priority with every work unit dispatched and the next work
+    unit always comes from the job that is furthest behind. A job submitted
+    later starts at the current virtual time so a small job gets its share
+    right away instead of waiting behind a huge search.
+
+    The work units every client holds are tracked until the client reports
+    them checked, the units of a client that disconnects or times out are
+    handed out again ahead of the rest of their jobs (see client_lost()).
+    The settings of a work unit are counted as done only once, by the first
+    report of the unit checked (see unit_checked()).
+    """
+
+    def __init__(self, chunk_size = 50):
+        self.chunk_size = chunk_size
+        self.jobs = {}
+        self.virtual_time = 0
+        self.outstanding = {}   # (job id, start, stop) not checked yet => client holding it
+        self.lock = threading.Lock()
+
+    def submit(self, encrypted_text, crib, config_string, priority=1, job_id=None, prior=None, stop_score=None):
+        """Add a job and return its id (see BreakingJob)"""
+
+        job = BreakingJob(job_id or uuid.uuid4().hex[:8], encrypted_text, crib, config_string, priority,
+                          self.chunk_size, prior, stop_score)
+        with self.lock:
+            if job.job_id in self.jobs:
+                raise ValueError("Job {0} already submitted.".format(job.job_id))
+            job.pass_value = self.virtual_time
+            if job.is_finished():
+                # nothing to search, e.g. the crib fits nowhere
+                job.time_end = job.time_start
+            self.jobs[job.job_id] = job
+        return job.job_id
+
+    def next_work_unit(self, client=None):
+        """Return the next work unit (job id, encrypted text, crib, settings, start, stop)
+        or None if all the work has been dispatched
+
+        :param client: the client receiving the unit if known, otherwise it
+                       reports the unit with unit_taken()
+        """
+
+        with self.lock:
+            pending = [job for job in self.jobs.values() if not job.is_dispatched()]
+            if not pending:
+                return None
+            job = min(pending, key=lambda j: j.pass_value)
+            self.virtual_time = job.pass_value
+            job.pass_value += Fraction(1) / Fraction(job.priority)
+            start, stop = job.requeued.popleft() if job.requeued else next(job.work_units)
+            job.dispatched_count += stop - start
+            if client is not None:
+                self.outstanding[(job.job_id, start, stop)] = client
+            return job.job_id, job.encrypted_text, job.crib, job.config_string, start, stop
+
+    def unit_taken(self, client, job_id, start, stop):
+        """Record a work unit a client took from the shared job queue"""
+
+        with self.lock:
+            self.outstanding[(job_id, start, stop)] = client
+
+    def unit_checked(self, job_id, start, stop):
+        """Count the settings of a work unit a client has checked, unless
+        the unit was reported checked before (e.g. by a client it was handed
+        out to again after a timeout)"""
+
+        with self.lock:
+            job = self.jobs[job_id]
+            if self.outstanding.pop((job_id, start, stop), None) is None:
+                if (start, stop) not in job.requeued:
+                    return
+                # late report of a client given up on, no need to check it again
+                job.requeued.remove((start, stop))
+                job.dispatched_count += stop - start
+            job.done_count += stop - start
+            self._check_finished(job)
+
+    def client_lost(self, client):
+        """Hand out the work units of a client that disconnected or timed out
+        again, ahead of the units not dispatched yet
+
+        :return: number of work units handed out again
+        """
+
+        with self.lock:
+            units = sorted(unit for unit, holder in self.outstanding.items() if holder == client)
+            for job_id, start, stop in units:
+                del self.outstanding[(job_id, start, stop)]
+                job = self.jobs[job_id]
+                if not job.is_finished():
+                    job.requeued.append((start, stop))
+                    job.dispatched_count -= stop - start
+            return len(units)
+
+    def work_done(self, job_id, count, results):
+        """Record a number of checked settings and solutions found in them
+        (a RankedResults, only the most plausible solutions are kept)"""
+
+        with self.lock:
+            job = self.jobs[job_id]
+            job.results.merge(results)
+            job.done_count += count
+            self._check_finished(job)
+
+    def _check_finished(self, job):
+        if job.stop_score is not None and job.results and -job.results.scores[0] >= job.stop_score:
+            job.stopped = True
+        if job.is_finished() and job.time_end is None:
+            job.time_end = time.time()
+
+    def remaining_count(self):
+        with self.lock:
+            return sum(job.total_count - job.done_count for job in self.jobs.values() if not job.stopped)
+
+    def status(self):
+        """Return progress of all the jobs (see BreakingJob.status())"""
+
+        with self.lock:
+            return {job_id: job.status() for job_id, job in self.jobs.items()}
+
+def produce_work_units(shared_job_q, coordinator, queue_depth, stop_event):
+    """Put work units of the coordinator's jobs into the job queue while
+    clients consume them
+
+    Work units are generated on demand, the job queue is only topped up to
+    queue_depth[0] units so the memory used by the server does not depend on
+    the size of the jobs and work units of a job submitted later do not
+    queue behind the complete earlier jobs.
+
+    :param shared_job_q: job queue shared with the clients
+    :param coordinator: Coordinator with the jobs
+    :param queue_depth: one element list with the number of units to keep queued
+    :param stop_event: set to stop producing work units
+    :return:
+    """
+
+    while not stop_event.is_set():
+        if shared_job_q.qsize() >= queue_depth[0]:
+            stop_event.wait(PRODUCER_POLL)
+            continue
+        unit = coordinator.next_work_unit()
+        if unit is None:
+            stop_event.wait(PRODUCER_POLL)
+            continue
+        shared_job_q.put(unit)
+
+def handle_client_message(frame, coordinator, estimator, queue_depth):
+    """Process a frame of messages a client sent to the result queue
+    (see code_breaking_protocol)
+
+    :param frame: bytes
+    :param coordinator: Coordinator with the jobs
+    :param estimator: ProgressEstimator with the clients
+    :param queue_depth: one element list with the number of units to keep queued
+    :return:
+    """
+
+    node, messages = decode_frame(frame)
+    handle_client_messages(node, messages, coordinator, estimator)
+    # keep a few work units queued for every core of every client:
+    queue_depth[0] = QUEUE_DEPTH * max(mp.cpu_count(), estimator.cpus())
+
+def handle_client_messages(node, messages, coordinator, estimator, client=None):
+    """Process messages of a client (see handle_client_message())
+
+    :param client: key of the client's work units in the coordinator,
+                   defaults to its name in the frames (see client_name())
+    """
+
+    client = node if client is None else client
+    # e.g. a client still working for an earlier run of the server:
+    messages = [message for message in messages
+                if getattr(message, "job_id", None) is None or message.job_id in coordinator.jobs]
+
+    # potential solutions found by the client, prefixed with the client's hostname
+    candidates = {}
+    for message in messages:
+        if type(message) is Candidate:
+            candidates.setdefault(message.job_id, RankedResults()).add(message.score,
+                                                                      candidate_to_result(node, message))
+    for message in messages:
+        if type(message) is Progress:
+            # the settings are counted as done with the Checked work units:
+            results = candidates.pop(message.job_id, RankedResults())
+            results.discarded += message.discarded
+            coordinator.work_done(message.job_id, 0, results)
+            estimator.add_progress(message.count)
+            estimator.client_seen(node, estimator.clients.get(node, [0])[0])
+        elif type(message) is Taken:
+            coordinator.unit_taken(client, message.job_id, message.start, message.stop)
+            estimator.client_seen(node, estimator.clients.get(node, [0])[0])
+        elif type(message) is Checked:
+            coordinator.unit_checked(message.job_id, message.start, message.stop)
+        elif type(message) is Speed or type(message) is Heartbeat:
+            speed = message.speed if type(message) is Speed else None
+            if estimator.client_seen(node, message.cpus, speed):
+                print("\n{0} joined working with {1} cores.".format(node, message.cpus))
+        elif type(message) is Final:
+            # Client finished and exited.
+            estimator.client_left(node)
+            coordinator.client_lost(client)
+    for job_id, results in candidates.items():
+        coordinator.work_done(job_id, 0, results)
+
+def requeue_lost_clients(coordinator, estimator):
+    """Hand out the work units of clients not heard from for CLIENT_TIMEOUT
+    seconds again (clients send a heartbeat every HEARTBEAT_INTERVAL seconds)"""
+
+    active = estimator.active_clients()
+    for node in [node for node in estimator.clients if node not in active]:
+        estimator.client_left(node)
+        count = coordinator.client_lost(node)
+        print("\n{0} timed out, {1} work units handed out again.".format(node, count))
+
+def print_progress(coordinator, estimator):
+    """Print progress and estimated time left of the unfinished jobs"""
+
+    status = coordinator.status()
+    unfinished = [job for job in status.values() if not job["finished"]]
+    total_priority = sum(job["priority"] for job in unfinished)
+    for job in unfinished:
+        remaining_time = estimator.remaining_time(job["total"] - job["done"], job["priority"] / total_priority)
+        print("Job {0}: {1}/{2} settings checked, {3} seconds left at {4} settings / second"
+              .format(job["job_id"], job["done"], job["total"],
+                      "?" if remaining_time is None else round(remaining_time),
+                      round(estimator.speed())))
+
+def start_coordinator(coordinator):
+    """Start the manager server and a producer thread feeding the coordinator's
+    work units to the job queue
+
+    :return: manager, producer thread, event to stop the producer,
+             ProgressEstimator and queue depth (see handle_client_message())
+    """
+
+    manager = make_server_manager(PORTNUM, AUTHKEY)
+    # before any client reports its number of cores keep enough work for one client:
+    queue_depth = [QUEUE_DEPTH * mp.cpu_count()]
+    stop_producer = threading.Event()
+    producer = threading.Thread(target=produce_work_units,
+                                args=(manager.get_job_q(), coordinator, queue_depth, stop_producer),
+                                daemon=True)
+    producer.start()
+    return manager, producer, stop_producer, ProgressEstimator(), queue_depth
+
+def stop_coordinator(manager, producer, stop_producer):
+    """Stop producing work units and shut down the manager server"""
+
+    stop_producer.set()
+    producer.join()
+    # tell the clients there is no more work:
+    manager.get_job_q().put(None)
+    # Sleep a bit before shutting down the server - to give clients time to
+    # realize the job queue is empty and exit in an orderly way.
+    time.sleep(2)
+    manager.shutdown()
+
+def runserver(encrypted_text, crib, config_string, chunk_size = 50, prior = None, stop_score = None):
+    """Start a shared manager server and access its queues. Batches of
+    Enigma settings are added to the job queue by a producer thread while
+    they are being picked up by workers.
+
+    This runs a single job, see runcoordinator() for running many jobs.
 
     :param encrypted_text:
     :param crib:
     :param config_string:
     :param chunk_size:
+    :param prior: SettingsPrior to hand out the most likely settings first
+    :param stop_score: stop once a solution is at least this plausible
     :return:
     """
-    # Start a shared manager server and access its queues
-    manager = make_server_manager(PORTNUM, AUTHKEY)
-    shared_job_q = manager.get_job_q()
-    shared_result_q = manager.get_result_q()
-    start_time = time.time()
 
-    # Construct all possible Enigma settings based on unknown / partially known
-    # Enigma configuration provided:
-    enigma_configs = all_possible_settings(config_string)
-    # Slide the crib under the encrypted text and determine all positions in
+    # The search space is every possible Enigma setting (based on unknown /
+    # partially known Enigma configuration provided) at every position in
     # which the letter of the crib does not match the encrypted text
-    # (Enigma can never encode a letter into itself)
-    crib_positions = possible_crib_positions(encrypted_text, crib)
-
-    # Prepare all Enigma settings / crib tuples and put them into the job
-    # queue to be picked up by workers
-    total_count = 0
-    batch_items = 0
-    batch = []
-    results = []
-    for pos in crib_positions:
-        for cnf in enigma_configs:
-            batch.append((cnf, pos))
-            batch_items += 1
-            total_count += 1
-            if batch_items >= chunk_size:
-                shared_job_q.put((batch, crib, encrypted_text))
-                batch_items = 0
-                batch = []
-    if(batch): # last batch probably partial
-        shared_job_q.put((batch, crib, encrypted_text))
-
-    print("{0} settings in chunks of {1} to distribute amongst clients".format(len(enigma_configs) * len(crib_positions), chunk_size))
+    # (Enigma can never encode a letter into itself). It is not constructed,
+    # clients receive ranges of it instead:
+    coordinator = Coordinator(chunk_size)
+    job = coordinator.jobs[coordinator.submit(encrypted_text, crib, config_string, prior=prior, stop_score=stop_score)]
+    manager, producer, stop_producer, estimator, queue_depth = start_coordinator(coordinator)
+    shared_result_q = manager.get_result_q()
+
+    print("{0} settings in chunks of {1} to distribute amongst clients".format(job.total_count, chunk_size))
 
     # Wait until all results are ready in shared_result_q
-    clients = {}
-    while True:
-        client_results = shared_result_q.get()
-        if not isinstance(client_results, str):
-            # Worker sent potential solution
-            #print("{0} solved = {1}".format(client_results[0], client_results[1]))
-            # distributed clients add hostname to results, need to pack hostname
-            # with the results
-            results = list(itertools.chain(results, [(client_results[0],) + r for r in client_results[1]]))
-        elif(client_results.startswith("SPEED")):
-            # Worker sends its speed (once for each core / process)
-            speed = float(client_results.split(',')[1])
-            name = client_results.split(',')[2]
-            cpus = int(client_results.split(',')[3])
-            if not name in clients:
-                clients[name] = []
-            clients[name].append(speed)
-            if len(clients[name]) == cpus:
-                # last worker's core sends speed, calculate average speed for worker
-                print("\n{0} joined with speed {1} settings / second working with {2} cores."
-                      .format(name, round(sum(clients[name])), cpus))
-                estimated_time, remaining_time, total_speed = display_speed_pred(clients,
-                                                                                 total_count,
-                                                                                 time.time() - start_time)
-                print("Estimated time: {0} at speed: {1}".format(round(estimated_time), round(total_speed)))
-        elif (client_results.startswith("FINAL")):
-            # Worker finished all jobs and exited.
-            name = client_results.split(',')[1]
-            # print("{0} finished.".format(name))
-            del clients[name]
-            if(len(clients) <= 1):
-                # Last client finished
-                end_time = time.time()
-                break
-
-    #print("{0} seconds".format(round(end_time-start_time)))
-    #print(results)
+    last_report = time.time()
+    while not job.is_finished():
+        try:
+            client_message = shared_result_q.get(timeout=STATUS_INTERVAL)
+            handle_client_message(client_message, coordinator, estimator, queue_depth)
+        except Empty:
+            pass
+        except FRAME_ERRORS as e:
+            # a malformed frame must not stop the server
+            print("\nIgnored a malformed frame: {0}".format(e))
+        requeue_lost_clients(coordinator, estimator)
+        if time.time() - last_report >= REPORT_INTERVAL and not job.is_finished():
+            last_report = time.time()
+            print_progress(coordinator, estimator)
+
+    stop_coordinator(manager, producer, stop_producer)
+    return job.results, job.elapsed_time()
+
+def runcoordinator(chunk_size = 50, jobs = (), repeat = False):
+    """Run a manager server that accepts code breaking jobs from submitters
+    (see submit_job()) and shares them amongst the connected clients
+
+    Clients stay connected between the jobs. Progress of every job is
+    published for the submitters every STATUS_INTERVAL seconds and printed
+    every REPORT_INTERVAL seconds.
+    Runs until interrupted with Ctrl+C.
+
+    :param chunk_size: number of Enigma settings in a work unit
+    :param jobs: (encrypted text, crib, settings[, priority]) of jobs to start with
+    :param repeat: submit every finished job again with the same settings
+    :return:
+    """
 
-    # Sleep a bit before shutting down the server - to give clients time to
-    # realize the job queue is empty and exit in an orderly way.
-    time.sleep(2)
-    manager.shutdown()
-    return results, end_time-start_time
\ No newline at end of file
+    coordinator = Coordinator(chunk_size)
+    for job in jobs:
+        coordinator.submit(*job)
+    manager, producer, stop_producer, estimator, queue_depth = start_coordinator(coordinator)
+    shared_result_q = manager.get_result_q()
+    submit_q = manager.get_submit_q()
+    status = manager.get_status()
+
+    reported = set()
+    last_status = 0
+    last_report = time.time()
+    try:
+        while True:
+            # accept newly submitted jobs:
+            while True:
+                try:
+                    submission = submit_q.get_nowait()
+                except Empty:
+                    break
+                try:
+                    job_id = coordinator.submit(**submission)
+                    print("\nJob {0} submitted with priority {1}".format(job_id, submission.get("priority", 1)))
+                except Exception as e:
+                    # a job with invalid settings must not stop the other jobs
+                    status[submission.get("job_id")] = {"finished": True, "error": str(e)}
+
+            try:
+                client_message = shared_result_q.get(timeout=STATUS_INTERVAL)
+                handle_client_message(client_message, coordinator, estimator, queue_depth)
+            except Empty:
+                pass
+            except FRAME_ERRORS as e:
+                # a malformed frame must not stop the other jobs
+                print("\nIgnored a malformed frame: {0}".format(e))
+            requeue_lost_clients(coordinator, estimator)
+
+            if time.time() - last_report >= REPORT_INTERVAL:
+                last_report = time.time()
+                print_progress(coordinator, estimator)
+            if time.time() - last_status < STATUS_INTERVAL:
+                continue
+            last_status = time.time()
+            for job_id, job_status in coordinator.status().items():
+                if job_id in reported:
+                    continue
+                status[job_id] = job_status
+                if job_status["finished"]:
+                    print("\nJob {0} finished in {1} seconds".format(job_id, round(job_status["time"])))
+                    print_results(job_status["results"])
+                    reported.add(job_id)
+                    if repeat:
+                        job = coordinator.jobs[job_id]
+                        coordinator.submit(job.encrypted_text, job.crib, job.config_string, job.priority,
+                                           prior=job.prior, stop_score=job.stop_score)
+    except KeyboardInterrupt:
+        pass
+    stop_coordinator(manager, producer, stop_producer)
+
+def submit_job(srv_ip, encrypted_text, crib, config_string, priority = 1, prior = None, stop_score = None):
+    """Submit a code breaking job to a running coordinator (see runcoordinator()
+    and BreakingJob for the prior and stop_score)
+
+    :return: id of the submitted job
+    """
+
+    manager = make_client_manager(srv_ip, PORTNUM, AUTHKEY)
+    job_id = uuid.uuid4().hex[:8]
+    manager.get_submit_q().put({"job_id": job_id,
+                                "encrypted_text": encrypted_text,
+                                "crib": crib,
+                                "config_string": config_string,
+                                "priority": priority,
+                                "prior": prior,
+                                "stop_score": stop_score})
+    return job_id
+
+def wait_for_job(srv_ip, job_id, poll = STATUS_INTERVAL, timeout = None):
+    """Wait for a submitted job to finish and return its results and time
+
+    The results are a RankedResults of (hostname of the client that found
+    it, settings, plaintext[, reflector]) tuples.
+
+    :param timeout: seconds to wait before raising TimeoutError, None to wait
+                    as long as the job takes
+    """
+
+    status = make_client_manager(srv_ip, PORTNUM, AUTHKEY).get_status()
+    time_start = time.time()
+    while True:
+        job_status = status.get(job_id)
+        if job_status and job_status["finished"]:
+            if "error" in job_status:
+                raise ValueError(job_status["error"])
+            results = RankedResults(max(TOP_RESULTS, len(job_status["results"])))
+            for score, result in zip(job_status["scores"], job_status["results"]):
+                results.add(score, tuple(result))
+            results.discarded = job_status["discarded"]
+            return results, job_status["time"]
+        if timeout is not None and time.time() - time_start >= timeout:
+            raise TimeoutError("Job {0} not finished after {1} seconds".format(job_id, timeout))
+        time.sleep(poll)
@@ -0,0 +1,193 @@
+from code_breaking_ngrams import *
+import random
+import multiprocessing as mp    # restarts in a pool of processes
+
+#   Recovering an unknown plugboard by hill climbing
+#
+#   With the rotor settings known (or narrowed down to a few candidates, see
+#   code_breaking_ioc) the plugboard is found by changing it one lead at a
+#   time: leads are added, removed or their plugs swapped as long as the
+#   decrypted text scores better with the n-gram model (see
+#   code_breaking_ngrams). The rotors are the same for every plugboard so
+#   their permutation of every step is computed only once and a change of
+#   the plugboard is rescored only at the steps where a changed letter goes
+#   in or comes out of the rotors. Restarts from different random orders of
+#   trying the leads run in a pool of processes.
+#
+#       recover_plugboard(encrypted_text, rotor_configs, restarts = 8, max_leads = 10, processes = 0, model = None)
+#       hill_climb_plugboard(encrypted_text, rotor_config, seed = 0, max_leads = 10, model = None)
+#
+
+MAX_LEADS = 10          # number of leads used with a military Enigma
+
+
+class PlugboardClimber:
+    """Decrypted text of a message and its score for a changing plugboard"""
+
+    def __init__(self, cnf, codes, model, plugs = ()):
+        """
+        :param cnf: EnigmaConfig with the rotor settings
+        :param codes: encrypted message as bytes of letter codes
+        :param model: NgramModel scoring the decrypted text
+        :param plugs: initial leads, e.g. ["AB", "CD"]
+        """
+
+        self.model = model
+        self.codes = codes
+        self.perms = Enigma(EnigmaConfig(cnf.reflector, cnf.rotors, cnf.rotors_pos, cnf.ring_settings, []))\
+            .scrambler_permutations(len(codes))
+        # the leads are tried by editing the table of the plugboard:
+        self.plugboard = Plugboard(plugs)
+        self.plug = self.plugboard.table
+        # steps where a letter goes into the rotors (never changes) and comes
+        # out of the rotors (changes with the plugboard):
+        self.steps_in = [[] for letter in range(26)]
+        self.steps_out = [set() for letter in range(26)]
+        self.rotors_out = bytearray(len(codes))
+        for step, (perm, code) in enumerate(zip(self.perms, codes)):
+            self.steps_in[code].append(step)
+            self.rotors_out[step] = perm[self.plug[code]]
+            self.steps_out[self.rotors_out[step]].add(step)
+        self.plain = bytearray(self.rotors_out.translate(bytes(self.plug) + bytes(range(26, 256))))
+        self.score = model.score(self.plain)
+
+    def leads(self):
+        return self.plugboard.leads()
+
+    def _changes(self, plug, letters):
+        """Return the decrypted letters that change with a new plugboard"""
+
+        steps = set()
+        for letter in letters:
+            steps.update(self.steps_in[letter])
+            steps.update(self.steps_out[letter])
+        changes = {}
+        for step in steps:
+            out = self.perms[step][plug[self.codes[step]]]
+            changes[step] = (out, plug[out])
+        return changes
+
+    def delta(self, plug, letters):
+        """Return the change of the score for a new plugboard
+
+        :param plug: plugboard as 26 letter codes
+        :param letters: letters plugged differently than now
+        :return: change of the score, changes to apply (see apply())
+        """
+
+        changes = self._changes(plug, letters)
+        n = self.model.n
+        table = self.model.table
+        plain = self.plain
+        last = len(plain) - n
+        starts = set()
+        for step in changes:
+            starts.update(range(max(0, step - n + 1), min(step, last) + 1))
+        delta = 0.0
+        for start in starts:
+            old = new = 0
+            for step in range(start, start + n):
+                old = old * 26 + plain[step]
+                new = new * 26 + (changes[step][1] if step in changes else plain[step])
+            delta += table[new] - table[old]
+        return delta * self.model.scale, changes
+
+    def apply(self, plug, delta, changes):
+        for step, (out, letter) in changes.items():
+            self.steps_out[self.rotors_out[step]].discard(step)
+            self.steps_out[out].add(step)
+            self.rotors_out[step] = out
+            self.plain[step] = letter
+        self.plug[:] = plug
+        self.score += delta
+
+def plugboard_moves(plug, a, b, fixed):
+    """Yield new plugboards changing the leads of letters a and b
+
+    :param plug: plugboard as 26 letter codes
+    :param fixed: letters of known leads that cannot change
+    :return: generator of (new plugboard, letters plugged differently)
+    """
+
+    if a in fixed or b in fixed:
+        return
+    pa, pb = plug[a], plug[b]
+    if pa == b:
+        # remove the lead
+        new = bytearray(plug)
+        new[a], new[b] = a, b
+        yield new, (a, b)
+        return
+    new = bytearray(plug)
+    # unplug the old partners and plug a to b:
+    new[pa], new[pb] = pa, pb
+    new[a], new[b] = b, a
+    yield new, {a, b, pa, pb}
+    if pa != a and pb != b:
+        # also try plugging the old partners to each other
+        new = bytearray(new)
+        new[pa], new[pb] = pb, pa
+        yield new, {a, b, pa, pb}
+
+def hill_climb_plugboard(encrypted_text, rotor_config, seed = 0, max_leads = MAX_LEADS, model = None):
+    """Find the plugboard giving the best scoring decrypted text
+
+    Known leads of the config are kept, all the other letters are free.
+
+    :param encrypted_text:
+    :param rotor_config: Enigma settings, e.g. "B Beta-I-III 23-2-10 I-M-G VH-PT"
+    :param seed: random order of trying the leads
+    :param max_leads: most leads used
+    :param model: NgramModel, default_model() if not given
+    :return: score, Enigma settings
+    """
+
+    model = model or default_model()
+    rng = random.Random(seed)
+    cnf = EnigmaConfig.from_config_string(rotor_config)
+    fixed = set()
+    for lead in cnf.plugs:
+        fixed.update(text_to_codes(lead))
+    climber = PlugboardClimber(cnf, text_to_codes(encrypted_text), model, cnf.plugs)
+    pairs = [(a, b) for a in range(26) for b in range(a + 1, 26)]
+    improved = True
+    while improved:
+        improved = False
+        rng.shuffle(pairs)
+        for a, b in pairs:
+            best = None
+            for plug, letters in plugboard_moves(climber.plug, a, b, fixed):
+                if sum(1 for letter in range(26) if plug[letter] > letter) > max_leads:
+                    continue
+                delta, changes = climber.delta(plug, letters)
+                if delta > 1e-9 and (best is None or delta > best[1]):
+                    best = (plug, delta, changes)
+            if best:
+                climber.apply(*best)
+                improved = True
+    solution = EnigmaConfig(cnf.reflector, cnf.rotors, cnf.rotors_pos, cnf.ring_settings, sorted(climber.leads()))
+    return climber.score, str(solution)
+
+def recover_plugboard(encrypted_text, rotor_configs, restarts = 8, max_leads = MAX_LEADS, processes = 0, model = None):
+    """Hill climb the plugboards of one or more rotor settings
+
+    :param encrypted_text:
+    :param rotor_configs: list of Enigma settings (known leads are kept)
+    :param restarts: number of climbs of every rotor setting
+    :param max_leads: most leads used
+    :param processes: number of processes to use. 0 = all, 1 = no pool
+    :param model: NgramModel, default_model() if not given
+    :return: list of (score, Enigma settings, decrypted text), best first
+    """
+
+    climbs = [(encrypted_text, config, seed, max_leads, model)
+              for config in rotor_configs for seed in range(restarts)]
+    processes = processes or mp.cpu_count()
+    if processes == 1:
+        found = [hill_climb_plugboard(*climb) for climb in climbs]
+    else:
+        with mp.Pool(processes) as pool:
+            found = pool.starmap(hill_climb_plugboard, climbs)
+    codes = text_to_codes(encrypted_text)
+    return [(score, config, codes_to_text(decrypt_codes(EnigmaConfig.from_config_string(config), codes)))
+            for score, config in sorted(set(found), reverse=True)]
@@ -0,0 +1,144 @@
+from code_breaking_utils import *
+from code_breaking_hillclimb import recover_plugboard
+import heapq                    # bounded list of the best rotor settings
+import multiprocessing as mp    # scoring in a pool of processes
+
+#   Ciphertext-only Enigma code breaking (no crib needed)
+#
+#   Text decrypted with the wrong rotor settings looks like random letters
+#   while the right rotor settings give a text with a letter frequency closer
+#   to a language, even when the plugboard is not known yet. Every rotor
+#   setting is scored by the index of coincidence of the whole message
+#   decrypted without the unknown plugs and only the best few are kept. Then
+#   the plugboard options of the config are tried on these and the
+#   plugboards are ranked by the same score. A plugboard with unknown leads
+#   (a lead of a single question mark, e.g. 'C II-Gamma-IV 24-8-20 ?-?-? ?')
+#   is found by hill climbing instead (see code_breaking_hillclimb).
+#
+#   The whole message has to be decrypted for every rotor setting so the
+#   message is decrypted as bytes of letter codes with precomputed rotor
+#   permutations (see decrypt_codes()), in a pool of processes.
+#
+#       decrypt_cipher_ioc(encrypted_text, config_string, top = TOP_K, chunk_size = 2000, processes = 0)
+#       score_ioc_range(encrypted_text, config_string, start, stop, top = TOP_K)
+#       recover_plugboard_ioc(encrypted_text, rotor_config, config_string, top = TOP_K)
+#
+
+TOP_K = 10              # number of rotor settings kept for the plugboard recovery
+
+
+def known_leads_settings(config_string):
+    """Return the config string with only the known leads of the plugboard"""
+
+    config_parts = config_string.split()
+    if len(config_parts) > 4:
+        leads = [lead for lead in config_parts[4].split('-') if "?" not in lead and "[" not in lead]
+        config_parts = config_parts[:4] + ["-".join(leads)] if leads else config_parts[:4]
+    return " ".join(config_parts)
+
+def score_ioc_range(encrypted_text, config_string, start, stop, top = TOP_K):
+    """Score the slice [start, stop) of the rotor settings of a config by the
+    index of coincidence of the decrypted message
+
+    Only the known leads of the plugboard are used (see settings_in_range()
+    for the index of the rotor settings).
+
+    :param encrypted_text:
+    :param config_string: partially known Enigma settings
+    :param start: index of the first rotor setting
+    :param stop: index after the last rotor setting
+    :param top: number of best rotor settings to return
+    :return: list of (score, Enigma settings), best first
+    """
+
+    codes = text_to_codes(encrypted_text)
+    cores = {}
+    best = []           # heap of the top scores, the worst one first
+    for inx, cnf in enumerate(settings_in_range(known_leads_settings(config_string), start, stop)):
+        score = index_of_coincidence(decrypt_codes(cnf, codes, cores.setdefault((cnf.reflector, tuple(cnf.rotors)), {})))
+        if len(best) < top:
+            heapq.heappush(best, (score, -inx, str(cnf)))
+        elif score > best[0][0]:
+            heapq.heappushpop(best, (score, -inx, str(cnf)))
+    return [(score, config) for score, inx, config in sorted(best, reverse=True)]
+
+def recover_plugboard_ioc(encrypted_text, rotor_config, config_string, top = TOP_K):
+    """Try the plugboard options of a config on the rotor settings found by
+    score_ioc_range()
+
+    :param encrypted_text:
+    :param rotor_config: Enigma settings found by score_ioc_range()
+    :param config_string: partially known Enigma settings
+    :param top: number of best plugboards to return
+    :return: list of (score, Enigma settings, decrypted text), best first
+    """
+
+    rotors = " ".join(rotor_config.split()[:4])
+    config_parts = config_string.split()
+    if len(config_parts) > 4:
+        rotors += " " + config_parts[4]
+    codes = text_to_codes(encrypted_text)
+    cores = {}
+    best = []
+    for inx, cnf in enumerate(settings_in_range(rotors, 0, count_settings(rotors))):
+        score = index_of_coincidence(decrypt_codes(cnf, codes, cores))
+        if len(best) < top:
+            heapq.heappush(best, (score, -inx, str(cnf)))
+        elif score > best[0][0]:
+            heapq.heappushpop(best, (score, -inx, str(cnf)))
+    return [(score, config, codes_to_text(decrypt_codes(EnigmaConfig.from_config_string(config), codes)))
+            for score, inx, config in sorted(best, reverse=True)]
+
+def decrypt_cipher_ioc(encrypted_text, config_string, top = TOP_K, chunk_size = 2000, processes = 0):
+    """Attempt to break Enigma cypher without a crib
+
+    Example input:
+       encrypted_text:
+       CMFSUPKNCBMUYEQVVDYKLRQZTPUFHSWWAKTUGXMPAMYAFITXIJKMH
+       enigma_config
+       B Beta-I-III 23-2-10 ?-?-? VH-PT-ZG-BJ-?Y-FS
+
+    All rotor settings of the config are scored by the index of coincidence
+    of the message decrypted without the unknown plugs. The best "top" of
+    them get all the plugboard options of the config tried. A short message
+    has a noisy score so the solutions are ranked again by the plausibility
+    of their text (see plausibility()).
+
+    :param encrypted_text:
+    :param config_string:
+    :param top: number of rotor settings to keep (and solutions to return)
+    :param chunk_size: number of rotor settings scored at once by a process
+    :param processes: number of processes to use. 0 = all, 1 = no pool
+    :return: RankedResults of (Enigma settings, decrypted text), time
+    """
+    time_start = time.time()
+
+    if not encrypted_text:
+        raise ValueError('Expected some code to break.')
+
+    count = count_settings(known_leads_settings(config_string))
+    processes = processes or mp.cpu_count()
+    print("\nScoring {0} rotor settings by index of coincidence in {1} processes.".format(count, processes))
+
+    chunks = [(encrypted_text, config_string, start, min(start + chunk_size, count), top)
+              for start in range(0, count, chunk_size)]
+    if processes == 1:
+        scored = [score_ioc_range(*chunk) for chunk in chunks]
+    else:
+        with mp.Pool(processes) as pool:
+            scored = pool.starmap(score_ioc_range, chunks)
+    best = heapq.nlargest(top, itertools.chain.from_iterable(scored), key=lambda candidate: candidate[0])
+
+    # plugboard recovery for the best rotor settings:
+    config_parts = config_string.split()
+    if len(config_parts) > 4 and "?" in config_parts[4].split('-'):
+        solutions = recover_plugboard(encrypted_text, [rotor_config for score, rotor_config in best],
+                                      processes=processes)
+    else:
+        solutions = []
+        for score, rotor_config in best:
+            solutions += recover_plugboard_ioc(encrypted_text, rotor_config, config_string, top)
+    results = RankedResults(top)
+    for score, config, text in solutions:
+        results.add(plausibility(text), (config, text))
+    return results, time.time() - time_start
@@ -1,7 +1,10 @@
 from code_breaking_utils import *
+from code_breaking_prior import *
 import time                     # for measuring time required to break the code
 import multiprocessing as mp    # code breaking in a pool of processwes
+from multiprocessing.pool import ThreadPool    # code breaking in a pool of threads
 import itertools                # special case: scrambling reflector
+from collections import deque   # ranges queued in the pool
 #
 #
 #   This is the improved Enigma brute force code breaking that runs in a
@@ -15,7 +18,13 @@ import itertools                # special case: scrambling reflector
 #   Function decrypt_cipher_multiproc finds Enigma configuration based on encrypted
 #   text, crib and a partially known configuration and using all processor cores:
 #
-#       decrypt_cipher_multiproc(encrypted_text, crib, config_string, chunk_size = 50)
+#       decrypt_cipher_multiproc(encrypted_text, crib, config_string, chunk_size = 50, prior = None, stop_score = None, cache = None)
+#
+#   Function decrypt_cipher_threads does the same in a pool of threads sharing
+#   the compiled Enigma tables (see encode()), nothing is pickled. It scales on
+#   free-threaded builds of Python and can run next to a pool of processes:
+#
+#       decrypt_cipher_threads(encrypted_text, crib, config_string, chunk_size = 50, prior = None, stop_score = None, threads = 0, cache = None)
 #
 #
 #   Function decrypt_cipher_reflector_scrambled_multiproc (special case related to my uni
@@ -25,7 +34,10 @@ import itertools                # special case: scrambling reflector
 #       decrypt_cipher_reflector_scrambled_multiproc(encrypted_text, crib, enigma_config, chunk_size = 50)
 #
 
-def decrypt_cipher_multiproc(encrypted_text, crib, config_string, chunk_size = 50):
+UNITS_IN_FLIGHT = 4     # ranges queued in a pool per CPU core
+
+def decrypt_cipher_multiproc(encrypted_text, crib, config_string, chunk_size = 50, prior = None, stop_score = None,
+                            cache = None):
     """Attempt to break Enigma cypher with a known crib and partially known config
     using multiple processor cores
 
@@ -39,59 +51,118 @@ def decrypt_cipher_multiproc(encrypted_text, crib, config_string, chunk_size = 5
     To understand how to specify the partially known or unknown Enigma config
     read the description of the all_enigma_settings_candidates() function.
 
-    After all possible Enigma settings are constructed each setting is tried on a crib
-    until such Enigma setting is found that the complete crib matches the encoded text.
-    Such Enigma setting is put on a list of possible candidates along with the decrypted
-    text. A human must then go through this list to decide if any of the potential settings
-    are correct.
+    The search space is never constructed, the processes search ranges of it
+    (see configs_in_range()), the most likely ones first if a prior is given
+    (see prior_work_units()). Every Enigma setting that encodes the crib
+    correctly is put on a list of possible candidates along with the decrypted
+    text. A human must then go through this list to decide if any of the
+    potential settings are correct.
 
     :param encrypted_text:
     :param crib:
     :param config_string:
+    :param chunk_size: number of Enigma settings in a range
+    :param prior: SettingsPrior to search the most likely settings first
+    :param stop_score: stop once a solution is at least this plausible (see
+                       PLAUSIBLE_SCORE), None to search everything
+    :param cache: ResultCache of earlier jobs (see code_breaking_cache)
     :return:
     """
     time_start = time.time()
 
+    print("\nDistributed amongst {0} processes to find solutions.".format(mp.cpu_count()))
+    with mp.Pool(mp.cpu_count()) as pool:
+        potential_configs = search_in_pool(pool, encrypted_text, crib, config_string, chunk_size, prior, stop_score,
+                                           cache=cache)
+    return potential_configs, time.time() - time_start
+
+def decrypt_cipher_threads(encrypted_text, crib, config_string, chunk_size = 50, prior = None, stop_score = None,
+                           threads = 0, cache = None):
+    """Attempt to break Enigma cypher with a known crib and partially known config
+    in a pool of threads (see decrypt_cipher_multiproc())
+
+    The threads share the tables of the compiled Enigma settings (see
+    CompiledEnigma) and encode with the pure encode() function, so nothing is
+    pickled and no thread changes what another one reads. Without the global
+    interpreter lock (free-threaded builds) the threads run in parallel.
+
+    :param encrypted_text:
+    :param crib:
+    :param config_string:
+    :param chunk_size: number of Enigma settings in a range
+    :param prior: SettingsPrior to search the most likely settings first
+    :param stop_score: stop once a solution is at least this plausible (see
+                       PLAUSIBLE_SCORE), None to search everything
+    :param threads: number of threads to use. 0 = one per CPU core
+    :param cache: ResultCache of earlier jobs (see code_breaking_cache)
+    :return: RankedResults, time
+    """
+    time_start = time.time()
+
+    threads = threads or mp.cpu_count()
+    print("\nDistributed amongst {0} threads to find solutions.".format(threads))
+    with ThreadPool(threads) as pool:
+        potential_configs = search_in_pool(pool, encrypted_text, crib, config_string, chunk_size, prior, stop_score,
+                                           cores={}, cache=cache)
+    return potential_configs, time.time() - time_start
+
+def search_in_pool(pool, encrypted_text, crib, config_string, chunk_size = 50, prior = None, stop_score = None,
+                   cores = None, cache = None):
+    """Search ranges of the settings (see check_enigma_config_range()) in a
+    pool of processes or threads
+
+    Only UNITS_IN_FLIGHT ranges per CPU core are queued in the pool at a
+    time, so once a solution is plausible enough (stop_score) the ranges not
+    queued yet, the least likely ones with a prior, are never searched.
+
+    :param pool: multiprocessing.Pool or multiprocessing.pool.ThreadPool
+    :param cores: dict of the tables of the wheels shared by threads, None for processes
+    :param cache: ResultCache of earlier jobs, only the ranges it does not
+                  know are searched and the searched ones are added to it
+    :return: RankedResults
+    """
+
     if encrypted_text is None or len(encrypted_text) < len(crib):
         raise ValueError('Expected some code to break.')
     if not crib:
         raise ValueError('Expected a crib.')
 
-    # Construct all possible Enigma settings based on unknown / partially known
-    # Enigma configuration provided:
-    enigma_configs = all_possible_settings(config_string)
+    if prior is not None:
+        config_string = prior_config_string(config_string, prior)
     # Slide the crib under the encrypted text and determine all positions in
     # which the letter of the crib does not match the encrypted text
     # (Enigma can never encode a letter into itself)
     crib_positions = possible_crib_positions(encrypted_text, crib)
+    total = count_settings(config_string) * len(crib_positions)
 
-    print("\nDistributed amongst {0} processes to find solutions.".format(mp.cpu_count()))
-    print("Searching through {0} Enigma settings split in chunks of {1}".format(len(enigma_configs) * len(crib_positions), chunk_size))
+    print("Searching through {0} Enigma settings split in chunks of {1}".format(total, chunk_size))
 
-    # Loop through all potential Enigma settings and try to decrypt the crib:
-    potential_configs = []
-    pool = mp.Pool(mp.cpu_count())
-    batch_count = 0
-    batch = []
-    batches_count = 0
-    results = []
-    for pos in crib_positions:
-        for cnf in enigma_configs:
-            batch.append((cnf,pos))
-            batch_count += 1
-            if batch_count >= chunk_size:
-                batches_count += 1
-                results.append(pool.apply_async(check_enigma_config, args=(batch, crib, encrypted_text)))
-                batch_count = 0
-                batch = []
-
-    # Wait for all the processes to finish and collect results:
-    for r in results:
-        result = r.get()
-        if(result): # (list of configs, time)
-            potential_configs = list(itertools.chain(potential_configs, result))
-    pool.close()
-    return [cnf for cnf in potential_configs if cnf], time.time() - time_start
+    # Ranges are handed out in order, results are collected in the same order:
+    known = cache.lookup(encrypted_text, crib, config_string) if cache is not None else None
+    potential_configs = known.results if known is not None else RankedResults()
+    units = prior_work_units(config_string, len(crib_positions), prior, chunk_size)
+    if known is not None:
+        units = (part for start, stop in units for part in known.missing(start, stop))
+    in_flight = UNITS_IN_FLIGHT * mp.cpu_count()
+    results = deque()
+
+    # Wait for the workers and keep the most plausible results:
+    searched = []
+    while True:
+        # keep the pool busy with the next ranges:
+        for start, stop in itertools.islice(units, in_flight - len(results)):
+            results.append(((start, stop), pool.apply_async(check_enigma_config_range,
+                                                            args=(encrypted_text, crib, config_string, start, stop, cores))))
+        if not results:
+            break
+        unit, r = results.popleft()
+        potential_configs.merge(r.get())
+        searched.append(unit)
+        if stop_score is not None and potential_configs and -potential_configs.scores[0] >= stop_score:
+            break
+    if cache is not None:
+        cache.store(encrypted_text, crib, config_string, searched, potential_configs)
+    return potential_configs
 
 def decrypt_cipher_reflector_scrambled_multiproc(encrypted_text, crib, enigma_config, chunk_size = 50):
     """Attempt to break Enigma cypher with a known crib and a reflector that
@@ -113,9 +184,10 @@ def decrypt_cipher_reflector_scrambled_multiproc(encrypted_text, crib, enigma_co
     permutations were constructed in docstring here:
         permutate_reflector_by_wire_swap()
 
-    Every Enigma setting with every possible reflector permutation will be tried
-    until the encoded crib matches the encoded text. Such Enigma setting is put
-    on a list of possible candidates along with the decrypted text. A human must
+    Every Enigma setting is tried with all the reflector permutations at once
+    (see check_reflector_variants()). Such Enigma settings that encode the crib
+    correctly are put on a list of possible candidates along with the decrypted
+    text and the reflector wiring, the most plausible text first. A human must
     then go through this list to decide if any of the potential settings are
     correct.
 
@@ -127,40 +199,26 @@ def decrypt_cipher_reflector_scrambled_multiproc(encrypted_text, crib, enigma_co
     time_start = time.time()
 
     crib_positions = possible_crib_positions(encrypted_text, crib)
-    enigma_configs = all_possible_settings(enigma_config)
+    enigma_configs = list(all_possible_settings(enigma_config))
+    wirings = len(reflector_variants(Rotor.supported_rotors['B']))
 
     print("\nDistributed amongst {0} processes in chunks of {1} to find solutions.".format(mp.cpu_count(), chunk_size))
     print("\nReflector has two wires swapped.")
-    print("{0} settings (4290 reflector wirings) to search".format(len(enigma_configs) * 4290 * len(crib_positions)))
+    print("{0} settings ({1} reflector wirings) to search".format(len(enigma_configs) * wirings * len(crib_positions),
+                                                              wirings))
 
+    # every process tests all the reflector wirings of a chunk of settings:
     pool = mp.Pool(mp.cpu_count())
-    chunk = []
-    chunks_count = 0
-    configs_count = 0
-    results = []
-    potential_configs = []
-    for cnf in enigma_configs:
-        enigma_instance = Enigma(cnf)
-        l = permutate_reflector_by_wire_swap("".join(enigma_instance.rotors[-1].left_pins), 2)
-        #print("Checking enigma config={0} with {1} reflector wirings".format(enigma_instance.print_state(), len(l)))
-        for pos in crib_positions:
-            for reflector_option in l:
-                chunk.append((cnf, pos, reflector_option))
-                configs_count += 1
-                if configs_count >= chunk_size:
-                    chunks_count += 1
-                    results.append(pool.apply_async(check_enigma_config, args=(chunk, crib, encrypted_text)))
-                    configs_count = 0
-                    chunk = []
-
-    # Wait for all the processes to finish and collect results:
+    results = [pool.apply_async(check_reflector_variants, args=(encrypted_text, crib, enigma_configs[start:start + chunk_size]))
+               for start in range(0, len(enigma_configs), chunk_size)]
+
+    # Wait for all the processes to finish and keep the most plausible results:
+    potential_configs = RankedResults()
     for r in results:
-        result = r.get()
-        if (result):  # (list of configs, time)
-            potential_configs = list(itertools.chain(potential_configs, result))
+        potential_configs.merge(r.get())
 
     pool.close()
-    return [cnf for cnf in potential_configs if cnf], time.time() - time_start
+    return potential_configs, time.time() - time_start
 
 # ---------------------------
 # ---------------------------
@@ -0,0 +1,201 @@
+import os
+import re
+import sys
+import math
+import mmap                     # tables shared by all the processes
+import struct
+import hashlib
+import functools
+from array import array         # compact table of log probabilities
+from code_breaking_utils import *
+
+#   Letter n-gram language model for scoring candidate plaintexts
+#
+#   The log probability of every n-gram of letters is kept in a dense table
+#   indexed by the letter codes of the n-gram as a number in base 26, e.g.
+#   the trigram THE has the index 19 * 26 * 26 + 7 * 26 + 4. A text is
+#   scored by the sum of the log probabilities of all its n-grams, the
+#   higher the score the more the text looks like the language of the corpus.
+#   Without numpy there are no vectorized gathers: a single pass over the
+#   letter codes keeps the index of the current n-gram (index * 26 + code)
+#   and reads the table an entry at a time. Gathering slices of precomputed
+#   indices with map() runs slower than this loop in CPython.
+#
+#   Tables are saved to a binary file (a small header followed by the
+#   table as little endian float32 or int16 numbers) and opened with mmap,
+#   so every worker process and distributed client on a machine shares the
+#   same table in the page cache instead of loading its own copy. A model
+#   sent to a pool worker is pickled as the path of its file.
+#
+#       model = default_model(n = 3)            # of DEFAULT_CORPUS, built once in cache_dir()
+#       bigrams, quadgrams = default_model(2), default_model(4)
+#       model.score(text_to_codes("HELLOWORLD"))
+#
+#       build_ngram_file(path, text, n = 4, typecode = 'h')
+#       model = open_ngram_model(path)
+#
+
+# Pinned English prose, never trained from the documentation so the scores
+# (and the solutions ranked by them) do not change with it
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_files', 'english_corpus.txt')
+
+# magic, format version, n, typecode ('f' float32, 'h' int16), reserved,
+# scale of the numbers, number of n-grams:
+NGRAM_HEADER = struct.Struct("<4sBBBxdQ")
+NGRAM_MAGIC = b"ENGR"
+NGRAM_VERSION = 1
+
+
+def corpus_letters(text):
+    """Return the letters of the prose of a text (code blocks and long
+    strings of letters like ciphertexts are skipped)"""
+
+    text = re.sub(r"```.*?```", " ", text, flags=re.DOTALL)
+    words = [word for word in re.findall(r"[A-Za-z]+", text) if len(word) <= 15]
+    return "".join(words).upper()
+
+class NgramModel:
+    """Log probabilities of letter n-grams"""
+
+    def __init__(self, n, table, scale = 1.0, path = None):
+        """
+        :param n: length of the n-grams
+        :param table: log10 probability of every n-gram (26 ** n numbers)
+                      divided by scale
+        :param scale: factor of the numbers of the table (int16 tables)
+        :param path: file the table is mapped from, if any
+        """
+
+        if len(table) != 26 ** n:
+            raise ValueError("Expected {0} log probabilities of {1}-grams".format(26 ** n, n))
+        self.n = n
+        self.table = table
+        self.scale = scale
+        self.path = path
+
+    @classmethod
+    def from_text(cls, text, n = 3):
+        """Count the n-grams of a text of capital letters
+
+        N-grams that do not appear in the text get a probability of a hundredth
+        of a single occurrence.
+        """
+
+        size = 26 ** n
+        counts = [0] * size
+        index = 0
+        for inx, code in enumerate(text_to_codes(text)):
+            index = (index * 26 + code) % size
+            if inx >= n - 1:
+                counts[index] += 1
+        total = max(1, sum(counts))
+        floor = math.log10(0.01 / total)
+        return cls(n, array('f', [math.log10(count / total) if count else floor for count in counts]))
+
+    def __reduce__(self):
+        # worker processes map the same file instead of copying the table
+        if self.path:
+            return open_ngram_model, (self.path,)
+        return NgramModel, (self.n, self.table, self.scale)
+
+    def index(self, codes, start):
+        """Return the table index of the n-gram at start of the letter codes"""
+
+        index = 0
+        for code in codes[start:start + self.n]:
+            index = index * 26 + code
+        return index
+
+    def score(self, codes):
+        """Return the sum of the log probabilities of all the n-grams of a text
+
+        :param codes: bytes of letter codes (see text_to_codes())
+        :return: float
+        """
+
+        table = self.table
+        size = len(table)
+        n = self.n
+        index = 0
+        score = 0
+        for inx, code in enumerate(codes):
+            index = (index * 26 + code) % size
+            if inx >= n - 1:
+                score += table[index]
+        return score * self.scale
+
+def save_ngram_model(model, path, typecode = 'f'):
+    """Save the table of a model to a file (see open_ngram_model())
+
+    :param model: NgramModel
+    :param path: file name
+    :param typecode: 'f' float32 or 'h' int16 (half the size, 0.01 precision)
+    :return:
+    """
+
+    values = [value * model.scale for value in model.table]
+    if typecode == 'h':
+        scale = min(values) / -32767
+        table = array('h', [round(value / scale) for value in values])
+    elif typecode == 'f':
+        scale = 1.0
+        table = array('f', values)
+    else:
+        raise ValueError("Unsupported table type {0}".format(typecode))
+    if sys.byteorder == 'big':
+        table.byteswap()
+    # write to a temporary file first so no process maps a half written table
+    temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(temp_path, 'wb') as table_file:
+        table_file.write(NGRAM_HEADER.pack(NGRAM_MAGIC, NGRAM_VERSION, model.n, ord(typecode), scale, len(table)))
+        table_file.write(table.tobytes())
+    os.replace(temp_path, path)
+
+def build_ngram_file(path, text, n = 3, typecode = 'f'):
+    """Count the n-grams of a corpus and save them (see NgramModel.from_text())"""
+
+    save_ngram_model(NgramModel.from_text(corpus_letters(text), n), path, typecode)
+
+def open_ngram_model(path):
+    """Map the table of a model saved by save_ngram_model() into memory
+
+    :param path: file name
+    :return: NgramModel
+    """
+
+    with open(path, 'rb') as table_file:
+        mapped = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, n, typecode, scale, count = NGRAM_HEADER.unpack_from(mapped)
+    if magic != NGRAM_MAGIC or version != NGRAM_VERSION:
+        raise ValueError("{0} is not an n-gram table".format(path))
+    table = memoryview(mapped)[NGRAM_HEADER.size:].cast(chr(typecode))
+    if len(table) != count:
+        raise ValueError("{0} is truncated".format(path))
+    if sys.byteorder == 'big':
+        # the file is little endian, a copy is the only way to use it here
+        table = array(chr(typecode), table)
+        table.byteswap()
+    return NgramModel(n, table, scale, path)
+
+@functools.lru_cache(maxsize=4)
+def default_model(n = 3, typecode = 'f'):
+    """Return the n-gram model of the pinned English corpus (see DEFAULT_CORPUS)
+
+    A table is built for every length of n-grams asked for, e.g. 2 for
+    bigrams or 4 for quadgrams (a 1.8 MB float32 table).
+
+    The table is built only once and kept in cache_dir() under the hash of
+    the corpus, so it is the same on every machine and for every version of
+    the documentation. Without a writable cache directory the table is kept
+    in the memory of the process.
+    """
+
+    with open(DEFAULT_CORPUS, 'rb') as corpus:
+        text = corpus.read()
+    try:
+        path = os.path.join(cache_dir(), "ngrams-{0}{1}-{2}.bin".format(n, typecode, hashlib.sha1(text).hexdigest()[:12]))
+        if not os.path.exists(path):
+            build_ngram_file(path, text.decode(), n, typecode)
+    except OSError:
+        return NgramModel.from_text(corpus_letters(text.decode()), n)
+    return open_ngram_model(path)
@@ -0,0 +1,214 @@
+from code_breaking_utils import *
+import math                     # log weights of the settings
+
+#   Best-first order of the search space
+#
+#   A brute force search finds the solution after searching half of the
+#   search space on average. Keys were not random though: operators had
+#   favourite wheel orders, ring settings were reused and some settings are
+#   simply known to be more likely. A prior (see SettingsPrior) estimates the
+#   likelihood of the settings from operator-provided weights, historical keys
+#   and common wheel orders. The search space is then searched best first:
+#
+#   prior_config_string(config_string, prior)
+#       the same search space with the options of every setting listed most
+#       likely first (see all_enigma_settings_candidates()), so ranges of it
+#       (see settings_in_range()) can still be handed out to any code breaker
+#
+#   prior_work_units(config_string, positions_count, prior = None, chunk_size = 50)
+#       (start, stop) ranges covering the search space exactly once, the
+#       most likely blocks of the search space first
+#
+#   The code breakers stop early once a solution scores at least stop_score
+#   (see plausibility(), PLAUSIBLE_SCORE). Without stop_score the whole search
+#   space is searched, only in a different order.
+#
+
+PLAUSIBLE_SCORE = -3.5      # plausibility() of a text very likely in a language
+COMMON_ORDER_WEIGHT = 4     # weight of a common wheel order relative to the other ones
+MAX_PRIOR_BLOCKS = 100000   # most blocks of the search space ordered by the prior
+
+
+class SettingsPrior:
+    """Estimated likelihood of Enigma settings
+
+    The weight of a setting is the product of the weights of its parts: the
+    reflector, the wheel order, every rotor, ring setting and rotor position.
+    A weight of a part is the operator-provided weight (1 if not given) times
+    one more than the number of historical keys that had it (in the same
+    place for rotors, rings and positions). Common wheel orders weigh
+    COMMON_ORDER_WEIGHT times more.
+
+    Example:
+        SettingsPrior(weights={"reflector": {"B": 5}, "ring": {1: 3}},
+                      history=["B II-IV-I 3-14-22 Q-E-V", "B I-II-III 1-1-1 A-A-A"],
+                      common_orders=["I-II-III", "II-IV-I"])
+    """
+
+    KINDS = ("reflector", "wheel_order", "rotor", "ring", "position")
+
+    def __init__(self, weights = None, history = (), common_orders = ()):
+        """Define a prior
+
+        :param weights: dict of kind ("reflector", "wheel_order", "rotor", "ring"
+                        or "position") => dict of value => weight, wheel orders
+                        are written as in a config string, e.g. "II-IV-I"
+        :param history: config strings (or EnigmaConfig) of historical keys
+        :param common_orders: common wheel orders, e.g. "II-IV-I"
+        """
+
+        weights = weights or {}
+        for kind in weights:
+            if kind not in self.KINDS:
+                raise ValueError("Unknown kind of setting {0}, expected one of {1}.".format(kind, self.KINDS))
+        self.weights = {kind: dict(weights.get(kind, {})) for kind in self.KINDS}
+        # wheel orders are kept right to left like EnigmaConfig.rotors:
+        self.weights["wheel_order"] = {tuple(order.split('-')[::-1]): weight
+                                       for order, weight in self.weights["wheel_order"].items()}
+        self.common_orders = set(tuple(order.split('-')[::-1]) for order in common_orders)
+        self.counts = {}
+        for key in history:
+            if isinstance(key, str):
+                key = EnigmaConfig.from_config_string(key)
+            self._count("reflector", None, key.reflector)
+            self._count("wheel_order", None, tuple(key.rotors))
+            for slot, (rotor, ring, position) in enumerate(zip(key.rotors, key.ring_settings, key.rotors_pos)):
+                self._count("rotor", slot, rotor)
+                self._count("ring", slot, int(ring))
+                self._count("position", slot, position)
+
+    def _count(self, kind, slot, value):
+        self.counts[kind, slot, value] = self.counts.get((kind, slot, value), 0) + 1
+
+    def weight(self, kind, value, slot = None):
+        """Return the weight of a part of the settings
+
+        :param kind: "reflector", "wheel_order", "rotor", "ring" or "position"
+        :param value: e.g. "B", ("I", "IV", "II") (right to left), "IV", 3, "Q"
+        :param slot: place of a rotor, ring or position, 0 is the right-most
+        :return: positive weight
+        """
+
+        weight = self.weights[kind].get(value, 1) * (1 + self.counts.get((kind, slot, value), 0))
+        if kind == "wheel_order" and value in self.common_orders:
+            weight *= COMMON_ORDER_WEIGHT
+        return weight
+
+    def dimension_weights(self, config_string):
+        """Return weight functions of the dimensions of the search space
+        (see settings_search_space()), None for the plugboard dimensions"""
+
+        rotors_count, dimensions = settings_search_space(config_string)
+        kinds = ([("reflector", None)]
+                 + [("rotor", slot) for slot in range(rotors_count)]
+                 + [("position", slot) for slot in range(rotors_count)]
+                 + [("ring", slot) for slot in range(rotors_count)])
+        kinds += [None] * (len(dimensions) - len(kinds))
+
+        def weight_of(kind, slot):
+            return lambda value: self.weight(kind, value, slot)
+
+        return [None if kind is None else weight_of(*kind) for kind in kinds]
+
+def prior_config_string(config_string, prior):
+    """Return a config string of the same search space with the options of
+    every setting listed most likely first
+
+    The result describes exactly the same settings as config_string (see
+    all_enigma_settings_candidates()), only the order of the search space
+    (see settings_search_space()) changes, so any code breaker can search
+    ranges of it.
+
+    :param config_string: An Enigma config string with marked unknown settings
+    :param prior: SettingsPrior
+    :return: An Enigma config string with lists of options
+    """
+
+    rotors_count, dimensions = settings_search_space(config_string)
+    ordered = []
+    for options, weight in zip(dimensions, prior.dimension_weights(config_string)):
+        if weight is not None:
+            # sorted() is stable, options of the same weight keep their order
+            options = sorted(options, key=weight, reverse=True)
+        ordered.append(options)
+
+    def quoted(options):
+        if len(options) == 1:
+            return str(options[0])
+        return "[" + ",".join('"{0}"'.format(option) for option in options) + "]"
+
+    def numbers(options):
+        if len(options) == 1:
+            return str(options[0])
+        return "[" + ",".join(str(option) for option in options) + "]"
+
+    rotors = ordered[1:1 + rotors_count]
+    positions = ordered[1 + rotors_count:1 + 2 * rotors_count]
+    rings = ordered[1 + 2 * rotors_count:1 + 3 * rotors_count]
+    parts = [quoted(ordered[0]),
+             "-".join(quoted(options) for options in reversed(rotors)),
+             "-".join(numbers(options) for options in reversed(rings)),
+             "-".join("".join(options) for options in reversed(positions))]
+    plugs = ordered[1 + 3 * rotors_count:]
+    if plugs:
+        parts.append("-".join(quoted(options) for options in plugs))
+    return " ".join(parts)
+
+def prior_work_units(config_string, positions_count, prior = None, chunk_size = 50):
+    """Yield (start, stop) ranges of a code breaking job, the most likely
+    settings first (see configs_in_range())
+
+    The search space is split into blocks by its slowest changing settings
+    (e.g. reflector, wheel order and some ring settings), at most
+    MAX_PRIOR_BLOCKS blocks of at least chunk_size settings each. Blocks are
+    issued in the order of their weight (see SettingsPrior) at every crib
+    position and split into chunks of chunk_size. Every setting is issued
+    exactly once. Without a prior the ranges simply follow each other.
+
+    :param config_string: config string ordered by the prior (see prior_config_string())
+    :param positions_count: number of possible crib positions
+    :param prior: SettingsPrior or None
+    :param chunk_size: number of Enigma settings in a range
+    :return: generator of (start, stop)
+    """
+
+    settings_count = count_settings(config_string)
+    if prior is None:
+        total = settings_count * positions_count
+        for start in range(0, total, chunk_size):
+            yield start, min(start + chunk_size, total)
+        return
+
+    rotors_count, dimensions = settings_search_space(config_string)
+    weights = prior.dimension_weights(config_string)
+    # the slowest changing dimensions that split the space into blocks:
+    key_dims = 0
+    blocks_count = 1
+    inner_size = settings_count
+    for options, weight in zip(dimensions, weights):
+        size = len(options)
+        if weight is None or blocks_count * size > MAX_PRIOR_BLOCKS or (size > 1 and inner_size // size < chunk_size):
+            break
+        key_dims += 1
+        blocks_count *= size
+        inner_size //= size
+
+    def block_score(key):
+        setting = [options[digit] for options, digit in zip(dimensions, key)]
+        rotors = setting[1:1 + rotors_count]
+        if len(set(rotors)) != len(rotors):
+            # no valid settings in this block
+            return -math.inf
+        score = sum(math.log(weight(value)) for weight, value in zip(weights, setting))
+        if len(rotors) == rotors_count:
+            score += math.log(prior.weight("wheel_order", tuple(rotors)))
+        return score
+
+    keys = list(itertools.product(*(range(len(options)) for options in dimensions[:key_dims])))
+    blocks = sorted(range(len(keys)), key=lambda block: -block_score(keys[block]))
+    for block in blocks:
+        for pos_inx in range(positions_count):
+            block_start = pos_inx * settings_count + block * inner_size
+            block_stop = block_start + inner_size
+            for start in range(block_start, block_stop, chunk_size):
+                yield start, min(start + chunk_size, block_stop)
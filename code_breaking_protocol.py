@@ -0,0 +1,154 @@
+import struct                   # binary framing
+from collections import namedtuple
+
+#   Messages exchanged by the distributed code breaking clients and server
+#
+#   Messages are batched into frames. A frame is a small header
+#   (protocol version, hostname of the sender and number of messages)
+#   followed by the messages, each one a type byte and its fields. Strings
+#   are UTF-8 with a 32 bit length prefix, numbers are fixed size big endian:
+#
+#       encode_frame(node, messages)
+#       decode_frame(frame) => node, messages
+#
+#   Message types:
+#       Candidate(job_id, config, plaintext, reflector, score)
+#           a setting that encrypts the crib correctly and the plausibility
+#           of its plaintext
+#       Progress(job_id, count, discarded)
+#           number of settings of a job checked since the last frame (for
+#           the speed of the clients) and the number of less plausible
+#           candidates not sent
+#       Speed(cpus, speed)
+#           settings per second checked by all the cores of the client
+#       Heartbeat(cpus)
+#           the client is alive (sent when there is nothing else to send)
+#       Final()
+#           the client has finished and exited
+#       Taken(job_id, start, stop)
+#           the client took a work unit from the shared job queue, the server
+#           hands it out again if the client leaves before checking it
+#       Checked(job_id, start, stop)
+#           all the settings of a work unit have been checked, the server
+#           counts the settings of a job done from these
+#
+#   Only used by the asyncio transport (see code_breaking_asyncio), where
+#   frames are sent over TCP with a 32 bit length prefix:
+#       Challenge(nonce) / Response(digest)
+#           the server authenticates a client that knows the authkey
+#       WorkRequest(count)
+#           a client asks for count more work units
+#       WorkUnit(job_id, encrypted_text, crib, config_string, start, stop)
+#           a range of a job's search space (see configs_in_range())
+#       Shutdown()
+#           the server has no more work and closes the connection
+#
+
+PROTOCOL_VERSION = 3
+
+Candidate = namedtuple('Candidate', ['job_id', 'config', 'plaintext', 'reflector', 'score'], defaults=(0.0,))
+Progress = namedtuple('Progress', ['job_id', 'count', 'discarded'], defaults=(0,))
+Speed = namedtuple('Speed', ['cpus', 'speed'])
+Heartbeat = namedtuple('Heartbeat', ['cpus'])
+Final = namedtuple('Final', [])
+Challenge = namedtuple('Challenge', ['nonce'])
+Response = namedtuple('Response', ['digest'])
+WorkRequest = namedtuple('WorkRequest', ['count'])
+WorkUnit = namedtuple('WorkUnit', ['job_id', 'encrypted_text', 'crib', 'config_string', 'start', 'stop'])
+Shutdown = namedtuple('Shutdown', [])
+Taken = namedtuple('Taken', ['job_id', 'start', 'stop'])
+Checked = namedtuple('Checked', ['job_id', 'start', 'stop'])
+
+# type byte and field formats of every message, "s" is a string:
+MESSAGE_TYPES = {
+    Candidate: (1, "ssssd"),
+    Progress: (2, "sQQ"),
+    Speed: (3, "Hd"),
+    Heartbeat: (4, "H"),
+    Final: (5, ""),
+    Challenge: (6, "s"),
+    Response: (7, "s"),
+    WorkRequest: (8, "I"),
+    WorkUnit: (9, "ssssQQ"),
+    Shutdown: (10, ""),
+    Taken: (11, "sQQ"),
+    Checked: (12, "sQQ"),
+}
+MESSAGE_CLASSES = {type_id: (cls, fields) for cls, (type_id, fields) in MESSAGE_TYPES.items()}
+
+FRAME_HEADER = struct.Struct("!BH")     # protocol version, number of messages
+FRAME_LENGTH = struct.Struct("!I")      # length prefix of frames sent over TCP
+STRING_LENGTH = struct.Struct("!I")
+FIELD_FORMATS = {f: struct.Struct("!" + f) for f in "BHIQd"}
+# raised by decode_frame() for a malformed frame (or anything else than bytes):
+FRAME_ERRORS = (struct.error, IndexError, KeyError, TypeError, UnicodeDecodeError, ValueError)
+
+
+def _pack_string(value):
+    data = value.encode()
+    return STRING_LENGTH.pack(len(data)) + data
+
+def _unpack_string(frame, offset):
+    length, = STRING_LENGTH.unpack_from(frame, offset)
+    offset += STRING_LENGTH.size
+    return frame[offset:offset + length].decode(), offset + length
+
+def encode_frame(node, messages):
+    """Pack messages into a single binary frame
+
+    :param node: hostname of the sender
+    :param messages: list of messages, e.g. Candidate, Progress, Speed
+    :return: bytes
+    """
+
+    parts = [FRAME_HEADER.pack(PROTOCOL_VERSION, len(messages)), _pack_string(node)]
+    for message in messages:
+        type_id, fields = MESSAGE_TYPES[type(message)]
+        parts.append(FIELD_FORMATS["B"].pack(type_id))
+        for field, value in zip(fields, message):
+            if field == "s":
+                parts.append(_pack_string(value))
+            else:
+                parts.append(FIELD_FORMATS[field].pack(value))
+    return b"".join(parts)
+
+def decode_frame(frame):
+    """Unpack a frame created by encode_frame()
+
+    :param frame: bytes
+    :return: hostname of the sender, list of messages
+    :raises: one of FRAME_ERRORS if the frame is malformed
+    """
+
+    version, count = FRAME_HEADER.unpack_from(frame, 0)
+    if version != PROTOCOL_VERSION:
+        raise ValueError("Unsupported protocol version {0}".format(version))
+    node, offset = _unpack_string(frame, FRAME_HEADER.size)
+    messages = []
+    for i in range(count):
+        type_id = frame[offset]
+        offset += 1
+        cls, fields = MESSAGE_CLASSES[type_id]
+        values = []
+        for field in fields:
+            if field == "s":
+                value, offset = _unpack_string(frame, offset)
+            else:
+                value, = FIELD_FORMATS[field].unpack_from(frame, offset)
+                offset += FIELD_FORMATS[field].size
+            values.append(value)
+        messages.append(cls(*values))
+    return node, messages
+
+def candidates_from_results(job_id, results):
+    """Convert results of check_enigma_config() (a RankedResults) to Candidate messages"""
+
+    return [Candidate(job_id, r[0], r[1], r[2] if len(r) > 2 else "", score) for score, r in results.ranked()]
+
+def candidate_to_result(node, candidate):
+    """Convert a Candidate message to a result tuple prefixed with the hostname"""
+
+    result = (node, candidate.config, candidate.plaintext)
+    if candidate.reflector:
+        result += (candidate.reflector,)
+    return result
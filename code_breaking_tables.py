@@ -0,0 +1,139 @@
+import os
+import sys
+import mmap                     # tables shared by all the processes
+import struct
+import hashlib
+from code_breaking_utils import *
+
+#   Rotor state tables on disk
+#
+#   The permutation of the rotors and the reflector at every position of the
+#   rotors (see Enigma.position_permutations()) only depends on the wiring of
+#   the reflector and the rotors, not on the ring settings or the plugboard.
+#   A table of all of them (26 bytes for each of the 26 ** 3 or 26 ** 4
+#   positions) is generated once, on first use, and saved in cache_dir()
+#   under the hash of the wirings it was generated from. Every worker process
+#   and distributed client on a machine maps the same file with mmap instead
+#   of walking the rotors again, and a repeated job with the same wheels
+#   skips the simulation. A table sent to a pool worker is pickled as the
+#   path of its file.
+#
+#       table = rotor_state_table(Enigma(cnf))  # generated once in cache_dir()
+#       table[p0 + 26 * p1 + 676 * p2]          # permutation at the positions
+#       table.column(code)                      # what a letter encodes to everywhere
+#
+#       build_rotor_table(path, machine)
+#       table = open_rotor_table(path)
+#
+
+# magic, format version, number of rotors, reserved, number of permutations:
+ROTOR_TABLE_HEADER = struct.Struct("<4sBBxxQ")
+ROTOR_TABLE_MAGIC = b"ENRS"
+ROTOR_TABLE_VERSION = 1
+
+
+class RotorStateTable:
+    """Permutations of the rotors and the reflector at every position of the
+    rotors, a sequence like Enigma.position_permutations()"""
+
+    def __init__(self, data, rotors_count, path = None):
+        """
+        :param data: bytes-like, 26 bytes for every position of the rotors
+        :param rotors_count: number of rotors (without the reflector)
+        :param path: file the table is mapped from, if any
+        """
+
+        self.data = data
+        self.rotors_count = rotors_count
+        self.path = path
+
+    def __reduce__(self):
+        # worker processes map the same file instead of copying the table
+        if self.path:
+            return open_rotor_table, (self.path,)
+        return RotorStateTable, (bytes(self.data), self.rotors_count)
+
+    def __len__(self):
+        return len(self.data) // 26
+
+    def __getitem__(self, inx):
+        if not 0 <= inx < len(self):
+            raise IndexError("No rotor position {0}".format(inx))
+        return bytes(self.data[inx * 26:inx * 26 + 26])
+
+    def __iter__(self):
+        for inx in range(len(self)):
+            yield self[inx]
+
+    def column(self, code):
+        """Return the letter codes the letter code is encoded to at every
+        position of the rotors"""
+
+        return bytes(self.data[code::26])
+
+def rotor_table_key(machine):
+    """Return the hash of the wirings of the reflector and the rotors of an
+    Enigma, the tables generated from the same wirings are the same"""
+
+    wirings = "|".join("".join(rotor.left_pins[:26]) for rotor in machine.rotors)
+    return hashlib.sha1("{0}:{1}".format(ROTOR_TABLE_VERSION, wirings).encode()).hexdigest()[:16]
+
+def build_rotor_table(path, machine):
+    """Generate the table of an Enigma (see Enigma.position_permutations())
+    and save it (see open_rotor_table())
+
+    :param path: file name
+    :param machine: Enigma with the wheels of the table
+    :return:
+    """
+
+    perms = machine.position_permutations()
+    # write to a temporary file first so no process maps a half written table
+    temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(temp_path, 'wb') as table_file:
+        table_file.write(ROTOR_TABLE_HEADER.pack(ROTOR_TABLE_MAGIC, ROTOR_TABLE_VERSION,
+                                                 len(machine.rotors) - 1, len(perms)))
+        for perm in perms:
+            table_file.write(perm)
+    os.replace(temp_path, path)
+
+def open_rotor_table(path):
+    """Map a table saved by build_rotor_table() into memory
+
+    :param path: file name
+    :return: RotorStateTable
+    """
+
+    with open(path, 'rb') as table_file:
+        mapped = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, rotors_count, count = ROTOR_TABLE_HEADER.unpack_from(mapped)
+    if magic != ROTOR_TABLE_MAGIC or version != ROTOR_TABLE_VERSION:
+        raise ValueError("{0} is not a rotor state table".format(path))
+    data = memoryview(mapped)[ROTOR_TABLE_HEADER.size:]
+    if len(data) != count * 26 or count != 26 ** rotors_count:
+        raise ValueError("{0} is truncated".format(path))
+    return RotorStateTable(data, rotors_count, path)
+
+# tables mapped by this process:
+_mapped_tables = {}
+
+def rotor_state_table(machine):
+    """Return the table of the wheels of an Enigma
+
+    The table is generated only once and kept in cache_dir(). Without a
+    writable cache directory the table is kept in the memory of the process.
+
+    :param machine: Enigma
+    :return: RotorStateTable
+    """
+
+    key = rotor_table_key(machine)
+    if key not in _mapped_tables:
+        try:
+            path = os.path.join(cache_dir(), "rotors-{0}.bin".format(key))
+            if not os.path.exists(path):
+                build_rotor_table(path, machine)
+            _mapped_tables[key] = open_rotor_table(path)
+        except OSError:
+            _mapped_tables[key] = RotorStateTable(b"".join(machine.position_permutations()), len(machine.rotors) - 1)
+    return _mapped_tables[key]
@@ -1,6 +1,9 @@
 import random
 import time
 import itertools
+import functools
+import os
+import bisect                   # ranking of the results
 from enigma import *
 
 #
@@ -11,13 +14,21 @@ from enigma import *
 #   check_enigma_config(enigma_config_list, crib, encrypted_text, sample = None)
 #       Given an input of a list of Enigma settings and a crib, try out every
 #       setting to see if it correctly encrypts the crib. Return a list of
-#       such successfull Enigma settings
-#
+#       such successfull Enigma settings ranked by plausibility()
 #
+#   plausibility(text)
+#       score how much a decrypted text looks like a language: n-gram
+#       fitness, index of coincidence and (if the ENIGMA_DICTIONARY
+#       environment variable names a word list) the dictionary hit rate.
+#       The code breakers keep only the TOP_RESULTS most plausible results
+#       (see RankedResults) and count the other ones
 #
 
+TOP_RESULTS = 20        # most plausible results kept by the code breakers
+IOC_WEIGHT = 20         # weight of the index of coincidence in plausibility()
+
 
-def check_enigma_config(enigma_config_list, crib, encrypted_text, sample = None):
+def check_enigma_config(enigma_config_list, crib, encrypted_text, sample = None, top = TOP_RESULTS, cores = None):
     '''Find Enigma settings that correctly encrpyt the crib
 
     Given an input of a list of Enigma settings and a crib, try out every
@@ -32,7 +43,11 @@ def check_enigma_config(enigma_config_list, crib, encrypted_text, sample = None)
     :param sample:              if sample of size X is given, than time will be
                                 returned requried to check the number of Enigma
                                 settings given by the sample
-    :return:
+    :param top:                 number of the most plausible settings to keep
+    :param cores:               optional dict of the tables of the wheels (see
+                                CompiledEnigma), may be shared by threads
+    :return: RankedResults of (Enigma settings, decrypted text
+             [, reflector wiring])
     '''
 
     # in order to predict time required to finish the time required for the
@@ -46,7 +61,9 @@ def check_enigma_config(enigma_config_list, crib, encrypted_text, sample = None)
 
     count_tested = 0
     time_start = time.time()
-    potential_configs = []
+    potential_configs = RankedResults(top)
+    if cores is None:
+        cores = {}
     for enigma_config in enigma_config_list:
         # Prepare Enigma settings:
         cnf = enigma_config[0]
@@ -55,31 +72,21 @@ def check_enigma_config(enigma_config_list, crib, encrypted_text, sample = None)
         if len(enigma_config) == 3:
             reflector_hack = enigma_config[2]
 
-        # Init Enigma and rotate it to correct position:
-        enigma_instance = Enigma(cnf)
+        # Compile Enigma (tables are shared by the same wheels):
         if reflector_hack:
             # if reflector hack is available override wiring:
-            enigma_instance.rotors[-1].left_pins = reflector_hack
-        # forward to find the correct rotor positions
-        enigma_instance.rotate_n_steps(pos)
-
-        potential_config = True
-        for inx in range(len(crib)):
-            if enigma_instance.encode_character(crib[inx]) != encrypted_text[pos + inx]:
-                # if any character does not match this Enigma setting can be discarded
-                # and further decryption can be stopped
-                potential_config = False
-                break
-        if potential_config:
+            wirings = [Rotor.supported_rotors[r] for r in cnf.rotors] + [reflector_hack]
+            enigma_instance = CompiledEnigma(cnf, wirings=wirings)
+        else:
+            enigma_instance = CompiledEnigma(cnf, cores.setdefault((cnf.reflector, tuple(cnf.rotors)), {}))
+
+        # encode the crib at the correct rotor positions:
+        if encode(enigma_instance, crib, pos) == encrypted_text[pos:pos + len(crib)]:
             # potential match: all characters of the crib were encoded correctly
-            e = Enigma(cnf)
-            # include reflector wiring in result:
-            if reflector_hack:
-                e.rotors[-1].left_pins = reflector_hack
-            result = (str(cnf), e.encode_string(encrypted_text))
+            result = (str(cnf), encode(enigma_instance, encrypted_text))
             if reflector_hack:
                 result += (reflector_hack,)
-            potential_configs.append(result)
+            potential_configs.add(plausibility(result[1]), result)
         count_tested += 1
 
         if sample and count_tested == sample:
@@ -173,7 +180,7 @@ def all_enigma_settings_candidates(config_string):
             config_options["ring_settings"].append([int(ring_setting)])
 
     # Determine known / unknown plugboard settings:
-    # TODO: could be improved based on crib loops
+    # (code_breaking_bombe deduces unknown plugs from the crib loops instead)
     config_options["plugboard"] = []
     if len(config_parts) > 4:
         for bind in config_parts[4].replace('-', ' ').split():
@@ -257,6 +264,292 @@ def all_possible_settings(config_string):
 
     return enigma_configurations
 
+@functools.lru_cache(maxsize=32)
+def settings_search_space(config_string):
+    """Return the dimensions of the search space of a partially known Enigma
+
+    Unlike all_possible_settings() nothing is constructed here. The search space
+    is described as a list of option lists in the order reflector, rotors, rotor
+    positions, ring settings and plugboard leads. Every Enigma setting then has
+    an index in the mixed radix number system given by the lengths of these
+    lists (the last option list changes the fastest). Index ranges of this
+    space are the work units that can be handed out without ever listing the
+    complete search space in memory.
+
+    :param config_string: An Enigma config string with marked unknown settings
+    :return: (number of rotors, tuple of option tuples)
+    """
+
+    options = all_enigma_settings_candidates(config_string)
+    dimensions = [options["reflectors"]]
+    dimensions += options["rotors"]
+    dimensions += [list(positions) for positions in options["rotor_positions"]]
+    dimensions += options["ring_settings"]
+    dimensions += options["plugboard"]
+    return len(options["rotors"]), tuple(tuple(d) for d in dimensions)
+
+def count_settings(config_string):
+    """Return the size of the search space including invalid combinations
+    (e.g. the same rotor used twice) which are skipped when enumerated"""
+
+    count = 1
+    for options in settings_search_space(config_string)[1]:
+        count *= len(options)
+    return count
+
+def settings_in_range(config_string, start, stop):
+    """Yield valid Enigma settings with an index in the range [start, stop)
+
+    See settings_search_space() for how the index is defined. Invalid
+    combinations (the same rotor used twice or a plug connected twice)
+    occupy an index but are not returned.
+
+    :param config_string: An Enigma config string with marked unknown settings
+    :param start: index of the first setting
+    :param stop: index after the last setting
+    :return: generator of EnigmaConfig
+    """
+
+    rotors_count, dimensions = settings_search_space(config_string)
+    # convert start index into digits of the mixed radix number:
+    digits = []
+    rest = start
+    for options in reversed(dimensions):
+        rest, digit = divmod(rest, len(options))
+        digits.append(digit)
+    digits.reverse()
+
+    for _ in range(start, stop):
+        setting = [options[digit] for options, digit in zip(dimensions, digits)]
+        rotors = setting[1:1 + rotors_count]
+        plugs = setting[1 + 3 * rotors_count:]
+        # uniqueness of rotors and leads is enforced as in all_possible_settings()
+        if len(set(rotors)) == len(rotors) and len(set(plugs)) == len(plugs):
+            cnf = EnigmaConfig(setting[0],
+                               rotors,
+                               setting[1 + rotors_count:1 + 2 * rotors_count],
+                               setting[1 + 2 * rotors_count:1 + 3 * rotors_count],
+                               plugs)
+            if cnf.is_valid_configuration():
+                yield cnf
+        # move on to the next index, the last digit changes the fastest:
+        for inx in range(len(digits) - 1, -1, -1):
+            digits[inx] += 1
+            if digits[inx] < len(dimensions[inx]):
+                break
+            digits[inx] = 0
+
+def configs_in_range(config_string, crib_positions, start, stop):
+    """Return (Enigma settings, crib position) tuples in the range [start, stop)
+
+    The search space of a code breaking job is every Enigma setting at every
+    possible crib position, crib positions changing the slowest (just like
+    the loops in decrypt_cipher()).
+
+    :param config_string: An Enigma config string with marked unknown settings
+    :param crib_positions: possible crib positions (see possible_crib_positions())
+    :param start: index of the first setting
+    :param stop: index after the last setting
+    :return: list of (EnigmaConfig, crib position)
+    """
+
+    settings_count = count_settings(config_string)
+    configs = []
+    while start < stop:
+        pos_inx, setting_inx = divmod(start, settings_count)
+        block_stop = min(stop, (pos_inx + 1) * settings_count)
+        for cnf in settings_in_range(config_string, setting_inx, setting_inx + block_stop - start):
+            configs.append((cnf, crib_positions[pos_inx]))
+        start = block_stop
+    return configs
+
+def check_enigma_config_range(encrypted_text, crib, config_string, start, stop, cores = None):
+    """Check the slice [start, stop) of a code breaking job (see configs_in_range())
+
+    :param cores: optional dict of the tables of the wheels shared by threads
+                  (see check_enigma_config())
+    """
+
+    crib_positions = possible_crib_positions(encrypted_text, crib)
+    return check_enigma_config(configs_in_range(config_string, crib_positions, start, stop),
+                               crib,
+                               encrypted_text,
+                               cores=cores)
+
+def cache_dir():
+    """Return the directory for tables and results kept between runs
+
+    It is the directory given by the ENIGMA_CACHE_DIR environment variable
+    or ~/.cache/enigma and it is created if missing.
+    """
+
+    path = os.environ.get("ENIGMA_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "enigma")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+LETTER_CODES = bytes.maketrans(Rotor.supported_rotors['Alphabet'].encode(), bytes(range(26)))
+LETTERS = bytes.maketrans(bytes(range(26)), Rotor.supported_rotors['Alphabet'].encode())
+
+def text_to_codes(text):
+    """Convert a text of capital letters to bytes of letter codes 0-25"""
+
+    return text.encode().translate(LETTER_CODES)
+
+def codes_to_text(codes):
+    """Convert bytes of letter codes 0-25 back to text"""
+
+    return codes.translate(LETTERS).decode()
+
+def plugboard_table(plugs):
+    """Return a translation table (see bytes.translate()) of letter codes for
+    a list of plugboard leads, e.g. ["AB", "CD"]"""
+
+    table = bytearray(range(256))
+    for lead in plugs:
+        a, b = text_to_codes(lead)
+        table[a], table[b] = b, a
+    return bytes(table)
+
+def decrypt_codes(cnf, codes, cores=None):
+    """Decrypt (or encrypt) letter codes with an Enigma config
+
+    Much faster than Enigma.encode_string() for whole messages, the rotor
+    permutations of every step are looked up (see
+    Enigma.scrambler_permutations()) and the plugboard is applied to the
+    whole message at once.
+
+    :param cnf: EnigmaConfig
+    :param codes: bytes of letter codes (see text_to_codes())
+    :param cores: optional dict shared by all configs with the same
+                  reflector and rotors
+    :return: bytes of letter codes
+    """
+
+    plugs = plugboard_table(cnf.plugs)
+    perms = Enigma(cnf).scrambler_permutations(len(codes), cores)
+    return bytes([perm[c] for perm, c in zip(perms, codes.translate(plugs))]).translate(plugs)
+
+def index_of_coincidence(codes):
+    """Probability of two letters of a text being the same letter
+
+    About 0.066 for English or German text and 0.038 for random letters.
+
+    :param codes: bytes of letter codes (see text_to_codes())
+    :return: float
+    """
+
+    length = len(codes)
+    if length < 2:
+        return 0.0
+    return sum(n * (n - 1) for n in map(codes.count, range(26))) / (length * (length - 1))
+
+@functools.lru_cache(maxsize=1)
+def default_dictionary():
+    """Return the words of the word list (one word per line) given by the
+    ENIGMA_DICTIONARY environment variable or None if it is not set"""
+
+    path = os.environ.get("ENIGMA_DICTIONARY")
+    if not path:
+        return None
+    with open(path) as word_list:
+        return frozenset(word.strip().upper() for word in word_list if len(word.strip()) >= 3)
+
+def dictionary_hit_rate(text, words):
+    """Return the fraction of the letters of a text covered by words of a
+    dictionary (the words do not overlap, e.g. THEREST = THE + REST)
+
+    :param text: capital letters
+    :param words: set of words of at least 3 letters
+    :return: float
+    """
+
+    if not text or not words:
+        return 0.0
+    longest = min(20, max(map(len, words)))
+    covered = [0] * (len(text) + 1)     # most letters of text[:end] covered
+    for end in range(1, len(text) + 1):
+        best = covered[end - 1]
+        for start in range(max(0, end - longest), end - 2):
+            if covered[start] + end - start > best and text[start:end] in words:
+                best = covered[start] + end - start
+        covered[end] = best
+    return covered[-1] / len(text)
+
+def plausibility(text, model = None, words = None):
+    """Score how much a decrypted text looks like a language, the higher the
+    more plausible
+
+    The score is the average log10 probability of the n-grams of the text
+    (about -2.5 for English and -4.5 for random letters), plus the index of
+    coincidence times IOC_WEIGHT, plus the fraction of the text covered by
+    dictionary words if a dictionary is given (see default_dictionary()).
+
+    :param text: capital letters
+    :param model: NgramModel, default_model() if not given
+    :param words: set of words, default_dictionary() if not given
+    :return: float
+    """
+
+    # code_breaking_ngrams builds on this module so it is imported when needed
+    from code_breaking_ngrams import default_model
+
+    model = model or default_model()
+    codes = text_to_codes(text)
+    count = len(codes) - model.n + 1
+    score = model.score(codes) / count if count > 0 else 0.0
+    score += IOC_WEIGHT * index_of_coincidence(codes)
+    words = default_dictionary() if words is None else words
+    if words:
+        score += dictionary_hit_rate(text, words)
+    return score
+
+class RankedResults(list):
+    """Results of a code breaker, the most plausible first
+
+    Only the "top" best scoring results are kept, the other ones are only
+    counted (discarded) so the results of a huge search stay small enough to
+    review and to send over the network.
+    """
+
+    def __init__(self, top = TOP_RESULTS):
+        super().__init__()
+        self.top = top
+        self.scores = []        # negated scores of the results, ascending
+        self.discarded = 0
+
+    def add(self, score, result):
+        """Add a result with its score (see plausibility())
+
+        A result already kept (e.g. the same settings found at another crib
+        position) is not added again.
+        """
+
+        inx = bisect.bisect_right(self.scores, -score)
+        if result in self[bisect.bisect_left(self.scores, -score):inx]:
+            return
+        if inx >= self.top:
+            self.discarded += 1
+            return
+        self.scores.insert(inx, -score)
+        self.insert(inx, result)
+        if len(self) > self.top:
+            self.scores.pop()
+            self.pop()
+            self.discarded += 1
+
+    def ranked(self):
+        """Return a list of (score, result), best first"""
+
+        return [(-score, result) for score, result in zip(self.scores, self)]
+
+    def merge(self, results):
+        """Add all the results of another RankedResults"""
+
+        for score, result in results.ranked():
+            self.add(score, result)
+        self.discarded += results.discarded
+        return self
+
 def possible_crib_positions(encrypted_text, crib):
     """Exclude impossible crib positions.
 
@@ -277,17 +570,38 @@ def possible_crib_positions(encrypted_text, crib):
     if not encrypted_text or not crib or len(encrypted_text) < len(crib):
         return []
 
-    positions = []
-    for pos in range(len(encrypted_text)+1-len(crib)):
-        potential_position = True
-        for plaintext_char, encrypted_char in zip(list(crib),
-                                                  list(encrypted_text[pos:pos+len(crib)])):
-            if plaintext_char == encrypted_char:
-                potential_position = False
-                break
-        if potential_position:
-            positions.append(pos)
-    return positions
+    mask = crib_position_masks(encrypted_text, [(crib, None)])[0]
+    return [pos for pos in range(len(encrypted_text) + 1 - len(crib)) if mask >> pos & 1]
+
+def crib_position_masks(encrypted_text, cribs):
+    """Return for every crib a bitset of the positions it may be at
+
+    Like possible_crib_positions() (Enigma never encodes a letter to itself)
+    but all the positions of all the cribs are checked at once with a bitset
+    of the positions of every letter of the encrypted text: a crib cannot
+    start at position p if for any i its letter i is the letter of the
+    encrypted text at p + i.
+
+    :param encrypted_text:
+    :param cribs: list of (crib, allowed positions or None)
+    :return: list of int bitsets, bit p set if the crib may start at position p
+    """
+
+    letters = {}
+    for pos, letter in enumerate(encrypted_text):
+        letters[letter] = letters.get(letter, 0) | 1 << pos
+    masks = []
+    for crib, positions in cribs:
+        if not crib or len(crib) > len(encrypted_text):
+            masks.append(0)
+            continue
+        mask = (1 << (len(encrypted_text) - len(crib) + 1)) - 1
+        for inx, letter in enumerate(crib):
+            mask &= ~(letters.get(letter, 0) >> inx)
+        if positions is not None:
+            mask &= sum(1 << pos for pos in set(positions) if pos >= 0)
+        masks.append(mask)
+    return masks
 
 def print_results(results):
     # ('B V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT', 'YOUCANFOLLOWMYDOGONINSTAGRAMATTALESOFHOFFMANN')
@@ -299,6 +613,8 @@ def print_results(results):
             print("{0}".format(solution[0]))
             if(len(solution) > 2):
                 print("{0}".format(solution[2]))
+        if getattr(results, "discarded", 0):
+            print("\n{0} less plausible solutions discarded".format(results.discarded))
     except:
         print(results)
 
@@ -387,7 +703,7 @@ def permutate_reflector_by_wire_swap(reflector_wiring, num_swaps):
         - 3 ways to pick a couple of pairs out of four pairs
         - 2 ways to swap wires between a couple of pairs * 2 pairs
     gives 12 permutations for every combination of four pairs.
-    In total for 2 swaps this should produce 4290 (!13/4!(13-4)! * 3 * 4)
+    In total for 2 swaps this should produce 8580 (!13/4!(13-4)! * 3 * 4)
     different reflector wirings
 
 
@@ -433,3 +749,260 @@ def permutate_reflector_by_wire_swap(reflector_wiring, num_swaps):
 
     wirings = [convert_reflector_to_string_notation(pair_combo) for pair_combo in result]
     return list(set(wirings))
+
+@functools.lru_cache(maxsize=8)
+def reflector_variants(reflector_wiring, num_swaps = 2):
+    """Return the ReflectorVariants of a reflector (computed once per reflector)"""
+
+    return ReflectorVariants(reflector_wiring, num_swaps)
+
+class ReflectorVariants:
+    """All wirings of a reflector with swapped wires, indexed by their pairs
+
+    A crib at a rotor state requires some pairs of contacts to be wired in
+    the reflector (see check_reflector_variants()). Instead of trying the
+    wirings one by one the wirings wiring a pair are kept as a bitset so all
+    of them are tested at once by AND-ing the bitsets of the pairs.
+    """
+
+    def __init__(self, reflector_wiring, num_swaps = 2):
+        """
+        :param reflector_wiring: original wiring, e.g. EJMZALYXVBWFCRQUONTSPIKHGD
+        :param num_swaps: see permutate_reflector_by_wire_swap()
+        """
+
+        alphabet = Rotor.supported_rotors['Alphabet']
+        self.wirings = sorted(permutate_reflector_by_wire_swap(reflector_wiring, num_swaps))
+        self.all = (1 << len(self.wirings)) - 1
+        bits = [bytearray((len(self.wirings) + 7) // 8) for pair in range(26 * 26)]
+        for inx, wiring in enumerate(self.wirings):
+            for a, letter in enumerate(wiring):
+                bits[a * 26 + alphabet.index(letter)][inx >> 3] |= 1 << (inx & 7)
+        # pair_masks[a * 26 + b] = bitset of the wirings connecting contacts a and b
+        self.pair_masks = [int.from_bytes(pair_bits, 'little') for pair_bits in bits]
+
+    def __len__(self):
+        return len(self.wirings)
+
+def check_reflector_variants(encrypted_text, crib, enigma_configs, num_swaps = 2, top = TOP_RESULTS):
+    """Find the Enigma settings and reflector wirings with swapped wires that
+    correctly encrypt the crib
+
+    The permutations of the rotors (without the reflector, see
+    Enigma.forward_permutations()) are computed once per setting for the
+    whole message. A crib letter p encrypted to c at a step means the
+    reflector wires the contacts the rotors take p and c to, so the wirings
+    fitting the crib at a position are the AND of the bitsets of these pairs
+    (see ReflectorVariants) and the search of a position stops as soon as no
+    wiring is left.
+
+    :param encrypted_text:
+    :param crib:
+    :param enigma_configs: list of EnigmaConfig (see all_possible_settings())
+    :param num_swaps: number of swapped wires of the reflector
+    :param top: number of the most plausible settings to keep
+    :return: RankedResults of (Enigma settings, decrypted text, reflector wiring)
+    """
+
+    crib_positions = possible_crib_positions(encrypted_text, crib)
+    codes = text_to_codes(encrypted_text)
+    crib_codes = text_to_codes(crib)
+    results = RankedResults(top)
+    cores = {}
+    for cnf in enigma_configs:
+        machine = Enigma(cnf)
+        variants = reflector_variants("".join(machine.rotors[-1].left_pins), num_swaps)
+        pair_masks = variants.pair_masks
+        plugs = plugboard_table(cnf.plugs)
+        plain = crib_codes.translate(plugs)
+        cipher = codes.translate(plugs)
+        perms = machine.forward_permutations(len(codes), cores.setdefault(tuple(cnf.rotors), {}))
+        for pos in crib_positions:
+            mask = variants.all
+            for inx in range(len(crib)):
+                perm = perms[pos + inx]
+                mask &= pair_masks[perm[plain[inx]] * 26 + perm[cipher[pos + inx]]]
+                if not mask:
+                    break
+            while mask:
+                lowest = mask & -mask
+                mask ^= lowest
+                wiring = variants.wirings[lowest.bit_length() - 1]
+                text = decrypt_with_reflector(perms, cipher, plugs, wiring)
+                results.add(plausibility(text), (str(cnf), text, wiring))
+    return results
+
+def decrypt_with_reflector(perms, cipher, plugs, wiring):
+    """Decrypt a message with the permutations of the rotors and a reflector
+
+    :param perms: permutations of the rotors (see Enigma.forward_permutations())
+    :param cipher: encrypted message as letter codes after the plugboard
+    :param plugs: plugboard translation table (see plugboard_table())
+    :param wiring: reflector wiring, e.g. EJMZALYXVBWFCRQUONTSPIKHGD, a
+                   contact wired to an unknown contact is a question mark
+    :return: decrypted text, letters passing an unknown contact are question marks
+    """
+
+    reflector = text_to_codes(wiring)
+    codes = bytearray()
+    for perm, code in zip(perms, cipher):
+        contact = reflector[perm[code]]
+        codes.append(perm.index(contact) if contact < 26 else contact)
+    return codes_to_text(bytes(codes).translate(plugs))
+
+def reflector_constraints(perms, plain, cipher, pos):
+    """Return the pairs of contacts a reflector must wire for a crib to be
+    encrypted to the encrypted text at a position
+
+    :param perms: permutations of the rotors (see Enigma.forward_permutations())
+    :param plain: crib as letter codes after the plugboard
+    :param cipher: encrypted message as letter codes after the plugboard
+    :param pos: position of the crib
+    :return: dict of contact => contact (both ways) or None if no reflector can
+    """
+
+    wiring = {}
+    for inx, code in enumerate(plain):
+        perm = perms[pos + inx]
+        a, b = perm[code], perm[cipher[pos + inx]]
+        if a == b or wiring.setdefault(a, b) != b or wiring.setdefault(b, a) != a:
+            return None
+    return wiring
+
+def _pairings(pairs):
+    """Yield all the ways to split a list of pairs into couples of pairs"""
+
+    if not pairs:
+        yield []
+        return
+    first = pairs[0]
+    for inx in range(1, len(pairs)):
+        rest = pairs[1:inx] + pairs[inx + 1:]
+        for couples in _pairings(rest):
+            yield [(first, pairs[inx])] + couples
+
+def _completions(wiring, contacts):
+    """Yield every way to wire the contacts not wired yet"""
+
+    free = [contact for contact in contacts if contact not in wiring]
+    if not free:
+        yield wiring
+        return
+    for other in free[1:]:
+        completed = dict(wiring)
+        completed[free[0]], completed[other] = other, free[0]
+        yield from _completions(completed, free)
+
+def reflector_rewirings(reflector_wiring, num_swaps = None, required = None):
+    """Stream reflector wirings that wire the required pairs of contacts
+
+    A rewired reflector has num_swaps wires swapped (see
+    permutate_reflector_by_wire_swap(), a wire is swapped at most once) or,
+    if num_swaps is None, any wiring (like a field rewirable UKW-D). The
+    required pairs are propagated before anything is generated: a required
+    pair that the original wiring does not have forces the swap of the two
+    original pairs of its contacts, so a wiring contradicting the required
+    pairs (or needing more swaps) is never generated.
+
+    :param reflector_wiring: original wiring, e.g. EJMZALYXVBWFCRQUONTSPIKHGD
+    :param num_swaps: number of swapped wires or None for any wiring
+    :param required: dict of contact => contact (0-25, both ways), see
+                     reflector_constraints()
+    :return: generator of wirings, e.g. EJMZALYXVBWFCRQUONTSPIKHGD
+    """
+
+    alphabet = Rotor.supported_rotors['Alphabet']
+    required = dict(required or {})
+    for a, b in list(required.items()):
+        if required.setdefault(b, a) != a:
+            return
+    if num_swaps is None:
+        for wiring in _completions(required, range(26)):
+            yield "".join(alphabet[wiring[contact]] for contact in range(26))
+        return
+
+    base = [alphabet.index(letter) for letter in reflector_wiring]
+    wiring = dict(required)
+    # original pairs are named by their lower contact, a required pair (a, b)
+    # not in the original wiring swaps pairs (a, base[a]) and (b, base[b])
+    # into (a, b) and (base[a], base[b]):
+    swapped = {}
+    for a, b in required.items():
+        if base[a] == b or a > b:
+            continue
+        pair_a, pair_b = min(a, base[a]), min(b, base[b])
+        if swapped.setdefault(pair_a, pair_b) != pair_b or swapped.setdefault(pair_b, pair_a) != pair_a:
+            return
+        if (wiring.setdefault(base[a], base[b]) != base[b]
+                or wiring.setdefault(base[b], base[a]) != base[a]):
+            return
+    if any(min(a, base[a]) in swapped and base[a] == b for a, b in required.items()):
+        # an original pair that must stay is swapped
+        return
+    forced = len(swapped) // 2
+    if forced > num_swaps:
+        return
+    free = [contact for contact in range(26)
+            if contact < base[contact] and contact not in wiring and base[contact] not in wiring]
+    for chosen in itertools.combinations(free, 2 * (num_swaps - forced)):
+        for couples in _pairings(list(chosen)):
+            for ways in itertools.product((0, 1), repeat=len(couples)):
+                rewired = dict(wiring)
+                for (a, b), way in zip(couples, ways):
+                    ra, rb = base[a], base[b]
+                    if way:
+                        a, ra = ra, a
+                    rewired[a], rewired[b], rewired[ra], rewired[rb] = b, a, rb, ra
+                yield "".join(alphabet[rewired.get(contact, base[contact])] for contact in range(26))
+
+def check_reflector_rewirings(encrypted_text, crib, enigma_configs, num_swaps = None, top = TOP_RESULTS):
+    """Find the Enigma settings and rewired reflectors that correctly encrypt
+    the crib (see reflector_rewirings())
+
+    For every rotor state the pairs of reflector contacts required by the
+    crib are collected first (see reflector_constraints()) and only wirings
+    with these pairs are generated. The rest of a completely unknown
+    reflector (num_swaps None) can not be deduced from the crib so the
+    solutions have a partial wiring and letters of the text that pass an
+    unknown contact are question marks.
+
+    :param encrypted_text:
+    :param crib:
+    :param enigma_configs: list of EnigmaConfig (see all_possible_settings())
+    :param num_swaps: number of swapped wires of the reflector or None
+    :param top: number of the most plausible settings to keep
+    :return: RankedResults of (Enigma settings, decrypted text, reflector wiring)
+    """
+
+    alphabet = Rotor.supported_rotors['Alphabet']
+    crib_positions = possible_crib_positions(encrypted_text, crib)
+    codes = text_to_codes(encrypted_text)
+    crib_codes = text_to_codes(crib)
+    results = RankedResults(top)
+    cores = {}
+    searched = set()
+    for cnf in enigma_configs:
+        if num_swaps is None:
+            # the original reflector does not matter
+            key = (tuple(cnf.rotors), tuple(cnf.rotors_pos), tuple(cnf.ring_settings), tuple(cnf.plugs))
+            if key in searched:
+                continue
+            searched.add(key)
+        machine = Enigma(cnf)
+        plugs = plugboard_table(cnf.plugs)
+        plain = crib_codes.translate(plugs)
+        cipher = codes.translate(plugs)
+        perms = machine.forward_permutations(len(codes), cores.setdefault(tuple(cnf.rotors), {}))
+        for pos in crib_positions:
+            required = reflector_constraints(perms, plain, cipher, pos)
+            if required is None:
+                continue
+            if num_swaps is None:
+                wirings = ["".join(alphabet[required[c]] if c in required else "?" for c in range(26))]
+            else:
+                wirings = reflector_rewirings("".join(machine.rotors[-1].left_pins), num_swaps, required)
+            for wiring in wirings:
+                text = decrypt_with_reflector(perms, cipher, plugs, wiring)
+                known = "".join(run for run in text.split("?") if len(run) >= 3)
+                results.add(plausibility(known) if known else float("-inf"), (str(cnf), text, wiring))
+    return results
@@ -1,12 +1,10 @@
 import sys # for the demo
 import argparse # for the demo
 import time
-import multiprocessing as mp
-import socket # to get server ip address
 from enigma import *
-import code_breaking
-import code_breaking_multiproc
-import code_breaking_distributed
+# The code breakers are imported by the commands that use them, so encrypting
+# from a shell script starts fast and processes started by a pool do not
+# load the distributed code.
 
 def print_results(solutions):
     # ('B V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT', 'YOUCANFOLLOWMYDOGONINSTAGRAMATTALESOFHOFFMANN')
@@ -20,6 +18,8 @@ def print_results(solutions):
             print("{0}".format(solution[0]))
             if (len(solution) > 2):
                 print("{0}".format(solution[2]))
+        if getattr(solutions[0], "discarded", 0):
+            print("\n{0} less plausible solutions discarded".format(solutions[0].discarded))
     except:
         print(solutions)
     print("\n")
@@ -49,22 +49,46 @@ def cli_select_codebreaker():
     print("1\tSingle process code breaker")
     print("2\tMulti process code breaker")
     print("3\tDistributed code breaker server (run clients first)")
-    print("4\tReturn")
+    print("4\tBombe (deduces unknown plugs, '?' lead = unknown plugboard)")
+    print("5\tCiphertext-only code breaker (index of coincidence, crib not used)")
+    print("6\tMulti-crib code breaker (cribs separated by commas, e.g. THOUSANDS,TREES@20-40)")
+    print("7\tMulti thread code breaker (shares the compiled tables between threads)")
+    print("8\tReturn")
     print("\n")
 
+    import code_breaking
+    import code_breaking_multiproc
+    import code_breaking_bombe
+    import code_breaking_ioc
+    import code_breaking_cribs
+
+    # a number of swapped wires or None for an unknown reflector:
+    rewired = reflector_swap is None or type(reflector_swap) is int
     choice = input().strip()
-    if (choice == '1'):
+    if (choice == '1' and rewired):
+        return lambda encrypted_text, crib, settings: code_breaking.decrypt_cipher_reflector_rewired(
+            encrypted_text, crib, settings, reflector_swap)
+    elif (choice == '1'):
         if not reflector_swap:
             return code_breaking.decrypt_cipher
         else:
             return code_breaking.decrypt_cipher_reflector_scrambled
-    elif (choice == '2'):
+    elif (choice == '2' and not rewired):
         if not reflector_swap:
             return code_breaking_multiproc.decrypt_cipher_multiproc
         else:
             return code_breaking_multiproc.decrypt_cipher_reflector_scrambled_multiproc
-    elif (choice == '3'):
+    elif (choice == '3' and not rewired):
+        import code_breaking_distributed
         return code_breaking_distributed.runserver
+    elif (choice == '4' and reflector_swap is False):
+        return code_breaking_bombe.decrypt_cipher_bombe
+    elif (choice == '5' and reflector_swap is False):
+        return lambda encrypted_text, crib, settings: code_breaking_ioc.decrypt_cipher_ioc(encrypted_text, settings)
+    elif (choice == '6' and reflector_swap is False):
+        return code_breaking_cribs.decrypt_cipher_cribs
+    elif (choice == '7' and reflector_swap is False):
+        return code_breaking_multiproc.decrypt_cipher_threads
     else:
         return None
 
@@ -75,6 +99,8 @@ def cli_define_distributed_client(last_ip):
     :param last_ip:
     :return:
     '''
+    import multiprocessing as mp
+    import socket # to get server ip address
 
     cpu_cores = mp.cpu_count()
     if (last_ip):
@@ -118,12 +144,19 @@ def cli_define_codebreaking_job():
     if (choice == '2'):
         print("Partially known Enigma settings:")
         settings = input().strip()
-        print("Crib (a word known to be in the text):")
+        print("Crib (a word known to be in the text, or many separated by commas for the multi-crib code breaker):")
         crib = input().strip()
         print("Encoded text:")
         encoded_text = input().strip()
-        print("Hit 'r' for the special case where reflector had 2 wires swapped:")
-        reflector_swap = input().strip() == 'r'
+        print("Hit 'r' for the special case where reflector had 2 wires swapped,")
+        print("a number of swapped wires or 'u' for an unknown (rewired) reflector:")
+        reflector_swap = input().strip()
+        if reflector_swap.isdigit():
+            reflector_swap = int(reflector_swap)
+        elif reflector_swap in ('r', 'u'):
+            reflector_swap = {'r': True, 'u': None}[reflector_swap]
+        else:
+            reflector_swap = False
     elif (choice == '1'):
         settings = DEMO_SETTINGS
         crib = DEMO_CRIB
@@ -140,6 +173,62 @@ if __name__ == "__main__":
     last_server_ip = None
     executable = sys.argv[0]
 
+    parser = argparse.ArgumentParser(description='Simulate Enigma machine')
+    parser.add_argument('command', nargs='?', choices=['encrypt', 'batch'], help="Encrypt / decrypt a file or stdin in blocks, or run the code breaking jobs of a job file, and exit")
+    parser.add_argument('--config', help="Enigma settings to encrypt with, e.g. \"B I-II-III 1-1-1 A-A-Z HL-MO\"")
+    parser.add_argument('--input', help="File to encrypt (default stdin)")
+    parser.add_argument('--output', help="File to write (default stdout)")
+    parser.add_argument('--jobs', help="JSON or TOML file of code breaking jobs to run (see code_breaking_batch)")
+    parser.add_argument('--non-letters', choices=list(NON_LETTER_POLICIES), help="Keep, drop or reject anything but letters")
+    parser.add_argument('--block-size', type=int, help="Bytes encrypted at once")
+    parser.add_argument('--module', choices=['interactive', 'distributed'], help='Run interactive cli or distributed client / server')
+    parser.add_argument('--component', choices=['client', 'server', 'coordinator', 'submit'], help="Distributes code breaking client / server / multi-job coordinator / job submitter")
+    parser.add_argument('--serverip', help="IP of distributed server")
+    parser.add_argument('--procnum', type=int, help="Number of processes to use")
+    parser.add_argument('--loop', type=bool, help="After distributed client / server finishes run again with the same settings")
+    parser.add_argument('--priority', type=float, help="Share of the coordinator's clients for a submitted job")
+    parser.add_argument('--transport', choices=['manager', 'asyncio'], help="Connect distributed client / server with a multiprocessing manager or asyncio TCP streams")
+    parser.add_argument('--port', type=int, help="Port of the asyncio distributed server")
+    parser.add_argument('--authkey', help="Shared secret of the asyncio distributed client / server")
+    parser.set_defaults(module="interactive", serverip="127.0.0.1", procnum=0, component="client", loop=False, priority=1,
+                        transport="manager", non_letters="keep", block_size=STREAM_BLOCK_SIZE)
+    args = parser.parse_args()
+    if args.command == "encrypt":
+        if not args.config:
+            parser.error("encrypt needs --config")
+        source = open(args.input, "rb") if args.input else sys.stdin.buffer
+        target = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            count, seconds = encode_file(EnigmaConfig.from_config_string(args.config), source, target,
+                                         args.block_size, args.non_letters)
+        except ValueError as e:
+            parser.exit(1, "{0}\n".format(e))
+        finally:
+            if args.input:
+                source.close()
+            if args.output:
+                target.close()
+        # stdout may be the encrypted text, the report goes to stderr:
+        print("{0:.2f} MB in {1:.2f} seconds ({2:.2f} MB/s)".format(count / 1e6, seconds, count / 1e6 / max(seconds, 1e-9)),
+              file=sys.stderr)
+        sys.exit(0)
+    if args.command == "batch":
+        import code_breaking_batch
+        if not args.jobs:
+            parser.error("batch needs --jobs")
+        try:
+            jobs, output = code_breaking_batch.load_jobs(args.jobs)
+        except (ValueError, OSError) as e:
+            parser.exit(1, "{0}\n".format(e))
+        output = args.output or output
+        target = open(output, "w") if output else sys.stdout
+        try:
+            summary = code_breaking_batch.run_batch(jobs, target)
+        finally:
+            if output:
+                target.close()
+        sys.exit(1 if summary["failed"] else 0)
+
     print("\n#\tThis is a simple command line interface for testing the Enigma simulator.")
     print("#\tInteractive mode allows to try out Enigma as well as break its code.")
     print("#\tSupported code breaking: single process, multiple processes, distributed")
@@ -148,16 +237,15 @@ if __name__ == "__main__":
     print("#\tDistributed mode runs a server and a any number of clients to work on the code breaking job")
     print("#\tFirst run all the clients and they will wait for the server to become available")
     print("#\tto run a client: {0} --module distributed --component client --serverip 192.168.0.229".format(executable))
-    print("#\tto run a server: {0} --module distributed --component server\n\n".format(executable))
+    print("#\tto run a server: {0} --module distributed --component server".format(executable))
+    print("#\tto run many jobs: {0} --module distributed --component coordinator".format(executable))
+    print("#\tand submit jobs: {0} --module distributed --component submit --serverip 192.168.0.229".format(executable))
+    print("#\tclient / server over plain TCP: add --transport asyncio [--port 22222 --authkey secret]")
+    print("#\tto run a job file: {0} batch --jobs nightly.toml --output results.jsonl".format(executable))
+    print("#\tto encrypt a file: {0} encrypt --config \"B I-II-III 1-1-1 A-A-Z\" --input plain.txt --output secret.txt\n\n".format(executable))
 
-    parser = argparse.ArgumentParser(description='Simulate Enigma machine')
-    parser.add_argument('--module', choices=['interactive', 'distributed'], help='Run interactive cli or distributed client / server')
-    parser.add_argument('--component', choices=['client', 'server'], help="Distributes code breaking client / server")
-    parser.add_argument('--serverip', help="IP of distributed server")
-    parser.add_argument('--procnum', type=int, help="Number of processes to use")
-    parser.add_argument('--loop', type=bool, help="After distributed client / server finishes run again with the same settings")
-    parser.set_defaults(module="interactive", serverip="127.0.0.1", procnum=0, component="client", loop=False)
-    args = parser.parse_args()
+    if args.transport == "asyncio" and args.component in ("coordinator", "submit"):
+        parser.error("--component {0} needs the manager transport".format(args.component))
 
     if args.module == 'interactive':
         print("Entering interactive mode. Navigate by entering the number of a choice.\n")
@@ -188,6 +276,7 @@ if __name__ == "__main__":
             elif (choice == '3'):
                 # run a distributed code breaking client
                 last_server_ip, cpus = cli_define_distributed_client(last_server_ip)
+                import code_breaking_distributed
                 code_breaking_distributed.runclient(last_server_ip, cpus)
             elif (choice == '2'):
                 # Define a code breaking job and run code breaking in a single or
@@ -208,6 +297,10 @@ if __name__ == "__main__":
                         print_results(solutions)
     elif(args.module == 'distributed'):
         # just a more convenient way to start a distributed server / client
+        import code_breaking_distributed
+        import code_breaking_asyncio
+        port = args.port or code_breaking_distributed.PORTNUM
+        authkey = args.authkey.encode() if args.authkey else code_breaking_distributed.AUTHKEY
         keep_running = True
         if(args.component == "server"):
             job = cli_define_codebreaking_job()
@@ -217,18 +310,36 @@ if __name__ == "__main__":
                 encoded_text = job[2]
                 reflector_swap = job[3]
 
-                while (keep_running):
+                if args.transport == "asyncio" and args.loop:
+                    code_breaking_asyncio.run_async_coordinator([(encoded_text, crib, settings)], port=port,
+                                                                authkey=authkey, repeat=True)
+                elif args.transport == "asyncio":
+                    solutions = code_breaking_asyncio.run_async_server(encoded_text, crib, settings,
+                                                                       port=port, authkey=authkey)
+                    print_results(solutions)
+                elif args.loop:
+                    # keep running the same job, clients stay connected
+                    code_breaking_distributed.runcoordinator(jobs=[(encoded_text, crib, settings)], repeat=True)
+                else:
                     solutions = code_breaking_distributed.runserver(encoded_text, crib, settings)
                     print_results(solutions)
-                    keep_running = args.loop
-                    if(keep_running):
-                        time.sleep(2) # wait for clients to get ready
+        elif(args.component == "coordinator"):
+            code_breaking_distributed.runcoordinator()
+        elif(args.component == "submit"):
+            job = cli_define_codebreaking_job()
+            if job:
+                job_id = code_breaking_distributed.submit_job(args.serverip, job[2], job[1], job[0], args.priority)
+                print("Submitted job {0}, waiting for results ...".format(job_id))
+                print_results(code_breaking_distributed.wait_for_job(args.serverip, job_id)[0])
         else:
             # run client
             while(keep_running):
                 server_ip = args.serverip
                 processes = args.procnum
-                code_breaking_distributed.runclient(server_ip, cpus=processes)
+                if args.transport == "asyncio":
+                    code_breaking_asyncio.run_async_client(server_ip, port, authkey, cpus=processes)
+                else:
+                    code_breaking_distributed.runclient(server_ip, cpus=processes)
                 keep_running = args.loop
 
 
@@ -1,5 +1,27 @@
 import sys # for the demo
-import argparse # for the demo
+import itertools # permutations of all the rotor positions
+import os # sizes of the streamed files
+import re # runs of letters in streamed text
+import mmap # large inputs are memory mapped when streaming
+import time # throughput of the streaming
+import json # batches of encoded messages as JSON lines
+import functools # encoding options of the batches
+
+STREAM_BLOCK_SIZE = 1 << 16     # bytes encoded at once when streaming
+MMAP_THRESHOLD = 1 << 24        # files at least this large are memory mapped
+NON_LETTER_POLICIES = ("keep", "drop", "error")
+ASCII_LETTERS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+# upper case letters and their letter codes 0-25:
+UPPER_CASE = bytes.maketrans(ASCII_LETTERS[26:], ASCII_LETTERS[:26])
+TO_CODES = bytes.maketrans(ASCII_LETTERS[:26], bytes(range(26)))
+FROM_CODES = bytes.maketrans(bytes(range(26)), ASCII_LETTERS[:26])
+NON_LETTERS = bytes(c for c in range(256) if c not in ASCII_LETTERS)
+# ASCII letters to letter codes 0-25, 255 for the other bytes:
+LETTER_INPUTS = bytes(TO_CODES[UPPER_CASE[c]] if c in ASCII_LETTERS else 255 for c in range(256))
+LETTER_RUNS = re.compile(rb"[A-Z]+")
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BATCH_CHUNK_SIZE = 200         # messages encoded at once by a process
+MAX_BATCH_WHEEL_ORDERS = 64     # tables of wheel orders kept by a process
 
 class PlugLead:
     """PlugLead represents a connection between two plugs on the plugboard (Steckerbrett)."""
@@ -44,20 +66,37 @@ class Plugboard:
         not connected then it will remain A. If A is connected to E then the
         substitution can go both ways, e.g. the letter E will be substituted with
         A and the letter A will be substituted with E
+
+        The plugboard is kept as a table of 26 letter codes (0-25), the letter
+        code every letter is substituted with. The table is an involution (it
+        is its own inverse), leads are added and removed by editing it, so a
+        search can try plugboard hypotheses on one plugboard.
+        """
+    def __init__(self, leads=()):
+        """
+        :param leads: optional leads, PlugLead or e.g. "AB"
         """
-    def __init__(self):
-        self.leads = dict()  # keys will serve for verifying that a plug only connects once
+        self.table = bytearray(range(26))
+        for lead in leads:
+            self.add(lead if isinstance(lead, PlugLead) else PlugLead(lead))
 
     def add(self, lead):
         """Add a new connection between two plugs"""
 
-        if lead.plug1() not in self.leads and lead.plug2() not in self.leads:
-            # Substitution can go both ways, dict is used for fast lookup
-            self.leads[lead.plug1()] = lead
-            self.leads[lead.plug2()] = lead
+        a, b = (ALPHABET.index(plug) for plug in lead.mapping)
+        if self.table[a] == a and self.table[b] == b:
+            # Substitution can go both ways
+            self.table[a], self.table[b] = b, a
         else:
             raise ValueError("Once of the plugs {0}-{1} is already connected".format(lead.plug1(), lead.plug2()))
 
+    def remove(self, plug):
+        """Disconnect a plug and the plug it is connected to"""
+
+        a = ALPHABET.index(plug)
+        b = self.table[a]
+        self.table[a], self.table[b] = a, b
+
     def encode(self, character):
         """ Substitute an input character if plug is connected
 
@@ -69,15 +108,35 @@ class Plugboard:
         :param character: A character to be substituted
         :return: the substitute for the input character
         """
-        if character in self.leads:
-            # plug is connected, substitute it
-            return self.leads[character].encode(character)
-        else:
-            # plug is not connected, return the original character
-            return character
+        code = ord(character) - 65
+        if 0 <= code < 26:
+            return ALPHABET[self.table[code]]
+        # not a plug, return the original character
+        return character
+
+    def leads(self):
+        """Return the connected leads, e.g. ["AB", "CD"]"""
+
+        return [ALPHABET[a] + ALPHABET[b] for a, b in enumerate(self.table) if a < b]
+
+    def translation(self):
+        """Return the plugboard as a translation table of letter codes (see
+        bytes.translate()), the other bytes are not changed"""
+
+        return bytes(self.table) + bytes(range(26, 256))
+
+    def compose(self, table):
+        """Return a table of letter codes (e.g. a permutation of the rotors) with
+        the plugboard applied after it, byte i is plugboard[table[i]]
+
+        :param table: bytes of letter codes, any other bytes are kept
+        :return: bytes of the same length
+        """
+
+        return bytes(table).translate(self.translation())
 
     def __str__(self):
-        return str(set("{0}".format(" ".join(str(self.leads[l]) for l in self.leads)).split()))
+        return str(set(self.leads()))
 
 
 class Rotor:
@@ -328,10 +387,82 @@ class Enigma:
         :return: decoded or encoded string
         """
 
-        encoded_string = ""
-        for c in plain_text:
-            encoded_string += str(self.encode_character(c))
-        return encoded_string
+        if plain_text.isascii() and plain_text.isalpha() and plain_text.isupper():
+            # all the letters at once (see encode_bytes()):
+            return self.encode_bytes(plain_text.encode(), "error").decode()
+        return "".join(self.encode_character(c) for c in plain_text)
+
+    def encode_bytes(self, data, non_letters = "keep"):
+        """Encode or decode ASCII text given as bytes using the current Enigma
+        settings (see encode_into())
+
+        :param data: bytes-like ASCII text
+        :param non_letters: "keep", "drop" or "error"
+        :return: encoded bytes
+        """
+
+        output = bytearray(memoryview(data).nbytes)
+        del output[self.encode_into(data, output, non_letters):]
+        return bytes(output)
+
+    def encode_into(self, source, target, non_letters = "keep"):
+        """Encode or decode ASCII text from a buffer into a preallocated buffer
+        using the current Enigma settings (see CompiledEnigma.encode_into())
+
+        :param source: bytes-like ASCII text
+        :param target: writable bytes-like object at least as long as source,
+                       may be the source itself
+        :param non_letters: "keep", "drop" or "error"
+        :return: number of bytes written to target
+        """
+
+        wiring = self._wiring()
+        if getattr(self, "_compiled_wiring", None) != wiring:
+            # first use, or the plugboard or the wiring changed since compiled:
+            rewired = getattr(self, "_compiled_wiring", wiring)[0] != wiring[0]
+            self.share_tables({} if rewired else getattr(self, "_cores", {}))
+        rotors = self.rotors[:-1]
+        self._compiled.positions = [r.get_position() for r in rotors]
+        written = self._compiled.encode_into(source, target, non_letters)
+        for rotor, position in zip(rotors, self._compiled.positions):
+            rotor.position = position
+        return written
+
+    def share_tables(self, cores):
+        """Compile the machine for encode_into() (see CompiledEnigma) sharing
+        the wiring tables and core permutations in cores
+
+        The machine is compiled with the current wiring of its rotors and
+        reflector and the current plugboard. encode_into() compiles it again
+        when they change, with tables of its own if the wiring changed.
+
+        :param cores: dict shared by machines with the same reflector wiring and rotors
+        """
+
+        self._cores = cores
+        self._compiled_wiring = self._wiring()
+        compiled = CompiledEnigma(self.config, cores, [r.left_pins for r in self.rotors])
+        self._compiled = compiled.with_plugboard(self.plugboard)
+
+    def _wiring(self):
+        """Return what the compiled machine depends on: the wiring of the
+        rotors and the reflector, and the plugboard"""
+
+        return tuple(r.left_pins for r in self.rotors), bytes(self.plugboard.table)
+
+    def encode_stream(self, blocks, non_letters = "keep"):
+        """Encode or decode blocks of ASCII text one by one (see encode_bytes())
+
+        The rotors keep stepping from one block to the next, so the blocks are
+        encoded just like the whole text at once.
+
+        :param blocks: iterable of bytes-like blocks, e.g. read_blocks()
+        :param non_letters: "keep", "drop" or "error"
+        :return: generator of encoded blocks (bytes)
+        """
+
+        for block in blocks:
+            yield self.encode_bytes(block, non_letters)
 
     def rotate_n_steps(self, n):
         """Position rotors forward n-steps
@@ -357,7 +488,8 @@ class Enigma:
     def reset_rotors(self):
         """Set rotor positions back to initial position"""
         for r,p in zip(self.rotors[:-1],self.config.rotors_pos):
-            r.position = self.input_ring.index(p)
+            # adjusted for the ring setting like in Rotor.__init__()
+            r.position = self.input_ring.index(p) - r.ring_setting
 
     def encode_character(self, character):
         """Encode or decode a character using the current Enigma settings.
@@ -395,6 +527,131 @@ class Enigma:
         character = self.plugboard.encode(character)
         return character
 
+    def scrambler_permutations(self, count, cores=None):
+        """Return the permutations of the rotors and the reflector (without the
+        plugboard) used to encode the next count characters
+
+        Rotors are stepped just like when encoding count characters. The
+        permutation of a step is 26 bytes, byte i is the index of the letter
+        the i-th letter of the alphabet is encoded to. Only the right-most rotor
+        moves on most steps so the permutation of the other rotors and the
+        reflector (the core) is computed once for every position of these
+        rotors and combined with the right-most rotor using bytes.translate().
+
+        :param count: number of steps
+        :param cores: optional dict to share the wiring tables and core
+                      permutations between machines with the same reflector
+                      wiring and rotors
+        :return: list of permutations (bytes)
+        """
+
+        if cores is None:
+            cores = {}
+        self._scrambler_tables(cores)
+        rotor_in, rotor_out = cores["rotor_in"], cores["rotor_out"]
+
+        perms = []
+        for positions in self._stepped_positions(count):
+            core = _scrambler_core(positions, cores)
+            perms.append(rotor_in[positions[0]].translate(core).translate(rotor_out[positions[0]]))
+        return perms
+
+    def position_permutations(self, cores=None):
+        """Return the permutations of the rotors and the reflector (see
+        scrambler_permutations()) for every position of the rotors
+
+        Positions are the positions of the rotors adjusted for the ring
+        settings (see Rotor.position), so the permutations are the same for
+        all the ring settings and shared in cores. The permutation of the
+        positions p0, p1, ... (right-most rotor first) has the index
+        p0 + 26 * p1 + 26 * 26 * p2 ...
+
+        :param cores: optional dict to share the tables between machines with
+                      the same reflector wiring and rotors
+        :return: list of permutations (bytes)
+        """
+
+        if cores is None:
+            cores = {}
+        if "positions" not in cores:
+            self._scrambler_tables(cores)
+            rotor_in, rotor_out = cores["rotor_in"], cores["rotor_out"]
+            perms = []
+            for positions in itertools.product(range(26), repeat=len(self.rotors) - 2):
+                core = _scrambler_core((0,) + positions[::-1], cores)
+                perms.extend(rotor_in[p].translate(core).translate(rotor_out[p]) for p in range(26))
+            cores["positions"] = perms
+        return cores["positions"]
+
+    def _scrambler_tables(self, cores):
+        """Add the wiring tables of the rotors and the reflector to cores"""
+
+        if "wirings" not in cores:
+            _scrambler_tables([r.left_pins for r in self.rotors], cores)
+
+    def forward_permutations(self, count, cores=None):
+        """Return the permutations of the rotors without the reflector used to
+        encode the next count characters
+
+        Byte i of the permutation of a step is the contact of the reflector
+        the i-th letter of the alphabet enters it at (see
+        scrambler_permutations()). A letter x is encoded at that step to the
+        letter y with the same permutation of the contact the reflector wires
+        the contact of x to, so the permutations of the rotors are shared by
+        all the wirings of the reflector.
+
+        :param count: number of steps
+        :param cores: optional dict to share the tables between machines with
+                      the same rotors
+        :return: list of permutations (bytes)
+        """
+
+        if cores is None:
+            cores = {}
+        if "forward" not in cores:
+            wirings = [bytes(self.input_ring.index(c) for c in r.left_pins) for r in self.rotors[:-1]]
+            # not cores["rotor_in"] of scrambler_permutations(), the cores may be shared:
+            cores["forward_in"] = [bytes((wirings[0][(c + p) % 26] - p) % 26 for c in range(26))
+                                   for p in range(26)]
+            cores["forward"] = wirings
+        wirings = cores["forward"]
+        rotor_in = cores["forward_in"]
+
+        perms = []
+        for positions in self._stepped_positions(count):
+            key = ("forward",) + tuple(positions[1:])
+            core = cores.get(key)
+            if core is None:
+                core = []
+                for c in range(26):
+                    prev = 0
+                    for k in range(1, len(positions)):
+                        c = wirings[k][(c + positions[k] - prev) % 26]
+                        prev = positions[k]
+                    core.append((c - prev) % 26)
+                core = bytes(core) + bytes(range(26, 256))
+                cores[key] = core
+            perms.append(rotor_in[positions[0]].translate(core))
+        return perms
+
+    def _stepped_positions(self, count):
+        """Step the rotors count times, yielding the positions of the rotors
+        (right-most first) after every step"""
+
+        rotors = self.rotors[:-1]
+        positions = [r.get_position() for r in rotors]
+        notches = [r.right_pins.index(r.notch) if r.notch else -1 for r in rotors]
+        for i in range(count):
+            # same stepping as rotate_n_steps(1):
+            if positions[0] == notches[0] or positions[1] == notches[1]:
+                if positions[1] == notches[1]:
+                    positions[2] = (positions[2] + 1) % 26
+                positions[1] = (positions[1] + 1) % 26
+            positions[0] = (positions[0] + 1) % 26
+            yield positions
+        for rotor, position in zip(rotors, positions):
+            rotor.position = position
+
     def __str__(self):
         return str(self.config)
 
@@ -406,3 +663,377 @@ class Enigma:
                                             self.plugboard)
 
 
+
+class CompiledEnigma:
+    """Compiled tables of an Enigma config and the positions of its rotors
+
+    Compiling turns the config into byte tables once: the plugboard together
+    with the way into and out of the right-most rotor, and the permutations of
+    the other rotors and the reflector (see Enigma.scrambler_permutations())
+    shared in cores by all machines with the same reflector wiring and rotors.
+    The tables never change, the state of the machine is just the positions of
+    the rotors (adjusted for the ring settings, see Rotor.position), right-most
+    first. A search branches from a state with clone() and seek() instead of
+    building a new Enigma and calling rotate_n_steps().
+
+    Example:
+        machine = CompiledEnigma(EnigmaConfig.from_config_string("B I-II-III 1-1-1 A-A-Z HL-MO"))
+        branch = machine.clone()
+        branch.seek(100)
+        branch.encode_string("HELLOWORLD")
+    """
+
+    def __init__(self, cnf, cores = None, wirings = None):
+        """Compile an Enigma config
+
+        :param cnf: EnigmaConfig
+        :param cores: optional dict shared by machines with the same reflector
+                      wiring and rotors
+        :param wirings: optional wirings (see Rotor.left_pins) of the rotors
+                        and the reflector, right-most first, e.g. to compile a
+                        rewired reflector
+        """
+
+        alphabet = Rotor.supported_rotors['Alphabet']
+        labels = list(cnf.rotors) + [cnf.reflector]
+        for label in labels:
+            if label not in Rotor.supported_rotors:
+                raise ValueError("Rotor {} not supported".format(label))
+        if wirings is None:
+            wirings = [Rotor.supported_rotors[label][:26] for label in labels]
+        rings = [ring - 1 for ring in cnf.ring_settings]
+        self.config = cnf
+        self.start = tuple((alphabet.index(p) - ring) % 26 for p, ring in zip(cnf.rotors_pos, rings))
+        # since the ring setting does not change the notch (see Rotor.__init__()):
+        self.notches = tuple((alphabet.index(Rotor.supported_rotors[label][26]) - ring) % 26
+                             if len(Rotor.supported_rotors[label]) > 26 else -1
+                             for label, ring in zip(labels[:2], rings))
+        self.cores = {} if cores is None else cores
+        _scrambler_tables(wirings, self.cores)
+        self.rotor_in = self.cores["rotor_in"]
+        # the plugboard tables are shared too, searches mostly keep the plugboard:
+        key = ("plugs",) + tuple(cnf.plugs)
+        if key not in self.cores:
+            self.cores[key] = self._plugboard_tables(Plugboard(cnf.plugs))
+        self.inputs, self.outputs = self.cores[key]
+        self.positions = list(self.start)
+
+    def _plugboard_tables(self, plugboard):
+        """Return the plugboard folded into the tables of the right-most rotor:
+        ASCII letter => letter code after the plugboard (255 for the other
+        bytes) and out of the right-most rotor through the plugboard to the
+        ASCII letter at every position"""
+
+        return (plugboard.compose(LETTER_INPUTS),
+                [plugboard.compose(rotor_out[:26]).translate(FROM_CODES) for rotor_out in self.cores["rotor_out"]])
+
+    def with_plugboard(self, plugboard):
+        """Return a machine in the same state with another plugboard
+
+        Only the tables of the plugboard are built, the rotor tables are
+        shared, so a search can edit one Plugboard (see Plugboard.add(),
+        Plugboard.remove()) and try every hypothesis cheaply.
+
+        :param plugboard: Plugboard
+        :return: CompiledEnigma
+        """
+
+        machine = self.clone()
+        machine.config = EnigmaConfig(self.config.reflector, self.config.rotors, self.config.rotors_pos,
+                                      self.config.ring_settings, plugboard.leads())
+        machine.inputs, machine.outputs = self._plugboard_tables(plugboard)
+        return machine
+
+    def clone(self):
+        """Return a machine sharing the tables, in the same state"""
+
+        machine = object.__new__(CompiledEnigma)
+        machine.__dict__.update(self.__dict__)
+        machine.positions = list(self.positions)
+        return machine
+
+    def reset(self):
+        """Set the rotors back to the positions of the config"""
+
+        self.positions = list(self.start)
+
+    def seek(self, offset):
+        """Set the rotors to the positions after encoding offset letters from
+        the positions of the config (see Enigma.rotate_n_steps())
+
+        Only the right-most rotor moves until it reaches its notch, so these
+        steps are taken at once.
+
+        :param offset: number of letters
+        """
+
+        positions = self.positions = list(self.start)
+        notches = self.notches
+        while offset > 0:
+            if positions[0] != notches[0] and positions[1] != notches[1]:
+                run = min(offset, (notches[0] - positions[0]) % 26 if notches[0] >= 0 else offset)
+                positions[0] = (positions[0] + run) % 26
+                offset -= run
+                continue
+            # same stepping as rotate_n_steps(1):
+            if positions[1] == notches[1]:
+                positions[2] = (positions[2] + 1) % 26
+            positions[1] = (positions[1] + 1) % 26
+            positions[0] = (positions[0] + 1) % 26
+            offset -= 1
+
+    def encode_into(self, source, target, non_letters = "keep"):
+        """Encode or decode ASCII text from a buffer into a preallocated buffer
+
+        Any object supporting the buffer protocol with byte sized items can be
+        read and written, e.g. bytes, bytearray, memoryview, array.array("B"),
+        mmap or a NumPy uint8 array, nothing is copied. Letters are encoded as
+        upper case letters, the plugboard and the input and output of the
+        rotors are applied with byte tables (like bytes.translate()) and the
+        permutation of the other rotors and the reflector (see
+        Enigma.scrambler_permutations()) is only looked up when the middle
+        rotor steps. Other bytes (spaces, punctuation, new lines) do not step
+        the rotors and are handled by the policy: "keep" them where they are,
+        "drop" them or raise a ValueError ("error") before anything is encoded.
+
+        :param source: bytes-like ASCII text
+        :param target: writable bytes-like object at least as long as source,
+                       may be the source itself
+        :param non_letters: "keep", "drop" or "error"
+        :return: number of bytes written to target
+        """
+
+        if non_letters not in NON_LETTER_POLICIES:
+            raise ValueError("Expected one of {0} for non-letters.".format(NON_LETTER_POLICIES))
+        source = memoryview(source)
+        output = memoryview(target)
+        if source.itemsize != 1 or output.itemsize != 1 or output.readonly:
+            raise ValueError("Expected a buffer of bytes and a writable buffer of bytes.")
+        source, output = source.cast("B"), output.cast("B")
+        if len(output) < len(source):
+            raise ValueError("Expected a target buffer of at least {0} bytes.".format(len(source)))
+        if non_letters == "error" and len(source.tobytes().translate(None, ASCII_LETTERS)):
+            raise ValueError("Only letters can be encoded.")
+        inputs, outputs, rotor_in, cores = self.inputs, self.outputs, self.rotor_in, self.cores
+        keep = non_letters == "keep"
+
+        positions = list(self.positions)
+        notches = self.notches
+        core = _scrambler_core(positions, cores)
+        written = 0
+        for byte in source:
+            code = inputs[byte]
+            if code == 255:
+                if keep:
+                    output[written] = byte
+                    written += 1
+                continue
+            # same stepping as rotate_n_steps(1), the core only changes with the middle rotor:
+            if positions[0] == notches[0] or positions[1] == notches[1]:
+                if positions[1] == notches[1]:
+                    positions[2] = (positions[2] + 1) % 26
+                positions[1] = (positions[1] + 1) % 26
+                core = _scrambler_core(positions, cores)
+            right = positions[0] = (positions[0] + 1) % 26
+            output[written] = outputs[right][core[rotor_in[right][code]]]
+            written += 1
+        self.positions = positions
+        return written
+
+    def encode_bytes(self, data, non_letters = "keep"):
+        """Encode or decode ASCII text given as bytes (see encode_into())
+
+        :param data: bytes-like ASCII text
+        :param non_letters: "keep", "drop" or "error"
+        :return: encoded bytes
+        """
+
+        output = bytearray(memoryview(data).nbytes)
+        del output[self.encode_into(data, output, non_letters):]
+        return bytes(output)
+
+    def encode_string(self, text):
+        """Encode or decode a string of upper case letters (see encode_into())"""
+
+        return self.encode_bytes(text.encode(), "error").decode()
+
+    def __str__(self):
+        return str(self.config)
+
+
+def encode(machine, text, offset = 0, non_letters = "keep"):
+    """Encode or decode text with a compiled machine starting offset letters
+    after the positions of its config
+
+    The machine is not changed, the positions are copied (see
+    CompiledEnigma.clone()). The permutations of the rotors in the middle are
+    added to the shared cores dict on first use (see _scrambler_core()): a
+    single dict assignment of a permutation that is the same whoever computes
+    it, so threads can share one machine and its tables without locks and at
+    worst compute a permutation twice.
+
+    :param machine: CompiledEnigma
+    :param text: str or bytes-like ASCII text
+    :param offset: number of letters encoded before the text
+    :param non_letters: "keep", "drop" or "error" (see CompiledEnigma.encode_into())
+    :return: encoded text, str for a str and bytes otherwise
+    """
+
+    state = machine.clone()
+    state.seek(offset)
+    if isinstance(text, str):
+        return state.encode_bytes(text.encode(), non_letters).decode()
+    return state.encode_bytes(text, non_letters)
+
+def _scrambler_tables(wirings, cores):
+    """Add the wiring tables of the rotors and the reflector (wirings as in
+    Rotor.left_pins, right-most first) to cores"""
+
+    if "wirings" not in cores:
+        alphabet = Rotor.supported_rotors['Alphabet']
+        padding = bytes(range(26, 256))
+        wirings = [bytes(alphabet.index(c) for c in w[:26]) for w in wirings]
+        inverse = [bytes(w.index(i) for i in range(26)) for w in wirings[:-1]]
+        # right-most rotor to the core and back for every position:
+        cores["rotor_in"] = [bytes((wirings[0][(c + p) % 26] - p) % 26 for c in range(26)) for p in range(26)]
+        cores["rotor_out"] = [bytes((inverse[0][(c + p) % 26] - p) % 26 for c in range(26)) + padding
+                              for p in range(26)]
+        cores["wirings"] = wirings, inverse
+
+def _scrambler_core(positions, cores):
+    """Return the permutation of all the rotors but the right-most one and
+    the reflector at the positions (right-most rotor first)"""
+
+    core = cores.get(tuple(positions[1:]))
+    if core is None:
+        wirings, inverse = cores["wirings"]
+        reflector = wirings[-1]
+        # pass every letter through the other rotors and the reflector,
+        # relative to the position of the right-most rotor:
+        core = []
+        for c in range(26):
+            prev = 0
+            for k in range(1, len(positions)):
+                c = wirings[k][(c + positions[k] - prev) % 26]
+                prev = positions[k]
+            c = reflector[(c - prev) % 26]
+            for k in range(len(positions) - 1, 0, -1):
+                nxt = positions[k + 1] if k + 1 < len(positions) else 0
+                c = inverse[k][(c + positions[k] - nxt) % 26]
+            core.append((c - positions[1]) % 26)
+        core = bytes(core) + bytes(range(26, 256))
+        cores[tuple(positions[1:])] = core
+    return core
+
+
+def read_blocks(source, block_size = STREAM_BLOCK_SIZE):
+    """Yield blocks of bytes read from a binary file object
+
+    Regular files of at least MMAP_THRESHOLD bytes are memory mapped instead
+    of read, anything else (pipes, stdin) is read block by block. Only one
+    block is in memory at a time.
+
+    :param source: binary file object, e.g. open(path, "rb") or sys.stdin.buffer
+    :param block_size: number of bytes in a block
+    :return: generator of bytes
+    """
+
+    try:
+        size = os.fstat(source.fileno()).st_size if source.tell() == 0 else 0
+    except (AttributeError, OSError, ValueError):
+        # not a regular file, e.g. a pipe or an in memory stream
+        size = 0
+    if size >= MMAP_THRESHOLD:
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, size, block_size):
+                yield mapped[start:start + block_size]
+        return
+    while True:
+        block = source.read(block_size)
+        if not block:
+            return
+        yield block
+
+def encode_file(cnf, source, target, block_size = STREAM_BLOCK_SIZE, non_letters = "keep"):
+    """Encrypt or decrypt a binary file object into another one block by
+    block, in constant memory (see Enigma.encode_into())
+
+    :param cnf: EnigmaConfig
+    :param source: binary file object to read, e.g. sys.stdin.buffer
+    :param target: binary file object to write, e.g. sys.stdout.buffer
+    :param block_size: number of bytes read at once
+    :param non_letters: "keep", "drop" or "error"
+    :return: (number of bytes read, seconds)
+    """
+
+    time_start = time.time()
+    machine = Enigma(cnf)
+    count = 0
+    # every block is encoded into the same buffer:
+    output = bytearray(block_size)
+    for block in read_blocks(source, block_size):
+        count += len(block)
+        target.write(memoryview(output)[:machine.encode_into(block, output, non_letters)])
+    return count, time.time() - time_start
+
+# tables of the wheel orders (reflector and rotors) encoded by this process:
+_batch_cores = {}
+
+def _encode_batch(non_letters, chunk):
+    """Return (config string, encoded text) of every (config, text) of a chunk"""
+
+    encoded = []
+    for config, text in chunk:
+        cnf = EnigmaConfig.from_config_string(config) if isinstance(config, str) else config
+        key = (cnf.reflector, tuple(cnf.rotors))
+        if key not in _batch_cores and len(_batch_cores) >= MAX_BATCH_WHEEL_ORDERS:
+            _batch_cores.clear()
+        machine = CompiledEnigma(cnf, _batch_cores.setdefault(key, {}))
+        encoded.append((str(config), machine.encode_bytes(text.encode(), non_letters).decode()))
+    return encoded
+
+def encode_many(messages, processes = 0, chunk_size = BATCH_CHUNK_SIZE, non_letters = "keep", output = None):
+    """Encrypt or decrypt many messages, every one with its own settings
+
+    Messages are split into chunks of chunk_size encoded by a pool of
+    processes. A process keeps the tables of the wheel orders it has seen
+    (see CompiledEnigma), so messages with the same reflector and
+    rotors share them whatever their ring settings, positions and plugs.
+
+    Example:
+        encode_many([("B I-II-III 1-1-1 A-A-Z HL-MO", "HELLOWORLD"),
+                     (EnigmaConfig.from_config_string("C II-IV-V 3-8-12 Q-E-V"), "ATTACK AT DAWN")])
+
+    :param messages: iterable of (config string or EnigmaConfig, text)
+    :param processes: number of processes to use. 0 = all, 1 = no pool
+    :param chunk_size: number of messages encoded at once by a process
+    :param non_letters: "keep", "drop" or "error" (see Enigma.encode_into())
+    :param output: optional text file object, the encoded messages are written
+                   to it as JSON lines {"config": ..., "text": ...} as they
+                   are encoded instead of being kept in memory
+    :return: list of encoded texts in the order of the messages, or the number
+             of messages written to output
+    """
+
+    if non_letters not in NON_LETTER_POLICIES:
+        raise ValueError("Expected one of {0} for non-letters.".format(NON_LETTER_POLICIES))
+    messages = iter(messages)
+    chunks = iter(lambda: list(itertools.islice(messages, chunk_size)), [])
+    encode = functools.partial(_encode_batch, non_letters)
+    encoded = []
+    count = 0
+    # loaded here, a plain encryption does not pay for starting multiprocessing:
+    import multiprocessing as mp
+    pool = None if processes == 1 else mp.Pool(processes or mp.cpu_count())
+    try:
+        # imap() keeps the order of the chunks whichever process finishes first:
+        for chunk in (map if pool is None else pool.imap)(encode, chunks):
+            count += len(chunk)
+            if output is None:
+                encoded.extend(text for config, text in chunk)
+            else:
+                output.writelines(json.dumps({"config": config, "text": text}) + "\n" for config, text in chunk)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return encoded if output is None else count
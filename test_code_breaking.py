@@ -1,5 +1,7 @@
 import pytest
+import itertools
 import code_breaking
+import code_breaking_multiproc
 
 def test_missing_information():
 
@@ -35,6 +37,23 @@ def test_missing_information():
     expected_possibilities["plugboard"] = []
     assert (config_possibilities == expected_possibilities)
 
+def test_search_space_ranges():
+
+    # ranges of the search space cover exactly all possible settings:
+    enigma_config = 'C III-?-["II","I"]-V [4,5,6]-24-1-7 A-?-Q-F AQ-?S-ED-["ZU","ZF","ZK"]'
+    all_settings = set(str(cnf) for cnf in code_breaking.all_possible_settings(enigma_config))
+    count = code_breaking.count_settings(enigma_config)
+    assert (count == 81900)
+    ranged_settings = [str(cnf) for start in range(0, count, 1000)
+                       for cnf in code_breaking.settings_in_range(enigma_config, start, min(start + 1000, count))]
+    assert (len(ranged_settings) == len(all_settings))
+    assert (set(ranged_settings) == all_settings)
+
+    # crib positions change the slowest:
+    configs = code_breaking.configs_in_range('B Beta-I-III 23-2-10 ?-?-? VH-PT-ZG-BJ-EY-FS', [3, 7], 17570, 17580)
+    assert ([pos for cnf, pos in configs] == [3] * 6 + [7] * 4)
+    assert (str(configs[6][0]) == 'B Beta-I-III 23-2-10 A-A-A VH-PT-ZG-BJ-EY-FS')
+
 def test_code_breaking():
 
     assert(code_breaking.possible_crib_positions("DMEXBMKYCVPNQBEDHXVPZGKMTFFBJRPJTLHLCHOTKOYXGGHZ", "SECRETS")
@@ -96,6 +115,88 @@ def test_code_breaking():
                                                              "? V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT")[0]
             == [('B V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT', 'YOUCANFOLLOWMYDOGONINSTAGRAMATTALESOFHOFFMANN', 'PQUHRSLDYXNGOKMABEFZCWVJIT')])
 
+def test_code_breaking_threads():
+
+    cipher = "ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY"
+    settings = '? ["II","IV","Beta","Gamma"]-["II","IV","Beta","Gamma"]-["II","IV","Beta","Gamma"] [8,20,24]-[8,20,24]-[8,20,24] E-M-Y FH-TS-BE-UQ-KD-AL'
+    # threads sharing the compiled tables find the same solutions as a single process:
+    solutions = code_breaking_multiproc.decrypt_cipher_threads(cipher, "THOUSANDS", settings, 500, threads=4)[0]
+    assert (solutions.ranked() == code_breaking.decrypt_cipher(cipher, "THOUSANDS", settings)[0].ranked())
+    assert (solutions[0] == ('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL',
+                             'SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTINGWHERETHEYPUTTHEIRACORNS'))
+
+def test_ranked_results():
+
+    # a short crib fits many settings, the most plausible text comes first:
+    solutions = code_breaking.decrypt_cipher(
+        "ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY",
+        "TH",
+        'C II-Gamma-IV 24-8-20 E-?-? FH-TS-BE-UQ-KD-AL')[0]
+    assert (len(solutions) == code_breaking.TOP_RESULTS and solutions.discarded > 0)
+    assert (solutions[0] == ('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL',
+                             'SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTINGWHERETHEYPUTTHEIRACORNS'))
+    scores = [score for score, result in solutions.ranked()]
+    assert (scores == sorted(scores, reverse=True))
+
+    # only the top results are kept, the same result only once:
+    ranked = code_breaking.RankedResults(top=2)
+    for score, result in [(1, "B"), (3, "A"), (1, "B"), (0, "D"), (2, "C")]:
+        ranked.add(score, result)
+    assert (ranked == ["A", "C"] and ranked.discarded == 2)
+    merged = code_breaking.RankedResults(top=3).merge(ranked)
+    assert (merged.ranked() == [(3, "A"), (2, "C")] and merged.discarded == 2)
+
+    words = {"THE", "REST", "THERE"}
+    assert (code_breaking.dictionary_hit_rate("THEREST", words) == 1.0)
+    assert (code_breaking.dictionary_hit_rate("XXTHEXX", words) == 3 / 7)
+    assert (code_breaking.plausibility("THEREST", words=words) > code_breaking.plausibility("THEREST", words=set()))
+
+def test_reflector_variants():
+
+    variants = code_breaking.reflector_variants(code_breaking.Rotor.supported_rotors['B'])
+    assert (len(variants) == 8580 == len(set(variants.wirings)))
+
+    # the crib selects the rewired reflector out of all the wirings at once:
+    wiring = variants.wirings[1234]
+    cnf = code_breaking.EnigmaConfig.from_config_string('B II-IV-I 3-14-22 Q-E-V AB-CD')
+    enigma = code_breaking.Enigma(cnf)
+    enigma.rotors[-1].left_pins = wiring
+    cipher = enigma.encode_string("ATTACKATDAWNONTHEWESTERNFRONT")
+    solutions = code_breaking.check_reflector_variants(cipher, "ATTACKATDAWN", [cnf])
+    assert (solutions[0] == ('B II-IV-I 3-14-22 Q-E-V AB-CD', "ATTACKATDAWNONTHEWESTERNFRONT", wiring))
+    assert (all("ATTACKATDAWN" in text for config, text, reflector in solutions))
+
+def test_reflector_rewirings():
+
+    reflector = code_breaking.Rotor.supported_rotors['B']
+    # streamed wirings are the same as the listed ones:
+    assert (set(code_breaking.reflector_rewirings(reflector, 2))
+            == set(code_breaking.permutate_reflector_by_wire_swap(reflector, 2)))
+
+    # required wires are propagated, contradicting wirings are never generated:
+    alphabet = code_breaking.Rotor.supported_rotors['Alphabet']
+    required = {0: 1, 1: 0, 2: 3, 3: 2}
+    wirings = list(code_breaking.reflector_rewirings(reflector, 3, required))
+    assert (wirings and all(wiring[0] == 'B' and wiring[2] == 'D' for wiring in wirings))
+    assert (len(wirings) == len(set(wirings)))
+    assert (list(code_breaking.reflector_rewirings(reflector, 1, required)) == [])
+    assert (all(wiring[0] == 'B' and wiring[2] == 'D' for wiring in
+                itertools.islice(code_breaking.reflector_rewirings(reflector, None, required), 100)))
+
+    # a reflector with three swapped wires and an unknown one:
+    enigma = code_breaking.Enigma(code_breaking.EnigmaConfig.from_config_string('B II-IV-I 3-14-22 Q-E-V AB-CD'))
+    wiring = wirings[-1]
+    enigma.rotors[-1].left_pins = wiring
+    cipher = enigma.encode_string("ATTACKATDAWNONTHEWESTERNFRONT")
+    solutions = code_breaking.decrypt_cipher_reflector_rewired(cipher, "ATTACKATDAWN",
+                                                               'B II-IV-I 3-14-22 Q-E-V AB-CD', 3)[0]
+    assert (('B II-IV-I 3-14-22 Q-E-V AB-CD', "ATTACKATDAWNONTHEWESTERNFRONT", wiring) in solutions)
+    solutions = code_breaking.decrypt_cipher_reflector_rewired(cipher, "ATTACKATDAWN",
+                                                               '? II-IV-I 3-14-22 Q-E-V AB-CD')[0]
+    config, text, partial = solutions[0]
+    assert (text.startswith("ATTACKATDAWN") and len(solutions) == 1)
+    assert (all(letter in ('?', known) for letter, known in zip(partial, wiring)))
+
 #def test_code_breaking_multiproc():
 #    assert (code_breaking.decrypt_cipher_reflector_scrambled_multiproc("HWREISXLGTTBYVXRCWWJAKZDTVZWKBDJPVQYNEQIOTIFX",
 #                                                             "INSTAGRAM",
@@ -0,0 +1,91 @@
+import io
+import os
+import sys
+import json
+import signal
+import time
+import subprocess
+import pytest
+import code_breaking_batch
+
+cipher = "ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY"
+plain = "SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTINGWHERETHEYPUTTHEIRACORNS"
+
+def test_batch_jobs(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("ENIGMA_CACHE_DIR", str(tmp_path))
+    job_file = tmp_path / "nightly.toml"
+    job_file.write_text('output = "results.jsonl"\n'
+                        '[defaults]\nbackend = "threads"\nprocesses = 2\nstop_score = "plausible"\ncache = true\ntop = 1\n'
+                        '[[jobs]]\nname = "threads"\nencrypted_text = "{0}"\ncrib = "THOUSANDS"\n'
+                        'settings = "C II-Gamma-IV [8,20,24]-8-20 E-M-Y FH-TS-BE-UQ-KD-AL"\n'
+                        '[jobs.prior]\nhistory = ["C II-Gamma-IV 24-8-20 A-A-A"]\n'
+                        '[[jobs]]\nname = "single"\nbackend = "single"\nencrypted_text = "{0}"\ncrib = "THOUSANDS"\n'
+                        'settings = "C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL"\n'
+                        '[[jobs]]\nencrypted_text = "{0}"\ncrib = "THOUSANDS"\nsettings = "C II-Gamma-IV 24-8-?"\n'
+                        .format(cipher))
+    jobs, output = code_breaking_batch.load_jobs(str(job_file))
+    assert (output == "results.jsonl" and [job["backend"] for job in jobs] == ["threads", "single", "threads"])
+
+    results = io.StringIO()
+    summary = code_breaking_batch.run_batch(jobs, results)
+    lines = [json.loads(line) for line in results.getvalue().splitlines()]
+    assert (len(lines) == 4 and lines[-1] == {"summary": summary})
+    assert ([line["name"] for line in lines[:3]] == ["threads", "single", "3"])
+    for line in lines[:2]:
+        assert (line["solutions"][0][1:] == ['C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain])
+    # a broken job is reported, the other ones still run:
+    assert ("error" in lines[2] and summary["failed"] == 1 and summary["jobs"] == 3)
+    assert (set(summary["backends"]) == {"threads", "single"})
+
+    with pytest.raises(ValueError):
+        code_breaking_batch.expand_jobs({"jobs": [{"encrypted_text": cipher, "crib": "THOUSANDS"}]})
+    with pytest.raises(ValueError):
+        code_breaking_batch.expand_jobs({"defaults": {"backend": "gpu"},
+                                         "jobs": [{"encrypted_text": cipher, "crib": "A", "settings": "B"}]})
+
+def test_batch_cluster_down():
+
+    # no coordinator listens on the port, the job fails and the next one still runs:
+    jobs = code_breaking_batch.expand_jobs({"defaults": {"server": "127.0.0.1", "timeout": 5},
+                                            "jobs": [{"backend": "cluster", "encrypted_text": cipher,
+                                                      "crib": "THOUSANDS", "settings": "C II-Gamma-IV 24-8-20 E-M-?"},
+                                                     {"backend": "single", "encrypted_text": cipher,
+                                                      "crib": "THOUSANDS",
+                                                      "settings": "C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL"}]})
+    results = io.StringIO()
+    summary = code_breaking_batch.run_batch(jobs, results)
+    lines = [json.loads(line) for line in results.getvalue().splitlines()]
+    assert (lines[0]["error"].startswith("ConnectionRefusedError"))
+    assert (lines[1]["solutions"][0][1:] == ['C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain])
+    assert (summary["failed"] == 1 and summary["jobs"] == 2)
+
+def test_batch_cluster():
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    # a coordinator and one client, each with its worker processes in a group of its own:
+    processes = [subprocess.Popen([sys.executable, "-c", code], cwd=here, start_new_session=True,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for code in ["import code_breaking_distributed; code_breaking_distributed.runcoordinator()",
+                              "import code_breaking_distributed; code_breaking_distributed.runclient('127.0.0.1', 100, 2)"]]
+    try:
+        settings = "C II-Gamma-IV 24-8-20 E-M-? FH-TS-BE-UQ-KD-AL"
+        for attempt in range(100):
+            # until the coordinator is up:
+            jobs = code_breaking_batch.expand_jobs({"jobs": [{"backend": "cluster", "encrypted_text": cipher,
+                                                              "crib": "THOUSANDS", "settings": settings,
+                                                              "timeout": 60}]})
+            results = io.StringIO()
+            summary = code_breaking_batch.run_batch(jobs, results)
+            line = json.loads(results.getvalue().splitlines()[0])
+            if "ConnectionRefusedError" not in line.get("error", ""):
+                break
+            time.sleep(0.1)
+        assert (summary["failed"] == 0)
+        # the most plausible solution first, with its score and without the client's hostname:
+        assert (line["solutions"][0][1:] == ['C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain])
+        assert (line["solutions"][0][0] == pytest.approx(code_breaking_batch.plausibility(plain)))
+    finally:
+        for process in processes:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
@@ -0,0 +1,26 @@
+import pytest
+import code_breaking
+import code_breaking_bombe
+
+def test_bombe():
+
+    # the Bombe finds the same solutions as the brute force:
+    case = ("SDNTVTPHRBNWTLMZTQKZGADDQYPFNHBPNHCQGBGMZPZLUAVGDQVYRBFYYEIXQWVTHXGNW",
+            "TUTOR",
+            "A V-III-IV 24-12-10 S-W-U WP-RJ-A?-VF-I?-HN-CG-BS")
+    assert (sorted(code_breaking_bombe.decrypt_cipher_bombe(*case)[0])
+            == sorted(code_breaking.decrypt_cipher(*case)[0]))
+
+    # a known plug of a letter rejects all the other guesses:
+    unknown, lead_options = code_breaking_bombe.bombe_plugboard_constraints('B Beta-I-III 23-2-10 ?-M-G VH-?S-?')
+    assert (unknown and lead_options[0] == ["VH"])
+    allowed = code_breaking_bombe.allowed_steckers(unknown, lead_options)
+    assert (allowed[code_breaking_bombe.ALPHABET.index("V")] == 1 << code_breaking_bombe.ALPHABET.index("H"))
+    assert (not allowed[code_breaking_bombe.ALPHABET.index("S")] >> code_breaking_bombe.ALPHABET.index("S") & 1)
+
+    # a completely unknown plugboard, the plugs of the letters of the menu are deduced:
+    solutions = code_breaking_bombe.decrypt_cipher_bombe("CMFSUPKNCBMUYEQVVDYKLRQZTPUFHSWWAKTUGXMPAMYAFITXIJKMH",
+                                                         "UNIVERSITY",
+                                                         'B Beta-I-III 23-2-10 ?-M-G ?')[0]
+    assert (('B Beta-I-III 23-2-10 I-M-G EY-FS-GZ-HV-PT',
+             'IHOPEYOUAFEENBOYINGTHEUNIVERSITYOFJATHEXPERIENCESRFAR') in solutions)
@@ -0,0 +1,75 @@
+import code_breaking
+import code_breaking_cache
+import code_breaking_multiproc
+
+cipher = "ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY"
+plain = "SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTINGWHERETHEYPUTTHEIRACORNS"
+solution = ('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain)
+
+def test_result_cache(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("ENIGMA_CACHE_DIR", str(tmp_path))
+    searched = []
+    check = code_breaking.check_enigma_config_range
+    def counting_check(encrypted_text, crib, config_string, start, stop, cores = None):
+        searched.append(stop - start)
+        return check(encrypted_text, crib, config_string, start, stop, cores)
+    monkeypatch.setattr(code_breaking, "check_enigma_config_range", counting_check)
+
+    cache = code_breaking_cache.ResultCache()
+    settings = 'C ["II","IV"]-Gamma-IV [8,24]-8-20 EF-M-Y FH-TS-BE-UQ-KD-AL'
+    crib_positions = code_breaking.possible_crib_positions(cipher, "THOUSANDS")
+    total = code_breaking.count_settings(settings) * len(crib_positions)
+    first = code_breaking.decrypt_cipher(cipher, "THOUSANDS", settings, cache=cache)[0]
+    assert (first[0] == solution and sum(searched) == total)
+
+    # the same job is answered from the cache:
+    searched.clear()
+    assert (code_breaking.decrypt_cipher(cipher, "THOUSANDS", settings, cache=cache)[0] == first)
+    assert (sum(searched) == 0)
+
+    # a narrower job too, a wider one only searches what is new:
+    assert (code_breaking.decrypt_cipher(cipher, "THOUSANDS", 'C II-Gamma-IV [8,24]-8-20 E-M-Y FH-TS-BE-UQ-KD-AL',
+                                         cache=cache)[0][0] == solution)
+    assert (sum(searched) == 0)
+    wider = 'C ["II","IV","Beta"]-Gamma-IV [8,24]-8-20 EF-M-Y FH-TS-BE-UQ-KD-AL'
+    results = code_breaking.decrypt_cipher(cipher, "THOUSANDS", wider, cache=cache)[0]
+    assert (results[0] == solution)
+    assert (sum(searched) == (code_breaking.count_settings(wider) - code_breaking.count_settings(settings))
+            * len(crib_positions))
+
+    # an early stop keeps what was searched so far, a pool finishes the job:
+    other = 'C II-Gamma-IV [8,20,24]-8-20 E-M-Y FH-TS-BE-UQ-KD-AL'
+    code_breaking.decrypt_cipher_best_first(cipher, "THOUSANDS", other, stop_score=-float("inf"), chunk_size=20, cache=cache)
+    known = cache.lookup(cipher, "THOUSANDS", other)
+    missing = list(known.missing(0, code_breaking.count_settings(other) * len(crib_positions)))
+    assert (known.results[0] == solution and missing)
+    pool_results = code_breaking_multiproc.decrypt_cipher_threads(cipher, "THOUSANDS", other, threads=2, cache=cache)[0]
+    assert (pool_results[0] == solution)
+    assert (not list(cache.lookup(cipher, "THOUSANDS", other).missing(0, missing[-1][1])))
+
+def test_result_cache_eviction(tmp_path):
+
+    cache = code_breaking_cache.ResultCache(str(tmp_path), max_bytes=1)
+    results = code_breaking.RankedResults()
+    results.add(1.0, solution)
+    cache.store(cipher, "THOUSANDS", 'C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', [(0, 10)], results)
+    assert (not list(tmp_path.iterdir()))
+
+    cache = code_breaking_cache.ResultCache(str(tmp_path))
+    cache.store(cipher, "THOUSANDS", 'C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', [(0, 10), (5, 20)], results)
+    known = cache.lookup(cipher.lower(), "thousands", 'C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL')
+    assert (known.ranges == [[0, 20]] and known.results == [solution])
+    assert (list(known.missing(0, 30)) == [(20, 30)])
+
+def test_result_cache_gaps(tmp_path):
+
+    # the right rotor at M searched at 3 crib positions, the gaps of a job
+    # with any right rotor position are merged across the crib positions:
+    cache = code_breaking_cache.ResultCache(str(tmp_path))
+    cache.store(cipher, "THOUSANDS", 'C II-Gamma-IV 24-8-20 E-?-M', [(0, 3 * 26)], code_breaking.RankedResults())
+    known = cache.lookup(cipher, "THOUSANDS", 'C II-Gamma-IV 24-8-20 E-?-?')
+    assert (list(known.missing(0, 3 * 676)) == [(0, 312), (338, 676 + 312), (676 + 338, 2 * 676 + 312),
+                                                (2 * 676 + 338, 3 * 676)])
+    assert (list(known.missing(320, 330)) == [])
+    assert (list(known.missing(330, 340)) == [(338, 340)])
@@ -0,0 +1,27 @@
+import pytest
+import code_breaking_cribs
+
+def test_multiple_cribs():
+
+    cipher = "ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY"
+    plain = "SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTINGWHERETHEYPUTTHEIRACORNS"
+
+    assert (code_breaking_cribs.parse_cribs("thousands, TREES@20-22,SQUIRRELS@0")
+            == [("THOUSANDS", None), ("TREES", [20, 21, 22]), ("SQUIRRELS", [0])])
+    with pytest.raises(ValueError):
+        code_breaking_cribs.parse_cribs("NOT A CRIB")
+
+    # the positions of all the cribs match possible_crib_positions():
+    cribs = code_breaking_cribs.parse_cribs("SECRETS,NICEWORK,STRING@30-40")
+    masks = code_breaking_cribs.crib_position_masks("DMEXBMKYCVPNQBEDHXVPZGKMTFFBJRPJTLHLCHOTKOYXGGHZ", cribs)
+    for (crib, positions), mask in zip(cribs, masks):
+        expected = [pos for pos in code_breaking_cribs.possible_crib_positions(
+                    "DMEXBMKYCVPNQBEDHXVPZGKMTFFBJRPJTLHLCHOTKOYXGGHZ", crib) if positions is None or pos in positions]
+        assert ([pos for pos in range(48) if mask >> pos & 1] == expected)
+
+    # all the cribs are tried in one pass and the solution names the ones found:
+    solutions = code_breaking_cribs.decrypt_cipher_cribs(cipher, "SQUIRRELS@0,THOUSANDS,ACORNS,WALNUT,TREES@40",
+                                                         'C II-Gamma-IV 24-8-20 ?-?-Y FH-TS-BE-UQ-KD-AL',
+                                                         processes=1)[0]
+    assert (solutions == [('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain,
+                           'SQUIRRELS@0, THOUSANDS@14, ACORNS@76')])
@@ -0,0 +1,32 @@
+import pytest
+import code_breaking_depth
+from enigma import *
+
+def test_depth_cribbing():
+
+    plain = ["SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTING",
+             "THEWEATHERTODAYISCOLDANDWETWITHRAININTHEAFTERNOON",
+             "ATTACKATDAWNONTHEWESTERNFRONTWITHALLTHETANKS"]
+    keys = ['C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL',
+            'C II-Gamma-IV 24-8-20 Q-B-Z FH-TS-BE-UQ-KD-AL',
+            'C II-Gamma-IV 24-8-20 K-D-F FH-TS-BE-UQ-KD-AL']
+    cipher = [Enigma(EnigmaConfig.from_config_string(key)).encode_string(text) for key, text in zip(keys, plain)]
+    messages = list(zip(cipher, ["SQUIRRELS@0", "WEATHER", "ATTACK@0,DAWN"]))
+
+    # the daily key and the start positions of every message are recovered:
+    solutions = code_breaking_depth.decrypt_cipher_depth(
+        messages, '? ["II","IV","Gamma"]-["II","IV","Gamma"]-["II","IV","Gamma"] 24-8-[20,22] ?-?-? FH-TS-BE-UQ-KD-AL',
+        processes=1)[0]
+    assert (solutions == [('C II-Gamma-IV 24-8-20 ?-?-? FH-TS-BE-UQ-KD-AL', tuple(keys), tuple(plain))])
+
+    # a message of another day leaves no daily key:
+    other = Enigma(EnigmaConfig.from_config_string('C II-IV-Gamma 24-8-20 A-B-C FH-TS-BE-UQ-KD-AL')).encode_string(plain[1])
+    solutions = code_breaking_depth.check_depth_range(messages[:1] + [(other, "WEATHER")],
+                                                      'C II-Gamma-IV 24-8-20 ?-?-? FH-TS-BE-UQ-KD-AL', 0, 1)
+    assert (len(solutions) == 0)
+
+    # start positions are limited by the config string:
+    solutions = code_breaking_depth.check_depth_range(messages, 'C II-Gamma-IV 24-8-20 ?-?-ABC FH-TS-BE-UQ-KD-AL', 0, 1)
+    assert (len(solutions) == 0)
+    with pytest.raises(ValueError):
+        code_breaking_depth.parse_messages([("ABC123", "ABC")])
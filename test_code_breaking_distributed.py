@@ -0,0 +1,186 @@
+import pytest
+import code_breaking_distributed
+
+def test_coordinator():
+
+    coordinator = code_breaking_distributed.Coordinator(chunk_size=100)
+    big = coordinator.submit("CMFSUPKNCBMUYEQVVDYKLRQZTPUFHSWWAKTUGXMPAMYAFITXIJKMH",
+                             "UNIVERSITY",
+                             'B Beta-I-III 23-2-10 ?-?-? VH-PT-ZG-BJ-EY-FS')
+    assert (coordinator.next_work_unit()[0] == big)
+    # a job submitted later gets its share right away, in proportion to its priority:
+    small = coordinator.submit("CMFSUPKNCBMUYEQVVDYKLRQZTPUFHSWWAKTUGXMPAMYAFITXIJKMH",
+                               "UNIVERSITY",
+                               'B Beta-I-III 23-2-10 ?-M-G VH-PT-ZG-BJ-EY-FS', priority=3)
+    units = [coordinator.next_work_unit() for i in range(8)]
+    assert ([unit[0] for unit in units[:3]] == [small, small, small])
+    assert ([unit[0] for unit in units].count(small) == 6)
+
+    # every unit is dispatched exactly once:
+    while True:
+        unit = coordinator.next_work_unit()
+        if unit is None:
+            break
+        units.append(unit)
+    small_units = sorted(unit[4:] for unit in units if unit[0] == small)
+    assert (small_units[0][0] == 0 and small_units[-1][1] == coordinator.jobs[small].total_count)
+    assert (all(a[1] == b[0] for a, b in zip(small_units, small_units[1:])))
+
+    for unit in units:
+        if unit[0] == small:
+            coordinator.work_done(small, unit[5] - unit[4], code_breaking_distributed.RankedResults())
+    status = coordinator.status()
+    assert (status[small]["finished"] and not status[big]["finished"])
+    assert (status[small]["done"] == status[small]["total"])
+
+def test_lost_clients():
+
+    coordinator = code_breaking_distributed.Coordinator(chunk_size=100)
+    job_id = coordinator.submit("CMFSUPKNCBMUYEQVVDYKLRQZTPUFHSWWAKTUGXMPAMYAFITXIJKMH",
+                                "UNIVERSITY",
+                                'B Beta-I-III 23-2-10 ?-M-G VH-PT-ZG-BJ-EY-FS')
+    job = coordinator.jobs[job_id]
+    estimator = code_breaking_distributed.ProgressEstimator()
+    def send(node, *messages):
+        code_breaking_distributed.handle_client_message(code_breaking_distributed.encode_frame(node, list(messages)),
+                                                        coordinator, estimator, [0])
+    taken = lambda unit: code_breaking_distributed.Taken(unit[0], unit[4], unit[5])
+    checked = lambda unit: code_breaking_distributed.Checked(unit[0], unit[4], unit[5])
+
+    # two clients on the same host, "pi:1" takes two units and checks one of them, "pi:2" takes the third one:
+    units = [coordinator.next_work_unit() for i in range(3)]
+    send("pi:1", code_breaking_distributed.Heartbeat(4), taken(units[0]), taken(units[1]))
+    send("pi:2", code_breaking_distributed.Heartbeat(2), taken(units[2]))
+    send("pi:1", code_breaking_distributed.Progress(job_id, 100), checked(units[0]))
+    assert (job.done_count == 100)
+
+    # "pi:1" stops sending heartbeats, only its unchecked unit is handed out again, first:
+    estimator.clients["pi:1"][2] -= code_breaking_distributed.CLIENT_TIMEOUT
+    code_breaking_distributed.requeue_lost_clients(coordinator, estimator)
+    assert ("pi:1" not in estimator.clients and "pi:2" in estimator.clients)
+    assert (coordinator.next_work_unit("pi:2") == units[1])
+    # a unit checked by both clients is counted once:
+    send("pi:1", code_breaking_distributed.Progress(job_id, 100), checked(units[1]))
+    send("pi:2", code_breaking_distributed.Progress(job_id, 100), checked(units[1]))
+    assert (job.done_count == 200)
+    # "pi:2" exits without checking its unit:
+    send("pi:2", code_breaking_distributed.Final())
+    assert (coordinator.next_work_unit("pi:3") == units[2])
+
+    # every setting is counted exactly once and the job finishes:
+    send("pi:3", checked(units[2]))
+    while not job.is_finished():
+        unit = coordinator.next_work_unit()
+        send("pi:3", taken(unit), checked(unit), checked(unit))
+    assert (coordinator.next_work_unit() is None and job.done_count == job.total_count)
+
+def test_protocol():
+
+    messages = [code_breaking_distributed.Candidate("job1", "B V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT",
+                                                    "YOUCANFOLLOWMYDOGONINSTAGRAMATTALESOFHOFFMANN",
+                                                    "PQUHRSLDYXNGOKMABEFZCWVJIT"),
+                code_breaking_distributed.Candidate("job2", "C Beta-Gamma-V 4-2-14 M-J-M KI-XN-FL", "NICEWORK", "", -3.5),
+                code_breaking_distributed.Progress("job1", 2 ** 40, 7),
+                code_breaking_distributed.Speed(8, 12345.5),
+                code_breaking_distributed.Heartbeat(8),
+                code_breaking_distributed.Final(),
+                code_breaking_distributed.Taken("job2", 2 ** 33, 2 ** 33 + 50),
+                code_breaking_distributed.Checked("job2", 2 ** 33, 2 ** 33 + 50)]
+    frame = code_breaking_distributed.encode_frame("raspberrypi", messages)
+    assert (code_breaking_distributed.decode_frame(frame) == ("raspberrypi", messages))
+    assert (code_breaking_distributed.candidate_to_result("raspberrypi", messages[0])
+            == ("raspberrypi", "B V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT",
+                "YOUCANFOLLOWMYDOGONINSTAGRAMATTALESOFHOFFMANN", "PQUHRSLDYXNGOKMABEFZCWVJIT"))
+    assert (code_breaking_distributed.candidate_to_result("raspberrypi", messages[1])
+            == ("raspberrypi", "C Beta-Gamma-V 4-2-14 M-J-M KI-XN-FL", "NICEWORK"))
+
+    # the server learns progress and candidates of a job from the frames:
+    coordinator = code_breaking_distributed.Coordinator(chunk_size=100)
+    job_id = coordinator.submit("CMFSUPKNCBMUYEQVVDYKLRQZTPUFHSWWAKTUGXMPAMYAFITXIJKMH",
+                                "UNIVERSITY",
+                                'B Beta-I-III 23-2-10 ?-M-G VH-PT-ZG-BJ-EY-FS')
+    estimator = code_breaking_distributed.ProgressEstimator()
+    queue_depth = [0]
+    unit = coordinator.next_work_unit()
+    frame = code_breaking_distributed.encode_frame("vm", [
+        code_breaking_distributed.Taken(job_id, unit[4], unit[5]),
+        code_breaking_distributed.Candidate(job_id, "B Beta-I-III 23-2-10 A-M-G VH-PT-ZG-BJ-EY-FS", "XQZVK", "", -6.0),
+        code_breaking_distributed.Candidate(job_id, "B Beta-I-III 23-2-10 I-M-G VH-PT-ZG-BJ-EY-FS", "IHOPE", "", -2.0),
+        code_breaking_distributed.Progress(job_id, 100, 3),
+        code_breaking_distributed.Checked(job_id, unit[4], unit[5]),
+        code_breaking_distributed.Speed(4, 1000.0)])
+    code_breaking_distributed.handle_client_message(frame, coordinator, estimator, queue_depth)
+    assert (coordinator.jobs[job_id].done_count == 100)
+    # the most plausible candidates first:
+    assert (coordinator.jobs[job_id].results == [("vm", "B Beta-I-III 23-2-10 I-M-G VH-PT-ZG-BJ-EY-FS", "IHOPE"),
+                                                 ("vm", "B Beta-I-III 23-2-10 A-M-G VH-PT-ZG-BJ-EY-FS", "XQZVK")])
+    assert (coordinator.status()[job_id]["discarded"] == 3)
+    assert (estimator.cpus() == 4)
+    assert (estimator.remaining_time(5000) == 5)
+
+    # messages of unknown jobs are dropped, malformed frames raise one of FRAME_ERRORS for the server to ignore:
+    code_breaking_distributed.handle_client_message(code_breaking_distributed.encode_frame("vm", [
+        code_breaking_distributed.Taken("gone", 0, 100),
+        code_breaking_distributed.Candidate("gone", "B Beta-I-III 23-2-10 A-M-G VH-PT-ZG-BJ-EY-FS", "XQZVK", ""),
+        code_breaking_distributed.Progress("gone", 100),
+        code_breaking_distributed.Checked("gone", 0, 100)]), coordinator, estimator, queue_depth)
+    assert (list(coordinator.jobs) == [job_id] and coordinator.jobs[job_id].done_count == 100)
+    for frame in [frame[:-3], b"\x03\x00\x01\xff\xff", b"", None]:
+        with pytest.raises(code_breaking_distributed.FRAME_ERRORS):
+            code_breaking_distributed.handle_client_message(frame, coordinator, estimator, queue_depth)
+
+def test_asyncio_transport():
+
+    import asyncio
+    import threading
+    import code_breaking_asyncio
+
+    ports = []
+    started = threading.Event()
+    def set_port(port):
+        ports.append(port)
+        started.set()
+
+    solutions = []
+    server = threading.Thread(target=lambda: solutions.append(code_breaking_asyncio.run_async_server(
+        "CMFSUPKNCBMUYEQVVDYKLRQZTPUFHSWWAKTUGXMPAMYAFITXIJKMH",
+        "UNIVERSITY",
+        'B Beta-I-III 23-2-10 ?-M-G VH-PT-ZG-BJ-EY-FS',
+        chunk_size=10, host='127.0.0.1', port=0, authkey=b'secret', started=set_port)))
+    server.start()
+    assert (started.wait(10))
+
+    async def connect(authkey):
+        reader, writer = await asyncio.open_connection('127.0.0.1', ports[0])
+        node, messages = code_breaking_asyncio.decode_frame(await code_breaking_asyncio.read_frame(reader))
+        digest = code_breaking_asyncio.authentication_digest(authkey, messages[0].nonce)
+        code_breaking_asyncio.write_frame(writer, "idle", [code_breaking_asyncio.Response(digest)])
+        await writer.drain()
+        return reader, writer
+
+    async def idle_clients():
+        # a client with a wrong key is disconnected, many idle clients do not
+        # hold up the server and learn when the work is done:
+        reader, writer = await connect(b'wrong')
+        assert (await code_breaking_asyncio.read_frame(reader) is None)
+        # as is a peer sending a malformed frame or announcing a huge one before authenticating:
+        for frame in [b"\x00\x00\x00\x05\x03\x00\x01\xff\xff",
+                      code_breaking_asyncio.FRAME_LENGTH.pack(code_breaking_asyncio.MAX_FRAME)]:
+            reader, writer = await asyncio.open_connection('127.0.0.1', ports[0])
+            await code_breaking_asyncio.read_frame(reader)
+            writer.write(frame)
+            await writer.drain()
+            assert (await asyncio.wait_for(code_breaking_asyncio.read_frame(reader), 10) is None)
+        connections = await asyncio.gather(*[connect(b'secret') for i in range(50)])
+        client = threading.Thread(target=code_breaking_asyncio.run_async_client,
+                                  args=('127.0.0.1', ports[0], b'secret', 100, 1))
+        client.start()
+        frames = await asyncio.gather(*[code_breaking_asyncio.read_frame(reader) for reader, writer in connections])
+        assert (all(code_breaking_asyncio.decode_frame(frame)[1] == [code_breaking_asyncio.Shutdown()]
+                    for frame in frames))
+        await asyncio.get_running_loop().run_in_executor(None, client.join)
+
+    asyncio.run(idle_clients())
+    server.join()
+    results, elapsed = solutions[0]
+    assert (any(result[2] == "IHOPEYOUAREENJOYINGTHEUNIVERSITYOFBATHEXPERIENCESOFAR" for result in results))
@@ -0,0 +1,30 @@
+import pytest
+import code_breaking_hillclimb
+
+def test_hill_climbing():
+
+    cipher = "ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY"
+    plain = "SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTINGWHERETHEYPUTTHEIRACORNS"
+    # the model of the pinned corpus, the same whatever the documentation says:
+    model = code_breaking_hillclimb.default_model()
+    assert (model.score(code_breaking_hillclimb.text_to_codes(plain))
+            > model.score(code_breaking_hillclimb.text_to_codes(cipher)))
+
+    # changes of the plugboard are rescored only where the text changes:
+    cnf = code_breaking_hillclimb.EnigmaConfig.from_config_string('C II-Gamma-IV 24-8-20 E-M-Y')
+    climber = code_breaking_hillclimb.PlugboardClimber(cnf, code_breaking_hillclimb.text_to_codes(cipher), model,
+                                                       ["FH", "TS", "BE"])
+    for lead in ["UQ", "KD", "AL", "BU", "FH"]:
+        plug = bytearray(climber.plug)
+        a, b = code_breaking_hillclimb.text_to_codes(lead)
+        for new, letters in code_breaking_hillclimb.plugboard_moves(plug, a, b, set()):
+            climber.apply(new, *climber.delta(new, letters))
+            assert (climber.score == pytest.approx(model.score(climber.plain), abs=1e-3))
+
+    # the plugboard of the rotor settings is found without a crib:
+    solutions = code_breaking_hillclimb.recover_plugboard(cipher, ['C II-Gamma-IV 24-8-20 E-M-Y'],
+                                                          restarts=8, processes=1)
+    assert (solutions[0][1:] == ('C II-Gamma-IV 24-8-20 E-M-Y AL-BE-DK-FH-QU-ST', plain))
+    # known leads are kept:
+    assert (code_breaking_hillclimb.hill_climb_plugboard(cipher, 'C II-Gamma-IV 24-8-20 E-M-Y AB')[1]
+            .split()[4].startswith('AB-'))
@@ -0,0 +1,21 @@
+import pytest
+import code_breaking_ioc
+
+def test_ioc():
+
+    cipher = "ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY"
+    plain = "SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTINGWHERETHEYPUTTHEIRACORNS"
+    assert (code_breaking_ioc.index_of_coincidence(code_breaking_ioc.text_to_codes("AABB")) == 1 / 3)
+    assert (code_breaking_ioc.codes_to_text(code_breaking_ioc.decrypt_codes(
+        code_breaking_ioc.EnigmaConfig.from_config_string('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL'),
+        code_breaking_ioc.text_to_codes(cipher))) == plain)
+
+    # the right rotor settings decrypt to the most language-like text even
+    # with an unknown lead:
+    best = code_breaking_ioc.score_ioc_range(cipher, 'C II-Gamma-IV 24-8-20 E-?-? FH-TS-BE-?Q-KD-AL', 0, 676, 3)
+    assert (len(best) == 3 and best[0][1] == 'C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-KD-AL')
+    solutions = code_breaking_ioc.decrypt_cipher_ioc(cipher, 'C II-Gamma-IV 24-8-20 E-?-Y FH-TS-?E-UQ-KD-AL',
+                                                     top=10, processes=1)[0]
+    # (a single lead hardly changes the letter frequency so it is only a guess)
+    assert (all(config.split()[3] == 'E-M-Y' for config, text in solutions))
+    assert (('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain) in solutions)
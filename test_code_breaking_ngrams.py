@@ -0,0 +1,46 @@
+import pickle
+import pytest
+import code_breaking_ngrams
+
+def test_ngram_tables(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("ENIGMA_CACHE_DIR", str(tmp_path / "cache"))
+    with open(code_breaking_ngrams.DEFAULT_CORPUS) as corpus:
+        text = corpus.read()
+    counted = code_breaking_ngrams.NgramModel.from_text(code_breaking_ngrams.corpus_letters(text))
+    codes = code_breaking_ngrams.text_to_codes("SQUIRRELSPLANTTHOUSANDSOFNEWTREES")
+
+    # float32 and int16 tables score like the counted model:
+    for typecode, tolerance in (('f', 1e-3), ('h', 0.1)):
+        path = str(tmp_path / "trigrams-{0}.bin".format(typecode))
+        code_breaking_ngrams.build_ngram_file(path, text, 3, typecode)
+        model = code_breaking_ngrams.open_ngram_model(path)
+        assert (model.n == 3 and isinstance(model.table, memoryview))
+        assert (model.score(codes) == pytest.approx(counted.score(codes), abs=tolerance))
+        # pickled by the path, workers map the same file:
+        assert (len(pickle.dumps(model)) < 1000)
+        assert (pickle.loads(pickle.dumps(model)).score(codes) == model.score(codes))
+
+    with pytest.raises(ValueError):
+        code_breaking_ngrams.open_ngram_model(code_breaking_ngrams.DEFAULT_CORPUS)
+    # the scores do not change with the documentation:
+    assert (code_breaking_ngrams.DEFAULT_CORPUS.endswith("english_corpus.txt"))
+
+    # the default model is built once in the cache directory:
+    code_breaking_ngrams.default_model.cache_clear()
+    try:
+        model = code_breaking_ngrams.default_model()
+        assert (model.path.startswith(str(tmp_path / "cache")))
+        # keyed by the pinned corpus, not by the documentation:
+        with open(code_breaking_ngrams.DEFAULT_CORPUS, 'rb') as corpus:
+            key = code_breaking_ngrams.hashlib.sha1(corpus.read()).hexdigest()[:12]
+        assert (model.path.endswith("ngrams-3f-{0}.bin".format(key)))
+        assert (model.score(codes) == pytest.approx(counted.score(codes), abs=1e-3))
+        # bigram and quadgram tables are built next to it:
+        for n in (2, 4):
+            model = code_breaking_ngrams.default_model(n)
+            assert (model.n == n and model.path.endswith("ngrams-{0}f-{1}.bin".format(n, key)))
+            counted = code_breaking_ngrams.NgramModel.from_text(code_breaking_ngrams.corpus_letters(text), n)
+            assert (model.score(codes) == pytest.approx(counted.score(codes), abs=1e-3))
+    finally:
+        code_breaking_ngrams.default_model.cache_clear()
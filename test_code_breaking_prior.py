@@ -0,0 +1,81 @@
+import pytest
+import code_breaking
+import code_breaking_prior
+import code_breaking_distributed
+import code_breaking_multiproc
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
+
+def test_settings_prior():
+
+    settings = '? ["II","IV","Beta","Gamma"]-["II","IV","Beta","Gamma"]-["II","IV","Beta","Gamma"] [2,4,8,20,24]-[2,4,8,20,24]-[2,4,8,20,24] E-M-Y FH-TS-BE-UQ-KD-AL'
+    prior = code_breaking_prior.SettingsPrior(weights={"reflector": {"C": 3}, "ring": {24: 2, 20: 2, 8: 2}},
+                                              history=["C II-Gamma-IV 1-1-1 A-A-A"],
+                                              common_orders=["II-Gamma-IV"])
+    with pytest.raises(ValueError):
+        code_breaking_prior.SettingsPrior(weights={"rings": {1: 2}})
+
+    # the same search space in a different order:
+    ordered = code_breaking_prior.prior_config_string(settings, prior)
+    assert (ordered.startswith('["C","A","B"] ["II","IV","Beta","Gamma"]-["Gamma","II","IV","Beta"]-["IV","II","Beta","Gamma"]'))
+    assert (set(map(str, code_breaking.all_possible_settings(ordered)))
+            == set(map(str, code_breaking.all_possible_settings(settings))))
+
+    # every setting at every crib position is handed out exactly once:
+    units = list(code_breaking_prior.prior_work_units(ordered, 3, prior, 50))
+    total = code_breaking.count_settings(ordered) * 3
+    ranges = sorted(units)
+    assert (ranges[0][0] == 0 and ranges[-1][1] == total)
+    assert (all(a[1] == b[0] for a, b in zip(ranges, ranges[1:])))
+    assert (list(code_breaking_prior.prior_work_units(ordered, 3, None, 50))
+            == [(start, min(start + 50, total)) for start in range(0, total, 50)])
+
+    # the likely setting comes early:
+    searched = 0
+    for start, stop in units:
+        if any(str(cnf) == 'C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL' and pos == 0
+               for cnf, pos in code_breaking.configs_in_range(ordered, [0, 1, 2], start, stop)):
+            break
+        searched += stop - start
+    assert (searched < total / 100)
+
+def test_best_first_search(monkeypatch):
+
+    cipher = "ABSKJAKKMRITTNYURBJFWQGRSGNNYJSDRYLAPQWIAGKJYEPCTAGDCTHLCDRZRFZHKNRSDLNPFPEBVESHPY"
+    plain = "SQUIRRELSPLANTTHOUSANDSOFNEWTREESEACHYEARBYMERELYFORGETTINGWHERETHEYPUTTHEIRACORNS"
+    settings = '? ["II","IV","Beta","Gamma"]-["II","IV","Beta","Gamma"]-["II","IV","Beta","Gamma"] [8,20,24]-[8,20,24]-[8,20,24] E-M-Y FH-TS-BE-UQ-KD-AL'
+    prior = code_breaking_prior.SettingsPrior(history=["C II-Gamma-IV 24-8-20 A-A-A"])
+
+    # stops at the first plausible solution:
+    solutions = code_breaking.decrypt_cipher(cipher, "THOUSANDS", settings, prior=prior,
+                                             stop_score=code_breaking_prior.PLAUSIBLE_SCORE)[0]
+    assert (solutions[0] == ('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain))
+
+    # a pool only has a few ranges queued, so the rest is not searched either:
+    checked = []
+    check = code_breaking_multiproc.check_enigma_config_range
+    def counting_check(encrypted_text, crib, config_string, start, stop, cores = None):
+        checked.append(stop - start)
+        return check(encrypted_text, crib, config_string, start, stop, cores)
+    monkeypatch.setattr(code_breaking_multiproc, "check_enigma_config_range", counting_check)
+    total = code_breaking.count_settings(settings) * len(code_breaking.possible_crib_positions(cipher, "THOUSANDS"))
+    with ThreadPool(2) as pool:
+        solutions = code_breaking_multiproc.search_in_pool(pool, cipher, "THOUSANDS", settings, 50, prior,
+                                                           code_breaking_prior.PLAUSIBLE_SCORE, cores={})
+        pool.close()
+        pool.join()
+    assert (solutions[0] == ('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain))
+    assert (sum(checked) < total / 100 + code_breaking_multiproc.UNITS_IN_FLIGHT * mp.cpu_count() * 50)
+
+    # a distributed job finishes early, without a stop score everything is searched:
+    coordinator = code_breaking_distributed.Coordinator(chunk_size=50)
+    job_id = coordinator.submit(cipher, "THOUSANDS", settings, prior=prior,
+                                stop_score=code_breaking_prior.PLAUSIBLE_SCORE)
+    job = coordinator.jobs[job_id]
+    while not job.is_finished():
+        unit = coordinator.next_work_unit()
+        coordinator.work_done(job_id, unit[5] - unit[4],
+                              code_breaking.check_enigma_config_range(*unit[1:]))
+    assert (job.stopped and job.done_count < job.total_count / 10)
+    assert (job.results[0] == ('C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL', plain))
+    assert (coordinator.next_work_unit() is None)
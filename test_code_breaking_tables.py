@@ -0,0 +1,33 @@
+import os
+import pickle
+import pytest
+import code_breaking_tables
+from enigma import *
+
+def test_rotor_state_tables(tmp_path, monkeypatch):
+
+    monkeypatch.setenv("ENIGMA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(code_breaking_tables, "_mapped_tables", {})
+    machine = Enigma(EnigmaConfig.from_config_string("C II-Gamma-IV 24-8-20 E-M-Y FH-TS-BE-UQ-KD-AL"))
+    perms = machine.position_permutations()
+
+    path = str(tmp_path / "rotors.bin")
+    code_breaking_tables.build_rotor_table(path, machine)
+    table = code_breaking_tables.open_rotor_table(path)
+    assert (len(table) == 26 ** 3 and list(table) == perms)
+    assert (table.column(7) == bytes(perm[7] for perm in perms))
+    # pickled by the path, workers map the same file:
+    assert (len(pickle.dumps(table)) < 1000)
+    assert (pickle.loads(pickle.dumps(table))[1000] == perms[1000])
+    with pytest.raises(ValueError):
+        code_breaking_tables.open_rotor_table(code_breaking_tables.__file__)
+
+    # generated once in the cache directory for the same wheels, whatever
+    # the ring settings, positions and plugboard:
+    table = code_breaking_tables.rotor_state_table(machine)
+    assert (table.path.startswith(str(tmp_path / "cache")) and table[5000] == perms[5000])
+    other = Enigma(EnigmaConfig.from_config_string("C II-Gamma-IV 1-2-3 A-B-C"))
+    assert (code_breaking_tables.rotor_state_table(other) is table)
+    assert (len(os.listdir(str(tmp_path / "cache"))) == 1)
+    assert (code_breaking_tables.rotor_table_key(Enigma(EnigmaConfig.from_config_string("B II-Gamma-IV 1-1-1 A-A-A")))
+            != code_breaking_tables.rotor_table_key(machine))
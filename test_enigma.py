@@ -1,4 +1,8 @@
 import pytest
+import io
+import json
+import array
+import concurrent.futures
 from enigma import *
 
 def test_plugboard():
@@ -97,3 +101,217 @@ def test_enigma():
                 assert (line_encrypted[:-1] == test_encrypted)
 
 
+
+def test_scrambler_permutations():
+
+    # permutations of the rotors are the same as encoding every letter
+    # with an unplugged Enigma, including the double stepping:
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    for config in ["B I-II-III 1-1-1 A-D-U", "A IV-V-Beta-I 18-24-3-5 E-Z-G-P", "C II-Gamma-IV 24-8-20 E-M-Y"]:
+        perms = Enigma(EnigmaConfig.from_config_string(config)).scrambler_permutations(700)
+        for step, perm in enumerate(perms):
+            enigma = Enigma(EnigmaConfig.from_config_string(config))
+            enigma.rotate_n_steps(step)
+            start = [rotor.position for rotor in enigma.rotors]
+            for letter in alphabet:
+                for rotor, position in zip(enigma.rotors, start):
+                    rotor.position = position
+                assert (alphabet[perm[alphabet.index(letter)]] == enigma.encode_character(letter))
+
+    # the reflector wires the contacts the rotors take a letter and its code to:
+    for config in ["B I-II-III 1-1-1 A-D-U", "A IV-V-Beta-I 18-24-3-5 E-Z-G-P"]:
+        enigma = Enigma(EnigmaConfig.from_config_string(config))
+        reflector = [alphabet.index(pin) for pin in enigma.rotors[-1].left_pins]
+        forward = enigma.forward_permutations(700)
+        perms = Enigma(EnigmaConfig.from_config_string(config)).scrambler_permutations(700)
+        for perm, rotors in zip(perms, forward):
+            assert (all(rotors[perm[letter]] == reflector[rotors[letter]] for letter in range(26)))
+
+    # the permutations at every rotor position do not depend on the ring settings:
+    cores = {}
+    for config in ["B I-II-III 1-1-1 A-D-U", "B I-II-III 5-17-9 A-D-U"]:
+        enigma = Enigma(EnigmaConfig.from_config_string(config))
+        table = enigma.position_permutations(cores)
+        positions = [[rotor.position % 26 for rotor in enigma.rotors[:-1]]]
+        positions += [list(p) for p in enigma._stepped_positions(700)]
+        perms = Enigma(EnigmaConfig.from_config_string(config)).scrambler_permutations(700)
+        for perm, position in zip(perms, positions[1:]):
+            assert (table[position[0] + 26 * position[1] + 676 * position[2]] == perm)
+
+def test_encode_stream(tmp_path, monkeypatch):
+
+    config = EnigmaConfig.from_config_string("A IV-V-Beta-I 18-24-3-5 E-Z-G-P PC-XZ-FM-QA-ST-NB-HY-OR-EV-IU")
+    plain = "Hello, World!\nThe quick brown fox jumps over the lazy dog.\n" * 300
+    letters = "".join(c for c in plain.upper() if c.isalpha())
+    expected = Enigma(config).encode_string(letters)
+    assert (Enigma(config).encode_bytes(plain.encode(), "drop") == expected.encode())
+    with pytest.raises(ValueError):
+        Enigma(config).encode_bytes(b"NO SPACES", "error")
+
+    # blocks (read or memory mapped) are encoded like the whole text, other
+    # characters are kept in place and do not step the rotors:
+    source = tmp_path / "plain.txt"
+    source.write_bytes(plain.encode())
+    for threshold in (1 << 30, 1000):
+        monkeypatch.setattr("enigma.MMAP_THRESHOLD", threshold)
+        with open(source, "rb") as src, open(tmp_path / "secret.txt", "wb") as dst:
+            count, seconds = encode_file(config, src, dst, block_size=100)
+        assert (count == len(plain))
+        encrypted = (tmp_path / "secret.txt").read_text()
+        assert ([len(line) for line in encrypted.split()] == [len(line) for line in plain.split()])
+        assert ("".join(c for c in encrypted if c.isalpha()) == expected)
+        assert (encrypted[5:7] == ", " and encrypted[12:14] == "!\n")
+
+def test_encode_into():
+
+    config = EnigmaConfig.from_config_string("B I-II-III 1-1-1 A-A-Z HL-MO")
+    plain = b"Hello, World! " * 100
+    expected = Enigma(config).encode_bytes(plain)
+    machine = Enigma(config)
+    assert ("".join(machine.encode_character(c) if c.isalpha() else c for c in plain.decode().upper())
+            == expected.decode())
+
+    # any buffer of bytes in, a preallocated buffer out:
+    for source in (plain, bytearray(plain), memoryview(plain), array.array("B", plain)):
+        target = bytearray(len(plain) + 10)
+        assert (Enigma(config).encode_into(source, target) == len(plain))
+        assert (target[:len(plain)] == expected and target[len(plain):] == bytes(10))
+    target = array.array("B", bytes(len(plain)))
+    machine = Enigma(config)
+    # the rotors keep stepping from one call to the next:
+    written = machine.encode_into(memoryview(plain)[:50], target)
+    written += machine.encode_into(memoryview(plain)[50:], memoryview(target)[written:])
+    assert (written == len(plain) and target.tobytes() == expected)
+    # in place:
+    inplace = bytearray(plain)
+    assert (Enigma(config).encode_into(inplace, inplace, "drop") == len(plain) - 400)
+    assert (inplace[:len(plain) - 400] == expected.translate(None, b" ,!"))
+
+    with pytest.raises(ValueError):
+        Enigma(config).encode_into(plain, bytearray(len(plain) - 1))
+    with pytest.raises(ValueError):
+        Enigma(config).encode_into(plain, bytes(len(plain)))
+    with pytest.raises(ValueError):
+        Enigma(config).encode_into(array.array("H", plain), bytearray(len(plain)))
+
+def test_encode_many():
+
+    configs = ["B I-II-III 1-1-1 A-A-Z HL-MO", "C II-IV-V 3-8-12 Q-E-V", "B I-II-III 5-9-14 X-B-C AZ",
+               "A IV-V-Beta-I 18-24-3-5 E-Z-G-P PC-XZ-FM-QA-ST-NB-HY-OR-EV-IU"]
+    messages = [(configs[i % 4] if i % 3 else EnigmaConfig.from_config_string(configs[i % 4]),
+                 "Message number {0}".format(i)) for i in range(50)]
+    expected = [Enigma(EnigmaConfig.from_config_string(str(config))).encode_bytes(text.encode()).decode()
+                for config, text in messages]
+
+    # in the order of the messages, with or without a pool:
+    assert (encode_many(messages, processes=1, chunk_size=7) == expected)
+    assert (encode_many(iter(messages), processes=2, chunk_size=7) == expected)
+    lines = io.StringIO()
+    assert (encode_many(messages, processes=2, chunk_size=7, output=lines) == len(messages))
+    assert ([json.loads(line) for line in lines.getvalue().splitlines()]
+            == [{"config": str(config), "text": text} for (config, plain), text in zip(messages, expected)])
+    with pytest.raises(ValueError):
+        encode_many(messages, processes=1, non_letters="error")
+
+def test_compiled_enigma():
+
+    plain = "THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG" * 30
+    for config in ("B I-II-III 1-1-1 A-A-Z HL-MO", "B I-II-III 1-2-3 A-E-U",
+                   "A IV-V-Beta-I 18-24-3-5 E-Z-G-P PC-XZ-FM-QA-ST-NB-HY-OR-EV-IU",
+                   "C Beta-II-IV 7-11-15 Q-E-V"):
+        cnf = EnigmaConfig.from_config_string(config)
+        machine = CompiledEnigma(cnf)
+        reference = Enigma(cnf)
+        expected = "".join(reference.encode_character(c) for c in plain)
+        assert (machine.encode_string(plain) == expected)
+        # seek() steps like rotate_n_steps():
+        for offset in list(range(0, 60)) + [500, 676, 700, 17000]:
+            reference = Enigma(cnf)
+            reference.rotate_n_steps(offset)
+            machine.seek(offset)
+            assert (machine.positions == [r.get_position() for r in reference.rotors[:-1]])
+        # branches of the same state are independent:
+        machine.seek(100)
+        branch = machine.clone()
+        assert (branch.encode_string(plain[100:200]) == expected[100:200])
+        assert (machine.encode_string(plain[100:300]) == expected[100:300])
+        assert (branch.encode_string(plain[200:300]) == expected[200:300])
+        machine.reset()
+        assert (machine.encode_string(plain[:50]) == expected[:50])
+
+    # resetting the rotors keeps the ring settings:
+    machine = Enigma(EnigmaConfig.from_config_string("B I-II-III 1-2-3 A-E-U"))
+    first = machine.encode_string("HELLOWORLD")
+    machine.reset_rotors()
+    assert (machine.encode_string("HELLOWORLD") == first)
+    with pytest.raises(ValueError):
+        CompiledEnigma(EnigmaConfig.from_config_string("B I-II-III 1-1-1 A-A-A AB-BC"))
+
+def test_encode_threads():
+
+    machine = CompiledEnigma(EnigmaConfig.from_config_string("A IV-V-Beta-I 18-24-3-5 E-Z-G-P PC-XZ-FM-QA-ST-NB-HY-OR-EV-IU"))
+    plain = "THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG" * 20
+    jobs = [(plain[offset:offset + 50], offset) for offset in range(0, 650, 13)] * 4
+    expected = [encode(machine, text, offset) for text, offset in jobs]
+    assert (machine.positions == list(machine.start))
+    assert (expected[1] == machine.clone().encode_string(plain[:63])[13:])
+    # one machine shared by many threads (with fresh tables filled concurrently):
+    for shared in (machine, CompiledEnigma(machine.config)):
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            assert (list(pool.map(lambda job: encode(shared, *job), jobs)) == expected)
+        assert (shared.positions == list(shared.start))
+    assert (encode(machine, plain.encode(), 700) == encode(machine, plain, 700).encode())
+
+def test_plugboard_table():
+
+    plugboard = Plugboard(["SZ", "GT", PlugLead("DV")])
+    assert (bytes(plugboard.table[i] for i in plugboard.table) == bytes(range(26)))
+    assert (plugboard.leads() == ["DV", "GT", "SZ"])
+    # hypotheses are edits of the table:
+    plugboard.remove("Z")
+    assert (plugboard.encode("S") == "S" and plugboard.encode("Z") == "Z" and plugboard.encode(" ") == " ")
+    plugboard.add(PlugLead("ZA"))
+    assert (plugboard.leads() == ["AZ", "DV", "GT"])
+    with pytest.raises(ValueError):
+        Plugboard(["AB", "BC"])
+    assert (plugboard.compose(b"\x00\x01\x02\x03") == b"\x19\x01\x02\x15")
+    assert (b"\x00\x03".translate(plugboard.translation()) == b"\x19\x15")
+
+    # a compiled machine takes another plugboard without compiling the rotors again:
+    machine = CompiledEnigma(EnigmaConfig.from_config_string("B I-II-III 1-1-1 A-A-Z"))
+    machine.seek(10)
+    plugged = machine.with_plugboard(Plugboard(["HL", "MO"]))
+    reference = CompiledEnigma(EnigmaConfig.from_config_string("B I-II-III 1-1-1 A-A-Z HL-MO"))
+    reference.seek(10)
+    assert (plugged.encode_string("HELLOWORLD") == reference.encode_string("HELLOWORLD"))
+    assert (str(plugged) == "B I-II-III 1-1-1 A-A-Z HL-MO")
+    assert (plugged.rotor_in is machine.rotor_in)
+
+def test_enigma_changed_after_construction():
+
+    # the fast path follows edits of the plugboard and the wiring of a machine:
+    machine = Enigma(EnigmaConfig.from_config_string("B I-II-III 1-1-1 A-A-Z"))
+    machine.plugboard.add(PlugLead("HL"))
+    assert (machine.encode_string("HELLOWORLD") == "SFPTMQKNVR")
+    machine.plugboard.remove("H")
+    machine.reset_rotors()
+    assert (machine.encode_string("HELLOWORLD") == "ZFEBMQKNGR")
+
+    cores = {}
+    machine = Enigma(EnigmaConfig.from_config_string("B V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT"))
+    machine.share_tables(cores)
+    machine.encode_string("HWREISX")
+    machine.reset_rotors()
+    machine.rotors[-1].left_pins = 'PQUHRSLDYXNGOKMABEFZCWVJIT'
+    assert (machine.encode_string('HWREISXLGTTBYVXRCWWJAKZDTVZWKBDJPVQYNEQIOTIFX')
+            == 'YOUCANFOLLOWMYDOGONINSTAGRAMATTALESOFHOFFMANN')
+    # the tables shared with other machines keep the original wiring:
+    reference = CompiledEnigma(EnigmaConfig.from_config_string("B V-II-IV 6-18-7 A-J-L UG-IE-PO-NX-WT"))
+    assert (CompiledEnigma(reference.config, cores).encode_string("HWREISX") == reference.encode_string("HWREISX"))
+
+    # scrambler and forward permutations can share the cores:
+    config = EnigmaConfig.from_config_string("B I-II-III 1-1-1 A-D-U")
+    shared = {}
+    Enigma(config).scrambler_permutations(30, shared)
+    assert (Enigma(config).forward_permutations(30, shared) == Enigma(config).forward_permutations(30))
+    assert (Enigma(config).scrambler_permutations(30, shared) == Enigma(config).scrambler_permutations(30))
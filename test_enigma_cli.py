@@ -0,0 +1,43 @@
+import os
+import sys
+import subprocess
+
+# loaded only by the commands breaking codes, not to encrypt or for help:
+BREAKING_MODULES = ("code_breaking", "multiprocessing", "socket", "asyncio")
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+def imports(*args, stdin = b"", nested = False):
+    """Return {module: cumulative seconds} of the top level (or all) imports
+    of a python run, the interpreter start up left out"""
+
+    def loaded_modules(args):
+        stderr = subprocess.run([sys.executable, "-X", "importtime"] + list(args), input=stdin, cwd=here,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True).stderr.decode()
+        found = {}
+        for line in stderr.splitlines():
+            if line.startswith("import time:") and not line.endswith("package"):
+                self_time, cumulative, name = line[len("import time:"):].split("|")
+                if nested or not name.startswith("  "):
+                    found[name.strip()] = int(cumulative) / 1e6
+        return found
+
+    startup = loaded_modules(["-c", "pass"])
+    return {name: seconds for name, seconds in loaded_modules(args).items() if name not in startup}
+
+def test_encrypt_startup():
+
+    loaded = imports("enigma-cli.py", "encrypt", "--config", "B I-II-III 1-1-1 A-A-Z", stdin=b"HELLO", nested=True)
+    assert ("enigma" in loaded)
+    assert (not [name for name in loaded if name.startswith(BREAKING_MODULES)])
+    loaded = imports("enigma-cli.py", "--help", nested=True)
+    assert (not [name for name in loaded if name.startswith(BREAKING_MODULES)])
+    # modules loaded are seen, the checks above are not vacuous:
+    loaded = imports("-c", "import code_breaking")
+    assert ("code_breaking" in loaded)
+
+def test_worker_imports():
+
+    # processes of a pool load the code breakers, not the CLI or the distributed code:
+    loaded = imports("-c", "import code_breaking_multiproc, code_breaking_depth", nested=True)
+    assert (not [name for name in loaded if name in ("code_breaking_distributed", "code_breaking_asyncio", "argparse")])